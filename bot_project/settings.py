@@ -119,4 +119,138 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Telegram Bot settings - используем ваше название переменной
 BOT_TOKEN = os.getenv('BOT_TOKEN', '')
-WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
\ No newline at end of file
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+TELEGRAM_API_BASE = os.getenv('TELEGRAM_API_BASE', 'https://api.telegram.org')
+
+# Обработка апдейтов вне запроса вебхука
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '8'))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+# Отложенные сообщения: потоки отправки (сообщения одного чата - в одном потоке, по порядку)
+# и сколько наступивших отправок может ждать своей очереди
+OUTBOUND_WORKERS = int(os.getenv('OUTBOUND_WORKERS', '4'))
+OUTBOUND_QUEUE_SIZE = int(os.getenv('OUTBOUND_QUEUE_SIZE', '10000'))
+
+# Проверка подписки на каналы (все каналы опрашиваются параллельно)
+SUBSCRIPTION_CHECK_WORKERS = int(os.getenv('SUBSCRIPTION_CHECK_WORKERS', '16'))
+SUBSCRIPTION_CHECK_DEADLINE = float(os.getenv('SUBSCRIPTION_CHECK_DEADLINE', '5'))
+SUBSCRIPTION_CHECK_FAIL_FAST = os.getenv('SUBSCRIPTION_CHECK_FAIL_FAST', 'False').lower() == 'true'
+
+# Кэш результатов getChatMember (TTL в секундах). SUBSCRIPTION_CACHE_ALIAS -
+# alias из CACHES, чтобы кэш был общим для всех воркеров; пусто - кэш в памяти процесса
+SUBSCRIPTION_CACHE_MAX_ENTRIES = int(os.getenv('SUBSCRIPTION_CACHE_MAX_ENTRIES', '100000'))
+SUBSCRIPTION_CACHE_POSITIVE_TTL = int(os.getenv('SUBSCRIPTION_CACHE_POSITIVE_TTL', '300'))
+SUBSCRIPTION_CACHE_NEGATIVE_TTL = int(os.getenv('SUBSCRIPTION_CACHE_NEGATIVE_TTL', '10'))
+SUBSCRIPTION_CACHE_ERROR_TTL = int(os.getenv('SUBSCRIPTION_CACHE_ERROR_TTL', '3'))
+SUBSCRIPTION_CACHE_ALIAS = os.getenv('SUBSCRIPTION_CACHE_ALIAS') or None
+
+# Сколько секунд процесс может использовать закэшированное активное мероприятие
+# (в своем процессе кэш сбрасывается сразу при изменении мероприятия)
+ACTIVE_CAMPAIGN_CACHE_TTL = float(os.getenv('ACTIVE_CAMPAIGN_CACHE_TTL', '10'))
+
+# Кэш состояний регистрации участников с отложенной записью в БД.
+# REGISTRATION_STATE_DURABILITY: sync - писать сразу, batched - пачками в фоне,
+# completed - пачками, но завершение регистрации сразу. batched/completed и
+# локальный кэш работают только с общим кэшем (REGISTRATION_STATE_CACHE_ALIAS)
+# или при REGISTRATION_STATE_SINGLE_PROCESS=True (один процесс), иначе - sync.
+# По умолчанию (sync без кэша) на каждый апдейт - одно чтение и одна запись в БД;
+# копии, записанные не по порядку, отсекает версия состояния Participant.state_version
+REGISTRATION_STATE_DURABILITY = os.getenv('REGISTRATION_STATE_DURABILITY', 'sync')
+REGISTRATION_STATE_MAX_ENTRIES = int(os.getenv('REGISTRATION_STATE_MAX_ENTRIES', '50000'))
+REGISTRATION_STATE_TTL = int(os.getenv('REGISTRATION_STATE_TTL', '300'))
+REGISTRATION_STATE_FLUSH_INTERVAL = float(os.getenv('REGISTRATION_STATE_FLUSH_INTERVAL', '0.5'))
+REGISTRATION_STATE_BATCH_SIZE = int(os.getenv('REGISTRATION_STATE_BATCH_SIZE', '500'))
+REGISTRATION_STATE_CACHE_ALIAS = os.getenv('REGISTRATION_STATE_CACHE_ALIAS') or None
+REGISTRATION_STATE_SINGLE_PROCESS = os.getenv('REGISTRATION_STATE_SINGLE_PROCESS', 'False').lower() == 'true'
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду на чат.
+# BOT_API_MAX_WAIT - сколько поток может ждать лимит, дальше вызов уходит в очередь повторов
+BOT_API_GLOBAL_RATE = float(os.getenv('BOT_API_GLOBAL_RATE', '30'))
+BOT_API_CHAT_RATE = float(os.getenv('BOT_API_CHAT_RATE', '1'))
+BOT_API_MAX_WAIT = float(os.getenv('BOT_API_MAX_WAIT', '5'))
+BOT_API_MAX_RETRIES = int(os.getenv('BOT_API_MAX_RETRIES', '3'))
+# Лимит бота должен быть общим для всех процессов (воркеры gunicorn, run_bot_polling,
+# run_broadcasts). BOT_API_RATE_CACHE_ALIAS - alias из CACHES с атомарным incr (Redis,
+# Memcached): лимит и пауза после 429 хранятся там. Без него лимит у каждого процесса
+# свой, и BOT_API_GLOBAL_RATE делится на BOT_API_PROCESSES - укажите, сколько процессов
+# отправляют сообщения от бота, иначе вместе они превысят лимит Telegram
+BOT_API_RATE_CACHE_ALIAS = os.getenv('BOT_API_RATE_CACHE_ALIAS') or None
+BOT_API_PROCESSES = int(os.getenv('BOT_API_PROCESSES', '1'))
+
+# Логирование. LOG_FORMAT: text или json (одна запись - одна строка JSON).
+# Уровни отдельных модулей: LOG_LEVELS="campaigns.telegram_handlers=DEBUG,campaigns.bot_api=WARNING"
+# LOG_UPDATE_SAMPLE_RATE - доля апдейтов, которые целиком пишутся в лог на уровне DEBUG
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_LEVELS = dict(
+    item.strip().split('=', 1) for item in os.getenv('LOG_LEVELS', '').split(',') if '=' in item
+)
+LOG_UPDATE_SAMPLE_RATE = float(os.getenv('LOG_UPDATE_SAMPLE_RATE', '0.01'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'redact_pii': {'()': 'campaigns.logging_utils.PiiRedactingFilter'},
+    },
+    'formatters': {
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s'},
+        'json': {'()': 'campaigns.logging_utils.JsonFormatter'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': LOG_FORMAT,
+            'filters': ['redact_pii'],
+        },
+    },
+    'loggers': {
+        'campaigns': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+        **{name: {'level': level.upper()} for name, level in LOG_LEVELS.items()},
+    },
+}
+
+# Защита от повторной доставки апдейтов: окно последних update_id на бота.
+# UPDATE_DEDUP_DB=True - хранить update_id еще и в БД (общая защита для всех воркеров)
+UPDATE_DEDUP_WINDOW = int(os.getenv('UPDATE_DEDUP_WINDOW', '10000'))
+UPDATE_DEDUP_DB = os.getenv('UPDATE_DEDUP_DB', 'False').lower() == 'true'
+
+# Привязка пользователей к мероприятию по deep link (/start <slug>): кэш в памяти процесса
+# на CAMPAIGN_BINDING_TTL секунд (столько другие воркеры могут не видеть новую привязку)
+# или общий кэш Django CAMPAIGN_BINDING_CACHE_ALIAS - тогда TTL можно увеличить
+CAMPAIGN_BINDING_MAX_ENTRIES = int(os.getenv('CAMPAIGN_BINDING_MAX_ENTRIES', '100000'))
+CAMPAIGN_BINDING_TTL = int(os.getenv('CAMPAIGN_BINDING_TTL', '5'))
+CAMPAIGN_BINDING_CACHE_ALIAS = os.getenv('CAMPAIGN_BINDING_CACHE_ALIAS') or None
+# Username бота (без @) - для ссылок вида https://t.me/<bot>?start=<slug> в админке
+BOT_USERNAME = os.getenv('BOT_USERNAME', '')
+
+# Фоновые выгрузки участников: потоков на процесс и через сколько секунд
+# без прогресса выгрузка считается зависшей. В файлах персональные данные,
+# поэтому EXPORT_ROOT - закрытая папка вне MEDIA_ROOT, отдаются они только
+# через админку (/admin/campaigns/exportjob/<id>/download/)
+EXPORT_ROOT = os.getenv('EXPORT_ROOT', str(BASE_DIR / 'private' / 'exports'))
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', '2'))
+EXPORT_STALE_SECONDS = int(os.getenv('EXPORT_STALE_SECONDS', '300'))
+
+# Списки админки: начиная с этого числа строк вместо точного COUNT(*) берется оценка PostgreSQL
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', '100000'))
+
+# Метрики /campaigns/metrics/: токен для Prometheus (Authorization: Bearer <токен>),
+# без токена страница доступна только сотрудникам. METRICS_DIR - общий каталог, куда
+# каждый воркер gunicorn сохраняет свои значения (очищать при деплое)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# Запись входящих апдейтов вебхука в сжатые NDJSON-сегменты для команды replay_updates.
+# Пустой UPDATE_CAPTURE_DIR - запись выключена
+UPDATE_CAPTURE_DIR = os.getenv('UPDATE_CAPTURE_DIR', '')
+UPDATE_CAPTURE_SEGMENT_MB = int(os.getenv('UPDATE_CAPTURE_SEGMENT_MB', '64'))
+UPDATE_CAPTURE_SEGMENT_SECONDS = int(os.getenv('UPDATE_CAPTURE_SEGMENT_SECONDS', '3600'))
+UPDATE_CAPTURE_QUEUE_SIZE = int(os.getenv('UPDATE_CAPTURE_QUEUE_SIZE', '10000'))
+
+# Рассылки участникам (команда run_broadcasts): сообщений в секунду на бота.
+# Это доля BOT_API_GLOBAL_RATE: пока у бота идет рассылка, ответам бота остается
+# BOT_API_GLOBAL_RATE - BROADCAST_RATE, без рассылки - весь лимит. Идет ли рассылка,
+# каждый процесс проверяет в БД раз в BROADCAST_STATUS_TTL секунд
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '10'))
+BROADCAST_STATUS_TTL = float(os.getenv('BROADCAST_STATUS_TTL', '5'))
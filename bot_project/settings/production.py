@@ -23,6 +23,8 @@ DATABASES = {
 # Static files
 STATIC_ROOT = '/var/www/telegram-bot/static/'
 MEDIA_ROOT = '/var/www/telegram-bot/media/'
+# Выгрузки участников - не под MEDIA_ROOT, веб-сервер их не раздает
+EXPORT_ROOT = '/var/www/telegram-bot/private/exports/'
 
 # Security
 SECURE_BROWSER_XSS_FILTER = True
@@ -1,29 +1,37 @@
 from django.contrib import admin
-from django.http import HttpResponseRedirect
+from django.db import transaction
+from django.http import FileResponse, HttpResponseRedirect
+from django.middleware.csrf import get_token
 from django.urls import path
 from django.utils.html import format_html
 from django.contrib import messages
-import sys
-import subprocess
+import os
 import time
-from .models import Campaign, Participant
+from .campaign_stats import apply_deltas, funnel, participant_deltas, remove_participants
+from .export_jobs import export_jobs
+from .models import Bot, Broadcast, BroadcastDelivery, Campaign, CampaignStats, ExportJob, Participant
+from .paginators import EstimatedCountPaginator
+from .raffle import RaffleError, run_raffle
+from .registration_state import registration_store
 
 # Глобальная переменная для хранения запущенных ботов
 running_bots = {}
 
 @admin.register(Campaign)
 class CampaignAdmin(admin.ModelAdmin):
-    list_display = ['name', 'status', 'bot_status', 'participants_count', 'winners_count', 'export_excel_button', 'bot_actions']
+    list_display = ['name', 'status', 'bot_status', 'participants_count', 'registration_funnel', 'winners_count', 'deep_link_url', 'export_excel_button', 'bot_actions']
     list_editable = ['status']
     list_filter = ['status', 'bot_is_running']
+    list_select_related = ['bot', 'stats']
     prepopulated_fields = {'slug': ('name',)}
+    readonly_fields = ['raffle_seed', 'registration_funnel']
     
     fieldsets = (
         ('Основная информация', {
             'fields': ('name', 'slug', 'status')
         }),
         ('Настройки Telegram', {
-            'fields': ('channel_usernames',)
+            'fields': ('bot', 'channel_usernames', 'bonus_channel_usernames')
         }),
         ('Тексты для бота', {
             'fields': (
@@ -41,7 +49,10 @@ class CampaignAdmin(admin.ModelAdmin):
             )
         }),
         ('Настройки розыгрыша', {
-            'fields': ('winners_count',)
+            'fields': ('winners_count', 'prize_tiers', 'raffle_seed')
+        }),
+        ('Воронка регистрации', {
+            'fields': ('registration_funnel',)
         }),
         ('Управление ботом', {
             'fields': ('bot_is_running',),
@@ -62,9 +73,26 @@ class CampaignAdmin(admin.ModelAdmin):
         """Разрешаем создание новых мероприятий"""
         return True
 
+    def campaign_stats(self, obj):
+        """Счетчики мероприятия (приходят вместе со списком через list_select_related)"""
+        try:
+            return obj.stats
+        except CampaignStats.DoesNotExist:
+            return CampaignStats(campaign=obj)
+
     def participants_count(self, obj):
-        return obj.participants.count()
+        return self.campaign_stats(obj).participants
     participants_count.short_description = 'Участников'
+    participants_count.admin_order_field = 'stats__participants'
+
+    def registration_funnel(self, obj):
+        if obj.pk is None:
+            return '-'
+        stats = self.campaign_stats(obj)
+        stages = dict(Participant._meta.get_field('registration_stage').choices)
+        steps = [f"{stages[stage]}: {reached}" for stage, reached in funnel(stats)]
+        return format_html('{}<br><small>Подписаны: {}</small>', ' → '.join(steps), stats.subscribed)
+    registration_funnel.short_description = 'Воронка регистрации'
     
     def bot_status(self, obj):
         if obj.bot_is_running:
@@ -77,10 +105,18 @@ class CampaignAdmin(admin.ModelAdmin):
         return len(obj.winners) if obj.winners else 0
     winners_count.short_description = 'Победителей'
     
+    def deep_link_url(self, obj):
+        link = obj.deep_link()
+        return format_html('<a href="{}" target="_blank">{}</a>', link, link) if link else '-'
+    deep_link_url.short_description = 'Ссылка на бота'
+
     def export_excel_button(self, obj):
         return format_html(
             '<a class="button" href="{}" style="background-color: #17a2b8; color: white; padding: 5px 10px; text-decoration: none; border-radius: 3px; font-size: 12px;">📊 Excel</a>',
             f'/admin/campaigns/campaign/{obj.id}/download_excel/'
+        ) + format_html(
+            ' <a class="button" href="{}" style="background-color: #17a2b8; color: white; padding: 5px 10px; text-decoration: none; border-radius: 3px; font-size: 12px;">📄 CSV</a>',
+            f'/admin/campaigns/campaign/{obj.id}/download_excel/?format=csv&gzip=1'
         )
     export_excel_button.short_description = 'Экспорт'
     
@@ -122,12 +158,12 @@ class CampaignAdmin(admin.ModelAdmin):
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
-            path('<path:object_id>/start_bot/', self.start_bot, name='start_bot'),
-            path('<path:object_id>/stop_bot/', self.stop_bot, name='stop_bot'),
-            path('<path:object_id>/restart_bot/', self.restart_bot, name='restart_bot'),
-            path('<path:object_id>/raffle/', self.start_raffle, name='raffle'),
-            path('<path:object_id>/show_winners/', self.show_winners, name='show_winners'),
-            path('<path:object_id>/download_excel/', self.export_excel, name='export_excel'),
+            path('<path:object_id>/start_bot/', self.admin_site.admin_view(self.start_bot), name='start_bot'),
+            path('<path:object_id>/stop_bot/', self.admin_site.admin_view(self.stop_bot), name='stop_bot'),
+            path('<path:object_id>/restart_bot/', self.admin_site.admin_view(self.restart_bot), name='restart_bot'),
+            path('<path:object_id>/raffle/', self.admin_site.admin_view(self.start_raffle), name='raffle'),
+            path('<path:object_id>/show_winners/', self.admin_site.admin_view(self.show_winners), name='show_winners'),
+            path('<path:object_id>/download_excel/', self.admin_site.admin_view(self.export_excel), name='export_excel'),
         ]
         return custom_urls + urls
     
@@ -143,17 +179,8 @@ class CampaignAdmin(admin.ModelAdmin):
                 )
                 return HttpResponseRedirect('/admin/campaigns/campaign/')
             
-            # ПРОВЕРКА: Уже есть запущенный бот?
-            active_bots = Campaign.objects.filter(bot_is_running=True).exclude(id=campaign.id)
-            if active_bots.exists():
-                active_campaign = active_bots.first()
-                messages.error(request, 
-                    f'Невозможно запустить бота! '
-                    f'Уже запущен бот для мероприятия "{active_campaign.name}". '
-                    f'Сначала остановите его, затем запускайте новый.'
-                )
-                return HttpResponseRedirect('/admin/campaigns/campaign/')
-            
+            # Несколько мероприятий могут идти одновременно: пользователи
+            # попадают в нужное по deep link (/start <slug>)
             if campaign.bot_is_running:
                 messages.warning(request, f'Бот для мероприятия "{campaign.name}" уже запущен!')
             else:
@@ -162,6 +189,8 @@ class CampaignAdmin(admin.ModelAdmin):
                 
                 if success:
                     messages.success(request, f'Бот для мероприятия "{campaign.name}" успешно запущен (вебхук)!')
+                    if campaign.deep_link():
+                        messages.info(request, f'Ссылка для участников: {campaign.deep_link()}')
                 else:
                     messages.error(request, f'Ошибка при запуске бота через вебхук!')
                     
@@ -228,52 +257,46 @@ class CampaignAdmin(admin.ModelAdmin):
                 messages.error(request, f'Розыгрыш уже проводился для мероприятия "{campaign.name}"!')
                 return HttpResponseRedirect('/admin/campaigns/campaign/')
             
-            # 🔴 ПОДТВЕРЖДЕНИЕ РОЗЫГРЫША
-            if 'confirm' not in request.GET:
-                participants_count = campaign.participants.filter(is_subscribed=True).count()
+            # 🔴 ПОДТВЕРЖДЕНИЕ РОЗЫГРЫША: розыгрыш проводится только POST-запросом из формы
+            if request.method != 'POST' or 'confirm' not in request.POST:
+                participants_count = self.campaign_stats(campaign).subscribed
                 confirm_message = (
                     f'Вы уверены что хотите провести розыгрыш для мероприятия "<strong>{campaign.name}</strong>"?\n\n'
                     f'📊 Участников: {participants_count}\n'
-                    f'🏆 Будет выбрано победителей: {campaign.winners_count}\n\n'
+                    f'🏆 Будет выбрано победителей: {sum(count for _, count in campaign.get_prize_tiers())}\n\n'
                     f'<strong>Это действие нельзя отменить!</strong>'
                 )
                 messages.warning(request, format_html(confirm_message))
                 
                 # Добавляем кнопки подтверждения
-                confirm_url = f'/admin/campaigns/campaign/{object_id}/raffle/?confirm=true'
+                confirm_url = f'/admin/campaigns/campaign/{object_id}/raffle/'
                 cancel_url = '/admin/campaigns/campaign/'
                 
                 messages.info(request, format_html(
-                    f'<a class="button" href="{confirm_url}" style="background-color: #28a745; color: white; padding: 8px 15px; text-decoration: none; border-radius: 5px; margin: 5px;">✅ Да, провести розыгрыш</a>'
-                    f'<a class="button" href="{cancel_url}" style="background-color: #dc3545; color: white; padding: 8px 15px; text-decoration: none; border-radius: 5px; margin: 5px;">❌ Отмена</a>'
+                    '<form method="post" action="{}" style="display: inline;">'
+                    '<input type="hidden" name="csrfmiddlewaretoken" value="{}">'
+                    '<button type="submit" name="confirm" value="true" class="button" style="background-color: #28a745; color: white; padding: 8px 15px; border: none; border-radius: 5px; margin: 5px; cursor: pointer;">✅ Да, провести розыгрыш</button>'
+                    '</form>'
+                    '<a class="button" href="{}" style="background-color: #dc3545; color: white; padding: 8px 15px; text-decoration: none; border-radius: 5px; margin: 5px;">❌ Отмена</a>',
+                    confirm_url, get_token(request), cancel_url
                 ))
                 return HttpResponseRedirect('/admin/campaigns/campaign/')
             
-            # Проверяем можно ли проводить розыгрыш
-            if campaign.status not in ['active', 'finished']:
-                messages.error(request, 
-                    f'Розыгрыш можно проводить только для активных или завершенных мероприятий! '
-                    f'Текущий статус: "{campaign.get_status_display()}"'
-                )
+            # Розыгрыш в этом же процессе: проверки статуса и повторного
+            # розыгрыша выполняются под блокировкой мероприятия
+            try:
+                result = run_raffle(campaign.id)
+            except RaffleError as e:
+                messages.error(request, str(e))
                 return HttpResponseRedirect('/admin/campaigns/campaign/')
-            
-            # Запускаем розыгрыш
-            result = subprocess.run([
-                sys.executable, 'manage.py', 'raffle', campaign.slug, '--winners', str(campaign.winners_count)
-            ], capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                messages.success(request, f'Розыгрыш для мероприятия "{campaign.name}" проведен успешно!')
-                # Обновляем объект чтобы получить актуальные данные
-                campaign.refresh_from_db()
-                if campaign.winners:
-                    # 🔴 ПОКАЗЫВАЕМ ПОБЕДИТЕЛЕЙ СРАЗУ ПОСЛЕ РОЗЫГРЫША
-                    winners_text = "🏆 Победители:\n\n"
-                    for winner in campaign.winners:
-                        winners_text += f"{winner['place']}. {winner['name']} - {winner['phone']}\n"
-                    messages.info(request, winners_text)
-            else:
-                messages.error(request, f'Ошибка при проведении розыгрыша: {result.stderr}')
+
+            messages.success(request, f'Розыгрыш для мероприятия "{campaign.name}" проведен успешно!')
+            # 🔴 ПОКАЗЫВАЕМ ПОБЕДИТЕЛЕЙ СРАЗУ ПОСЛЕ РОЗЫГРЫША
+            winners_text = "🏆 Победители:\n\n"
+            for winner in result.winners:
+                tier = f" ({winner['tier']})" if winner.get('tier') else ''
+                winners_text += f"{winner['place']}.{tier} {winner['name']} - {winner['phone']}\n"
+            messages.info(request, winners_text)
             
         except Campaign.DoesNotExist:
             messages.error(request, 'Мероприятие не найдено!')
@@ -296,6 +319,7 @@ class CampaignAdmin(admin.ModelAdmin):
                             <thead>
                                 <tr style="background: #6f42c1; color: white;">
                                     <th style="padding: 10px; text-align: left; width: 60px;">Место</th>
+                                    <th style="padding: 10px; text-align: left;">Приз</th>
                                     <th style="padding: 10px; text-align: left;">Имя</th>
                                     <th style="padding: 10px; text-align: left;">Телефон</th>
                                     <th style="padding: 10px; text-align: left;">Username</th>
@@ -308,6 +332,7 @@ class CampaignAdmin(admin.ModelAdmin):
                     winners_html += f"""
                                 <tr style="border-bottom: 1px solid #dee2e6;">
                                     <td style="padding: 10px; font-weight: bold;">{winner['place']}</td>
+                                    <td style="padding: 10px;">{winner.get('tier', '')}</td>
                                     <td style="padding: 10px;">{winner['name']}</td>
                                     <td style="padding: 10px;">{winner['phone']}</td>
                                     <td style="padding: 10px;">{winner.get('username', 'Не указан')}</td>
@@ -333,17 +358,185 @@ class CampaignAdmin(admin.ModelAdmin):
         return HttpResponseRedirect('/admin/campaigns/campaign/')
     
     def export_excel(self, request, object_id):
-        """Экспорт в Excel"""
-        from .views import export_participants_excel
-        return export_participants_excel(request, object_id)
+        """
+        Экспорт в Excel (?format=csv - в CSV, &gzip=1 - сжатый) фоновой задачей.
+        Готовый файл с теми же данными отдается сразу, иначе - ссылка на выгрузку.
+        """
+        try:
+            campaign = Campaign.objects.get(id=object_id)
+        except Campaign.DoesNotExist:
+            messages.error(request, '❌ Мероприятие не найдено!')
+            return HttpResponseRedirect('/admin/campaigns/campaign/')
+
+        export_format = 'xlsx'
+        if request.GET.get('format') == 'csv':
+            export_format = 'csv.gz' if request.GET.get('gzip') == '1' else 'csv'
+        job = export_jobs.request(campaign, export_format)
+        if job.status == 'done':
+            return HttpResponseRedirect(f'/admin/campaigns/exportjob/{job.id}/download/')
+
+        messages.info(request, format_html(
+            '⏳ Выгрузка "{}" ({}) готовится: {}%. <a href="{}">Скачать</a> - ссылка заработает, когда файл будет готов.',
+            campaign.name, job.get_format_display(), job.percent, f'/admin/campaigns/exportjob/{job.id}/download/'
+        ))
+        return HttpResponseRedirect('/admin/campaigns/campaign/')
+
+@admin.register(Bot)
+class BotAdmin(admin.ModelAdmin):
+    list_display = ['name', 'key', 'username', 'webhook_url']
+    search_fields = ['name', 'key', 'username']
+
+    def webhook_url(self, obj):
+        return obj.webhook_url()
+    webhook_url.short_description = 'Адрес вебхука'
 
 @admin.register(Participant)
 class ParticipantAdmin(admin.ModelAdmin):
-    list_display = ['first_name', 'phone', 'campaign', 'is_subscribed', 'created_at']
-    list_filter = ['campaign', 'is_subscribed', 'created_at']
+    list_display = ['first_name', 'phone', 'campaign', 'is_subscribed', 'tickets', 'bot_blocked', 'created_at']
+    list_filter = ['campaign', 'is_subscribed', 'bot_blocked', 'created_at']
     search_fields = ['first_name', 'phone', 'username']
     readonly_fields = ['created_at']
+    list_select_related = ['campaign']
+    # Участников миллионы: без точного COUNT для "показать все" и для числа страниц
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    # Правки и удаление в обход бота: сначала дописываем накопленные изменения
+    # бота (иначе они перезапишут правку админа), потом сбрасываем кэш состояний
+    def save_model(self, request, obj, form, change):
+        registration_store.flush()
+        with transaction.atomic():
+            # Правка стадии, подписки или мероприятия - сразу в счетчики воронки
+            before = None
+            if change:
+                row = (
+                    Participant.objects.select_for_update().filter(pk=obj.pk)
+                    .values_list('campaign_id', 'registration_stage', 'is_subscribed', 'state_version')
+                    .first()
+                )
+                if row is not None:
+                    # Правка админа новее копий состояния, которые бот еще не записал
+                    before, obj.state_version = row[:3], row[3] + 1
+            super().save_model(request, obj, form, change)
+            apply_deltas(participant_deltas(before, (obj.campaign_id, obj.registration_stage, obj.is_subscribed)))
+        keys = {(obj.campaign_id, obj.telegram_id)}
+        if change:
+            keys.add((form.initial.get('campaign'), form.initial.get('telegram_id')))
+        for campaign_id, telegram_id in keys:
+            registration_store.invalidate(campaign_id, telegram_id)
+
+    # Удаление из админки сразу вычитается из счетчиков воронки
+    def delete_model(self, request, obj):
+        registration_store.flush()
+        with transaction.atomic():
+            remove_participants(Participant.objects.filter(pk=obj.pk))
+            super().delete_model(request, obj)
+        registration_store.invalidate(obj.campaign_id, obj.telegram_id)
+
+    def delete_queryset(self, request, queryset):
+        registration_store.flush()
+        keys = list(queryset.values_list('campaign_id', 'telegram_id'))
+        with transaction.atomic():
+            remove_participants(queryset)
+            super().delete_queryset(request, queryset)
+        for campaign_id, telegram_id in keys:
+            registration_store.invalidate(campaign_id, telegram_id)
 
 admin.site.site_header = "Управление Telegram ботом мероприятий"
 admin.site.site_title = "Админка бота мероприятий"
-admin.site.index_title = "Главная панель управления"
\ No newline at end of file
+admin.site.index_title = "Главная панель управления"
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['campaign', 'format', 'status', 'progress_percent', 'total', 'created_at', 'finished_at', 'download_link']
+    list_filter = ['status', 'format']
+    list_select_related = ['campaign']
+    # Вместо поля file - ссылка на скачивание через админку: у закрытого хранилища нет публичного URL
+    exclude = ['file']
+    readonly_fields = ['campaign', 'format', 'status', 'fingerprint', 'total', 'progress', 'download_link', 'error', 'created_at', 'finished_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def progress_percent(self, obj):
+        return f"{obj.percent}%"
+    progress_percent.short_description = 'Прогресс'
+
+    def download_link(self, obj):
+        if obj.status != 'done':
+            return '-'
+        return format_html('<a href="{}">⬇️ Скачать</a>', f'/admin/campaigns/exportjob/{obj.id}/download/')
+    download_link.short_description = 'Файл'
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('<path:object_id>/download/', self.admin_site.admin_view(self.download), name='exportjob_download'),
+        ]
+        return custom_urls + urls
+
+    def download(self, request, object_id):
+        """Файл выгрузки - только через админку: в нем персональные данные участников"""
+        try:
+            job = ExportJob.objects.get(id=object_id)
+        except ExportJob.DoesNotExist:
+            messages.error(request, '❌ Выгрузка не найдена!')
+            return HttpResponseRedirect('/admin/campaigns/exportjob/')
+
+        if job.status != 'done' or not job.file:
+            if job.status == 'failed':
+                messages.error(request, f'❌ Выгрузка завершилась ошибкой: {job.error}')
+            else:
+                messages.info(request, f'⏳ Выгрузка еще готовится: {job.percent}%')
+            return HttpResponseRedirect('/admin/campaigns/exportjob/')
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name))
+
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ['campaign', 'short_text', 'audience_description', 'status', 'sent', 'failed', 'blocked', 'created_at', 'finished_at']
+    list_filter = ['status', 'campaign']
+    list_select_related = ['campaign']
+    readonly_fields = ['status', 'audience_size', 'last_participant_id', 'sent', 'failed', 'blocked', 'started_at', 'finished_at']
+    fields = ['campaign', 'text', 'parse_mode', 'stage', 'only_subscribed', 'audience_size', 'status', 'sent', 'failed', 'blocked', 'last_participant_id', 'started_at', 'finished_at']
+    actions = ['queue_broadcasts', 'cancel_broadcasts']
+
+    def short_text(self, obj):
+        return obj.text[:60]
+    short_text.short_description = 'Сообщение'
+
+    def audience_description(self, obj):
+        parts = [obj.get_stage_display() if obj.stage else 'Все стадии']
+        if obj.only_subscribed:
+            parts.append('подписанные')
+        return ', '.join(parts)
+    audience_description.short_description = 'Аудитория'
+
+    def audience_size(self, obj):
+        # Только на странице рассылки: точный COUNT по одной аудитории
+        return obj.audience().count() if obj.pk else '-'
+    audience_size.short_description = 'Получателей сейчас'
+
+    @admin.action(description='Запустить рассылку (отправит команда run_broadcasts)')
+    def queue_broadcasts(self, request, queryset):
+        queued = queryset.filter(status='draft').update(status='queued')
+        messages.success(request, f'📨 Рассылок поставлено в очередь: {queued}')
+
+    @admin.action(description='Отменить рассылку')
+    def cancel_broadcasts(self, request, queryset):
+        cancelled = queryset.filter(status__in=['draft', 'queued', 'running']).update(status='cancelled')
+        messages.warning(request, f'Рассылок отменено: {cancelled}')
+
+
+@admin.register(BroadcastDelivery)
+class BroadcastDeliveryAdmin(admin.ModelAdmin):
+    list_display = ['broadcast', 'participant', 'status', 'error', 'created_at']
+    list_filter = ['status']
+    list_select_related = ['broadcast__campaign', 'participant__campaign']
+    readonly_fields = ['broadcast', 'participant', 'status', 'error', 'created_at']
+    raw_id_fields = ['broadcast', 'participant']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def has_add_permission(self, request):
+        return False
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class CampaignsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'campaigns'
-    # УБЕРИТЕ verbose_name если добавляли
\ No newline at end of file
+    # УБЕРИТЕ verbose_name если добавляли
+
+    def ready(self):
+        from . import signals  # noqa: F401
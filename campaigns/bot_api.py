@@ -0,0 +1,365 @@
+# campaigns/bot_api.py
+import contextvars
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import DatabaseError
+
+from .metrics import bot_api_seconds
+from .rate_limit import RateLimiter, RetryQueue, SharedRateWindow
+
+logger = logging.getLogger(__name__)
+
+
+# Таймауты (connect, read) в секундах для каждого метода Bot API
+DEFAULT_TIMEOUTS = {
+    'sendMessage': (3.05, 10),
+    'editMessageText': (3.05, 10),
+    'answerCallbackQuery': (3.05, 5),
+    'deleteMessage': (3.05, 5),
+    'getChatMember': (3.05, 5),
+    'setWebhook': (3.05, 15),
+    'deleteWebhook': (3.05, 15),
+}
+FALLBACK_TIMEOUT = (3.05, 10)
+
+# Методы, которые пишут в конкретный чат - для них действует лимит на чат
+CHAT_LIMITED_METHODS = ('sendMessage', 'editMessageText', 'deleteMessage')
+# После 429 повторяем только вызовы, результат которых не нужен вызывающему сразу
+# (answerCallbackQuery к моменту повтора уже устареет)
+RETRYABLE_METHODS = ('sendMessage', 'editMessageText', 'deleteMessage')
+
+
+class BotApiClient:
+    """
+    Клиент Telegram Bot API с пулом keep-alive соединений.
+
+    Токен читается один раз при создании. Все методы возвращают
+    распакованный ответ Telegram ({'ok': ..., 'result': ...}); сетевые
+    ошибки пробрасываются как исключения requests.
+
+    rate_limiter ограничивает частоту вызовов; ответ 429 ставит паузу всему боту на
+    parameters.retry_after, а повторяемые методы уходят в retry_queue.
+    """
+
+    def __init__(self, token, api_base='https://api.telegram.org', pool_size=20, timeouts=None,
+                 rate_limiter=None, retry_queue=None):
+        self.token = token
+        self.rate_limiter = rate_limiter
+        self.retry_queue = retry_queue
+        self.rate_limited = 0
+        self.api_base = api_base.rstrip('/')
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def call(self, method, params=None, timeout=None, attempt=1):
+        """Вызов произвольного метода Bot API с учетом лимитов Telegram"""
+        params = params or {}
+        chat_id = params.get('chat_id') if method in CHAT_LIMITED_METHODS else None
+
+        if self.rate_limiter is not None and not self.rate_limiter.acquire(chat_id):
+            data = {
+                'ok': False,
+                'error_code': 429,
+                'description': 'Too Many Requests: local rate limit',
+                'parameters': {'retry_after': self.rate_limiter.max_wait},
+            }
+            self._retry_later(method, params, timeout, attempt, self.rate_limiter.max_wait)
+            return data
+
+        data = self._request(method, params, timeout)
+
+        if data.get('error_code') == 429:
+            self.rate_limited += 1
+            retry_after = data.get('parameters', {}).get('retry_after', 1)
+            if self.rate_limiter is not None:
+                # По ответу не отличить лимит чата от общего flood control бота:
+                # паузу ставим и чату, и всему боту, чтобы остальные чаты не били в лимит
+                self.rate_limiter.pause(retry_after)
+                if chat_id is not None:
+                    self.rate_limiter.pause(retry_after, chat_id)
+            self._retry_later(method, params, timeout, attempt, retry_after)
+        return data
+
+    def _retry_later(self, method, params, timeout, attempt, delay):
+        if self.retry_queue is None or method not in RETRYABLE_METHODS:
+            return False
+        return self.retry_queue.schedule(
+            delay,
+            lambda next_attempt: self.call(method, params, timeout, next_attempt),
+            attempt + 1,
+        )
+
+    def _request(self, method, params, timeout):
+        started = time.perf_counter()
+        status = 'exception'
+        try:
+            response = self.session.post(
+                f'{self.api_base}/bot{self.token}/{method}',
+                data=params,
+                timeout=timeout or self.timeouts.get(method, FALLBACK_TIMEOUT),
+            )
+            try:
+                data = response.json()
+            except ValueError:
+                data = {
+                    'ok': False,
+                    'error_code': response.status_code,
+                    'description': response.text[:200],
+                }
+            status = 'ok' if data.get('ok') else str(data.get('error_code', response.status_code))
+            return data
+        finally:
+            bot_api_seconds.observe(time.perf_counter() - started, method=method, status=status)
+
+    def send_message(self, chat_id, text, reply_markup=None, parse_mode=None):
+        params = {'chat_id': chat_id, 'text': text}
+        if reply_markup:
+            params['reply_markup'] = json.dumps(reply_markup)
+        if parse_mode:
+            params['parse_mode'] = parse_mode
+        return self.call('sendMessage', params)
+
+    def edit_message_text(self, chat_id, message_id, text, reply_markup=None, parse_mode=None):
+        params = {'chat_id': chat_id, 'message_id': message_id, 'text': text}
+        if reply_markup:
+            params['reply_markup'] = json.dumps(reply_markup)
+        if parse_mode:
+            params['parse_mode'] = parse_mode
+        return self.call('editMessageText', params)
+
+    def answer_callback_query(self, callback_query_id, text=None, show_alert=False):
+        params = {'callback_query_id': callback_query_id, 'show_alert': show_alert}
+        if text:
+            params['text'] = text
+        return self.call('answerCallbackQuery', params)
+
+    def delete_message(self, chat_id, message_id):
+        return self.call('deleteMessage', {'chat_id': chat_id, 'message_id': message_id})
+
+    def get_chat_member(self, chat_id, user_id):
+        return self.call('getChatMember', {'chat_id': chat_id, 'user_id': user_id})
+
+    def get_updates(self, offset=None, limit=100, timeout=50, allowed_updates=None):
+        """Long polling: Telegram держит запрос до timeout секунд, если апдейтов нет"""
+        params = {'limit': limit, 'timeout': timeout}
+        if offset:
+            params['offset'] = offset
+        if allowed_updates is not None:
+            params['allowed_updates'] = json.dumps(allowed_updates)
+        return self.call('getUpdates', params, timeout=(3.05, timeout + 10))
+
+    def set_webhook(self, url):
+        return self.call('setWebhook', {'url': url})
+
+    def delete_webhook(self, drop_pending_updates=False):
+        return self.call('deleteWebhook', {'drop_pending_updates': drop_pending_updates})
+
+    def stats(self):
+        """Метрики лимитов: ожидания, 429 от Telegram, повторы и потерянные вызовы"""
+        stats = {'rate_limited': self.rate_limited}
+        if self.rate_limiter is not None:
+            stats.update(self.rate_limiter.stats())
+        if self.retry_queue is not None:
+            stats.update(self.retry_queue.stats())
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+class OfflineBotApiClient(BotApiClient):
+    """
+    Клиент без сети: вызовы только считаются и всегда успешны.
+    Нужен бенчмаркам, чтобы измерять обработку апдейтов без Telegram.
+    """
+
+    def __init__(self):
+        super().__init__('offline')
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    def _request(self, method, params, timeout):
+        self.calls[method] += 1
+        if method == 'getChatMember':
+            return {'ok': True, 'result': {'status': 'member'}}
+        if method == 'getUpdates':
+            return {'ok': True, 'result': []}
+        if method in ('sendMessage', 'editMessageText'):
+            return {'ok': True, 'result': {'message_id': next(self._message_ids)}}
+        return {'ok': True, 'result': True}
+
+
+# Ключ бота из переменной окружения BOT_TOKEN (мероприятия без своего бота)
+DEFAULT_BOT_KEY = 'default'
+
+# Бот, от имени которого сейчас обрабатывается апдейт
+current_bot_key = contextvars.ContextVar('current_bot_key', default=DEFAULT_BOT_KEY)
+
+
+class UnknownBot(LookupError):
+    """Бот с таким ключом не настроен"""
+
+
+@contextmanager
+def use_bot(bot_key):
+    """Внутри блока get_bot_api() возвращает клиент бота bot_key"""
+    token = current_bot_key.set(bot_key)
+    try:
+        yield
+    finally:
+        current_bot_key.reset(token)
+
+
+def get_bot_token(bot_key):
+    """Токен бота: из модели Bot, для бота по умолчанию - из BOT_TOKEN"""
+    from .models import Bot
+    token = Bot.objects.filter(key=bot_key).values_list('token', flat=True).first()
+    if token is None and bot_key == DEFAULT_BOT_KEY:
+        token = settings.BOT_TOKEN
+    if not token:
+        raise UnknownBot(bot_key)
+    return token
+
+
+class BroadcastActivity:
+    """
+    Идет ли у бота рассылка. Пока идет, живой трафик уступает ей долю
+    BROADCAST_RATE лимита бота. В БД проверяется не чаще раза в ttl секунд
+    на процесс.
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._checked = {}
+
+    def running(self, bot_key):
+        now = time.monotonic()
+        entry = self._checked.get(bot_key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        from .models import Broadcast
+        broadcasts = Broadcast.objects.filter(status='running')
+        if bot_key == DEFAULT_BOT_KEY:
+            broadcasts = broadcasts.filter(campaign__bot__isnull=True)
+        else:
+            broadcasts = broadcasts.filter(campaign__bot__key=bot_key)
+        try:
+            running = broadcasts.exists()
+        except DatabaseError:
+            logger.warning("Broadcast status check failed for bot %s", bot_key, exc_info=True)
+            running = entry[1] if entry is not None else False
+        self._checked[bot_key] = (now + self.ttl, running)
+        return running
+
+
+broadcast_activity = BroadcastActivity(ttl=getattr(settings, 'BROADCAST_STATUS_TTL', 5.0))
+
+
+def shared_rate_window(bot_key):
+    """Общее для всех процессов окно лимита бота (BOT_API_RATE_CACHE_ALIAS) или None"""
+    alias = getattr(settings, 'BOT_API_RATE_CACHE_ALIAS', None)
+    if not alias:
+        return None
+    return SharedRateWindow(
+        alias, f'ratelimit:{bot_key}', getattr(settings, 'BOT_API_GLOBAL_RATE', 30),
+        max_wait=getattr(settings, 'BOT_API_MAX_WAIT', 5.0),
+    )
+
+
+def bot_rate_limiter(bot_key):
+    """
+    Лимитер живого трафика бота. С BOT_API_RATE_CACHE_ALIAS лимит
+    BOT_API_GLOBAL_RATE общий для всех процессов (окна в кэше Django).
+    Без него лимит в памяти процесса, и BOT_API_GLOBAL_RATE делится на
+    BOT_API_PROCESSES - число процессов, которые отправляют сообщения от бота.
+    Весь лимит доступен ответам, пока нет рассылки; во время рассылки ее
+    доля BROADCAST_RATE вычитается.
+    """
+    shared = shared_rate_window(bot_key)
+    processes = 1 if shared else max(1, getattr(settings, 'BOT_API_PROCESSES', 1))
+    broadcast_rate = getattr(settings, 'BROADCAST_RATE', 10)
+
+    def reserved():
+        return broadcast_rate / processes if broadcast_activity.running(bot_key) else 0.0
+
+    return RateLimiter(
+        global_rate=None if shared else getattr(settings, 'BOT_API_GLOBAL_RATE', 30) / processes,
+        chat_rate=getattr(settings, 'BOT_API_CHAT_RATE', 1),
+        max_wait=getattr(settings, 'BOT_API_MAX_WAIT', 5.0),
+        shared=shared,
+        reserved=reserved,
+    )
+
+
+class BotRegistry:
+    """
+    Клиенты Bot API по ключу бота. У каждого бота свой пул соединений,
+    свои лимиты Telegram и своя очередь повторов - боты не мешают друг другу.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, bot_key):
+        client = self._clients.get(bot_key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(bot_key)
+                if client is None:
+                    client = self._clients[bot_key] = self._create(bot_key, get_bot_token(bot_key))
+        return client
+
+    def _create(self, bot_key, token):
+        return BotApiClient(
+            token,
+            api_base=getattr(settings, 'TELEGRAM_API_BASE', 'https://api.telegram.org'),
+            pool_size=getattr(settings, 'UPDATE_WORKERS', 8) + 4,
+            rate_limiter=bot_rate_limiter(bot_key),
+            retry_queue=RetryQueue(max_attempts=getattr(settings, 'BOT_API_MAX_RETRIES', 3)),
+        )
+
+    def set(self, bot_key, client):
+        """Подменяет клиент бота; возвращает прежний"""
+        with self._lock:
+            previous = self._clients.pop(bot_key, None)
+            if client is not None:
+                self._clients[bot_key] = client
+        return previous
+
+    def invalidate(self, bot_key):
+        """Сбрасывает клиент (например, после смены токена)"""
+        previous = self.set(bot_key, None)
+        if previous is not None:
+            previous.close()
+
+    def stats(self):
+        return {bot_key: client.stats() for bot_key, client in list(self._clients.items())}
+
+
+bot_registry = BotRegistry()
+
+
+def get_bot_api(bot_key=None):
+    """Клиент Bot API бота bot_key (по умолчанию - бота текущего апдейта)"""
+    return bot_registry.get(bot_key or current_bot_key.get())
+
+
+def set_bot_api(client, bot_key=None):
+    """Подменяет клиент бота (например, на OfflineBotApiClient); возвращает прежний"""
+    return bot_registry.set(bot_key or current_bot_key.get(), client)
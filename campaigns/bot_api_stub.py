@@ -0,0 +1,117 @@
+# campaigns/bot_api_stub.py
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class BotApiStub:
+    """
+    Локальный HTTP-сервер, отвечающий как Telegram Bot API - для нагрузочных
+    тестов без обращений к Telegram.
+
+    latency - задержка ответа в секундах (плюс случайная jitter), error_rate -
+    доля вызовов, на которые возвращается 500. getChatMember всегда отвечает
+    "member". Сервер считает вызовы по методам и по чатам; wait_for_chat()
+    ждет очередного ответа бота пользователю.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.05, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self.errors = Counter()
+        self._chat_calls = defaultdict(int)
+        self._condition = threading.Condition()
+        self._random = random.Random()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='bot-api-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def chat_calls(self, chat_id):
+        with self._condition:
+            return self._chat_calls[int(chat_id)]
+
+    def wait_for_chat(self, chat_id, after, timeout):
+        """Ждет, пока у чата станет больше after вызовов; False - не дождались"""
+        deadline = time.monotonic() + timeout
+        chat_id = int(chat_id)
+        with self._condition:
+            while self._chat_calls[chat_id] <= after:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    # 🔹 Обработка запросов
+
+    def respond(self, method, params):
+        """(HTTP-статус, ответ) на вызов метода"""
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+        with self._condition:
+            self.calls[method] += 1
+            failed = self.error_rate and self._random.random() < self.error_rate
+            if failed:
+                self.errors[method] += 1
+            # answerCallbackQuery адресован callback_query_id - в нагрузочном тесте это id пользователя
+            chat_id = params.get('chat_id') or params.get('callback_query_id')
+            if chat_id and str(chat_id).lstrip('-').isdigit():
+                self._chat_calls[int(chat_id)] += 1
+                self._condition.notify_all()
+
+        if failed:
+            return 500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'}
+        if method == 'getChatMember':
+            return 200, {'ok': True, 'result': {'status': 'member', 'user': {'id': params.get('user_id')}}}
+        if method in ('sendMessage', 'editMessageText'):
+            return 200, {'ok': True, 'result': {'message_id': self.calls[method], 'chat': {'id': params.get('chat_id')}}}
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': []}
+        return 200, {'ok': True, 'result': True}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+                if 'json' in (self.headers.get('Content-Type') or ''):
+                    params = json.loads(body or '{}')
+                else:
+                    params = {key: values[-1] for key, values in parse_qs(body).items()}
+                status, data = stub.respond(self.path.rsplit('/', 1)[-1], params)
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,211 @@
+# campaigns/broadcasts.py
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .bot_api import DEFAULT_BOT_KEY, BotApiClient, get_bot_token, shared_rate_window
+from .models import Broadcast, BroadcastDelivery, Participant
+from .rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Ответы Telegram, после которых писать пользователю бессмысленно
+BLOCKED_DESCRIPTIONS = ('bot was blocked by the user', 'user is deactivated', 'bot can\'t initiate conversation')
+
+
+def iter_recipient_pages(broadcast, page_size):
+    """
+    Получатели рассылки страницами по (id, telegram_id): keyset по id, без OFFSET.
+    Участники, которым рассылка уже отправлялась, пропускаются - после
+    прерывания рассылка продолжается без повторных сообщений.
+    """
+    delivered = BroadcastDelivery.objects.filter(broadcast_id=broadcast.id, participant_id=OuterRef('pk'))
+    last_id = broadcast.last_participant_id
+    while True:
+        page = list(
+            broadcast.audience()
+            .filter(id__gt=last_id)
+            .exclude(Exists(delivered))
+            .order_by('id')
+            .values_list('id', 'telegram_id')[:page_size]
+        )
+        if not page:
+            return
+        yield page
+        last_id = page[-1][0]
+
+
+def unblock_user(bot_key, telegram_id):
+    """
+    Пользователь снова пишет боту - значит, разблокировал его: снова получает рассылки
+    во всех мероприятиях бота. Запрос идет по частичному индексу заблокировавших.
+    """
+    participants = Participant.objects.filter(telegram_id=telegram_id, bot_blocked=True)
+    if bot_key == DEFAULT_BOT_KEY:
+        participants = participants.filter(campaign__bot__isnull=True)
+    else:
+        participants = participants.filter(campaign__bot__key=bot_key)
+    return participants.update(bot_blocked=False)
+
+
+def classify_response(data):
+    """(статус доставки, текст ошибки) по ответу Telegram"""
+    if data.get('ok'):
+        return 'sent', ''
+    description = data.get('description', '')
+    if data.get('error_code') == 403 or any(text in description.lower() for text in BLOCKED_DESCRIPTIONS):
+        return 'blocked', description[:255]
+    return 'failed', f"{data.get('error_code', '')} {description}".strip()[:255]
+
+
+class BroadcastSender:
+    """
+    Отправка рассылок с общим лимитом на бота.
+
+    У рассылки свой клиент Bot API и свой лимит rate - не больше доли
+    BROADCAST_RATE из лимита бота. Пока рассылка в статусе running, живой
+    трафик уступает ей эту долю (bot_api.bot_rate_limiter); с общим окном
+    лимита (BOT_API_RATE_CACHE_ALIAS) рассылка занимает в нем места наравне
+    с ответами бота. Отправки идут из пула
+    потоков, чтобы задержка сети не ограничивала скорость. Ответ 429 ставит
+    паузу всему лимитеру - ждут все потоки, - и отправка тому же получателю
+    повторяется, без очереди повторов. Результаты пишутся в BroadcastDelivery
+    после каждой страницы.
+    """
+
+    def __init__(self, rate=10, workers=8, page_size=100, max_attempts=5, stale_after=120):
+        self.rate = rate
+        self.workers = workers
+        self.page_size = page_size
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+        self._clients = {}
+
+    def client_for(self, bot_key):
+        client = self._clients.get(bot_key)
+        if client is None:
+            client = self._clients[bot_key] = BotApiClient(
+                get_bot_token(bot_key),
+                api_base=getattr(settings, 'TELEGRAM_API_BASE', 'https://api.telegram.org'),
+                pool_size=self.workers + 2,
+                rate_limiter=RateLimiter(global_rate=self.rate, chat_rate=1, max_wait=5.0,
+                                         shared=shared_rate_window(bot_key)),
+            )
+        return client
+
+    def claim(self, broadcast_id=None):
+        """
+        Следующая рассылка для отправки: из очереди или прерванная (нет
+        прогресса дольше stale_after). Захват - условным UPDATE, поэтому
+        несколько воркеров не отправляют одну рассылку.
+        """
+        stale = timezone.now() - timedelta(seconds=self.stale_after)
+        candidates = Broadcast.objects.filter(status='queued') | Broadcast.objects.filter(
+            status='running', updated_at__lt=stale
+        )
+        if broadcast_id is not None:
+            candidates = candidates.filter(id=broadcast_id)
+        for broadcast in candidates.order_by('created_at'):
+            claimed = Broadcast.objects.filter(
+                id=broadcast.id, status=broadcast.status, updated_at=broadcast.updated_at
+            ).update(status='running', updated_at=timezone.now(), started_at=broadcast.started_at or timezone.now())
+            if claimed:
+                broadcast.refresh_from_db()
+                return broadcast
+        return None
+
+    def run(self, broadcast, stop=None):
+        """Отправляет рассылку до конца (или до stop()); возвращает итоговую модель"""
+        if len(broadcast.text) > Broadcast.MAX_TEXT_LENGTH:
+            # Создана в обход админки: Telegram отклонил бы каждое сообщение
+            logger.error("Broadcast %s text is longer than %s characters", broadcast.id, Broadcast.MAX_TEXT_LENGTH)
+            Broadcast.objects.filter(id=broadcast.id).update(status='cancelled', updated_at=timezone.now())
+            broadcast.refresh_from_db()
+            return broadcast
+
+        client = self.client_for(broadcast.campaign.bot_key)
+        params = {'text': broadcast.text}
+        if broadcast.parse_mode:
+            params['parse_mode'] = broadcast.parse_mode
+
+        def send(recipient):
+            participant_id, telegram_id = recipient
+            status, error = 'failed', ''
+            for _ in range(self.max_attempts):
+                try:
+                    data = client.call('sendMessage', dict(params, chat_id=telegram_id))
+                except Exception as e:
+                    status, error = 'failed', str(e)[:255]
+                    time.sleep(1)
+                    continue
+                if data.get('error_code') == 429:
+                    # Flood control бота: пауза всему лимитеру, иначе остальные потоки
+                    # продолжат слать сообщения в то же ожидание
+                    retry_after = data.get('parameters', {}).get('retry_after', 1)
+                    client.rate_limiter.pause(retry_after)
+                    time.sleep(retry_after)
+                    status, error = 'failed', 'Too Many Requests'
+                    continue
+                status, error = classify_response(data)
+                break
+            return participant_id, telegram_id, status, error
+
+        logger.info("Broadcast %s started from participant %s", broadcast.id, broadcast.last_participant_id)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='broadcast') as pool:
+            for page in iter_recipient_pages(broadcast, self.page_size):
+                if stop is not None and stop():
+                    break
+                if Broadcast.objects.filter(id=broadcast.id, status='cancelled').exists():
+                    logger.info("Broadcast %s cancelled", broadcast.id)
+                    return broadcast
+                self.save_page(broadcast, list(pool.map(send, page)))
+        close_old_connections()
+
+        if stop is not None and stop():
+            # Остановлена воркером - следующий запуск продолжит сразу, не дожидаясь stale_after
+            Broadcast.objects.filter(id=broadcast.id, status='running').update(status='queued', updated_at=timezone.now())
+            logger.info("Broadcast %s paused at participant %s", broadcast.id, broadcast.last_participant_id)
+        else:
+            Broadcast.objects.filter(id=broadcast.id, status='running').update(
+                status='done', finished_at=timezone.now(), updated_at=timezone.now()
+            )
+            logger.info("Broadcast %s done", broadcast.id)
+        broadcast.refresh_from_db()
+        return broadcast
+
+    def save_page(self, broadcast, results):
+        """Результаты страницы, счетчики и курсор - одной транзакцией"""
+        counts = {'sent': 0, 'failed': 0, 'blocked': 0}
+        blocked_users = []
+        for _, telegram_id, status, _ in results:
+            counts[status] += 1
+            if status == 'blocked':
+                blocked_users.append(telegram_id)
+
+        with transaction.atomic():
+            BroadcastDelivery.objects.bulk_create(
+                [
+                    BroadcastDelivery(broadcast_id=broadcast.id, participant_id=participant_id, status=status, error=error)
+                    for participant_id, _, status, error in results
+                ],
+                ignore_conflicts=True,
+            )
+            if blocked_users:
+                # Блокировка - на уровне бота: пропускаем пользователя во всех мероприятиях этого бота
+                Participant.objects.filter(
+                    telegram_id__in=blocked_users, campaign__bot_id=broadcast.campaign.bot_id
+                ).update(bot_blocked=True)
+            broadcast.last_participant_id = max(participant_id for participant_id, *_ in results)
+            Broadcast.objects.filter(id=broadcast.id).update(
+                last_participant_id=broadcast.last_participant_id,
+                sent=F('sent') + counts['sent'],
+                failed=F('failed') + counts['failed'],
+                blocked=F('blocked') + counts['blocked'],
+                updated_at=timezone.now(),
+            )
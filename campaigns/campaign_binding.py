@@ -0,0 +1,123 @@
+# campaigns/campaign_binding.py
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .models import UserCampaignBinding
+
+# Значение в общем кэше для "привязки нет" (None кэш Django не отличит от промаха)
+NO_BINDING = 0
+
+
+class CampaignBindingStore:
+    """
+    Привязка пользователя к текущему мероприятию бота (по последнему deep link).
+
+    Хранится в таблице UserCampaignBinding (уникальный индекс по боту и
+    telegram_id). Чтение идет через общий кэш Django (alias): bind()
+    обновляет его сразу, и все воркеры видят новую привязку; отсутствие
+    привязки тоже кэшируется.
+
+    Без alias - LRU в памяти процесса с коротким ttl: привязку, сделанную
+    в другом воркере, процесс увидит не позже чем через ttl. Отсутствие
+    привязки в этом режиме не кэшируется - иначе первый /start <slug> в
+    другом воркере не виден до конца ttl.
+    """
+
+    def __init__(self, max_entries=100000, ttl=5, alias=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.alias = alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(key):
+        return 'campaign_binding:%s:%s' % key
+
+    def _remember(self, key, campaign_id):
+        if self.alias:
+            caches[self.alias].set(self._cache_key(key), campaign_id or NO_BINDING, self.ttl)
+            return
+        with self._lock:
+            if campaign_id is None:
+                self._entries.pop(key, None)
+                return
+            self._entries[key] = (campaign_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _cached(self, key):
+        """(True, campaign_id) из кэша или (False, None), если записи нет или она устарела"""
+        if self.alias:
+            value = caches[self.alias].get(self._cache_key(key))
+            if value is None:
+                return False, None
+            return True, (None if value == NO_BINDING else value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                return True, entry[0]
+        return False, None
+
+    def get(self, bot_key, telegram_id):
+        """id мероприятия, к которому привязан пользователь, или None"""
+        found, campaign_id = self._cached((bot_key, telegram_id))
+        if found:
+            return campaign_id
+
+        campaign_id = (
+            UserCampaignBinding.objects.filter(bot_key=bot_key, telegram_id=telegram_id)
+            .values_list('campaign_id', flat=True)
+            .first()
+        )
+        self._remember((bot_key, telegram_id), campaign_id)
+        return campaign_id
+
+    def prefetch(self, bot_key, telegram_ids):
+        """Загружает привязки пачки пользователей одним запросом"""
+        missing = {
+            telegram_id for telegram_id in telegram_ids
+            if not self._cached((bot_key, telegram_id))[0]
+        }
+        if not missing:
+            return
+        found = dict(
+            UserCampaignBinding.objects.filter(bot_key=bot_key, telegram_id__in=missing)
+            .values_list('telegram_id', 'campaign_id')
+        )
+        for telegram_id in missing:
+            self._remember((bot_key, telegram_id), found.get(telegram_id))
+
+    def bind(self, bot_key, telegram_id, campaign_id):
+        """Привязывает пользователя к мероприятию (один upsert)"""
+        found, current = self._cached((bot_key, telegram_id))
+        if found and current == campaign_id:
+            return
+
+        UserCampaignBinding.objects.bulk_create(
+            [UserCampaignBinding(
+                bot_key=bot_key, telegram_id=telegram_id, campaign_id=campaign_id, updated_at=timezone.now()
+            )],
+            update_conflicts=True,
+            unique_fields=['bot_key', 'telegram_id'],
+            update_fields=['campaign', 'updated_at'],
+        )
+        self._remember((bot_key, telegram_id), campaign_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+campaign_bindings = CampaignBindingStore(
+    max_entries=getattr(settings, 'CAMPAIGN_BINDING_MAX_ENTRIES', 100000),
+    ttl=getattr(settings, 'CAMPAIGN_BINDING_TTL', 5),
+    alias=getattr(settings, 'CAMPAIGN_BINDING_CACHE_ALIAS', None),
+)
@@ -0,0 +1,126 @@
+# campaigns/campaign_cache.py
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .bot_api import DEFAULT_BOT_KEY, current_bot_key
+from .models import Campaign
+
+
+@dataclass(frozen=True)
+class CampaignSnapshot:
+    """Неизменяемый снимок мероприятия - только поля, нужные обработчикам бота"""
+    id: int
+    slug: str
+    name: str
+    first_message: str
+    conditions_text: str
+    conditions_button: str
+    share_phone_button: str
+    channel_usernames: str
+    bonus_channel_usernames: str
+    bot_key: str = DEFAULT_BOT_KEY
+
+    FIELDS = (
+        'id', 'slug', 'name', 'first_message', 'conditions_text',
+        'conditions_button', 'share_phone_button', 'channel_usernames',
+        'bonus_channel_usernames',
+    )
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(
+            bot_key=values.get('bot__key') or DEFAULT_BOT_KEY,
+            **{field: values[field] for field in cls.FIELDS}
+        )
+
+
+class RunningCampaigns:
+    """Запущенные мероприятия одного бота: индексы по id и по slug"""
+
+    def __init__(self, snapshots):
+        self.by_id = {snapshot.id: snapshot for snapshot in snapshots}
+        self.by_slug = {snapshot.slug: snapshot for snapshot in snapshots}
+        # Мероприятие по умолчанию - для пользователей без deep link и привязки
+        self.default = snapshots[0] if snapshots else None
+
+
+NO_CAMPAIGNS = RunningCampaigns([])
+
+
+class ActiveCampaignCache:
+    """
+    Кэш запущенных мероприятий (status='active', bot_is_running=True)
+    по ботам.
+
+    Одновременно может идти несколько мероприятий: пользователь попадает
+    в нужное по deep link (/start <slug>) или по своей привязке, поиск -
+    по словарю, без перебора мероприятий.
+
+    В установившемся режиме обработка апдейта не делает запросов к БД.
+    Сбрасывается сигналами post_save/post_delete и при запуске/остановке
+    бота; ttl ограничивает устаревание в других процессах gunicorn,
+    до которых сигнал не доходит.
+    """
+
+    def __init__(self, ttl=10.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._bots = {}
+        self._expires_at = 0.0
+        self._generation = 0
+
+    def _load(self):
+        if time.monotonic() < self._expires_at:
+            return self._bots
+
+        with self._lock:
+            generation = self._generation
+        rows = (
+            Campaign.objects.filter(status='active', bot_is_running=True)
+            .order_by('id')
+            .values(*CampaignSnapshot.FIELDS, 'bot__key')
+        )
+        snapshots = {}
+        for values in rows:
+            snapshot = CampaignSnapshot.from_values(values)
+            snapshots.setdefault(snapshot.bot_key, []).append(snapshot)
+        bots = {bot_key: RunningCampaigns(items) for bot_key, items in snapshots.items()}
+
+        with self._lock:
+            # Пока шел запрос кэш могли сбросить - тогда не сохраняем устаревший снимок
+            if generation == self._generation:
+                self._bots = bots
+                self._expires_at = time.monotonic() + self.ttl
+        return bots
+
+    def running(self, bot_key=DEFAULT_BOT_KEY):
+        return self._load().get(bot_key, NO_CAMPAIGNS)
+
+    def get(self, bot_key=DEFAULT_BOT_KEY):
+        return self.running(bot_key).default
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._bots = {}
+            self._expires_at = 0.0
+
+
+active_campaign_cache = ActiveCampaignCache(ttl=getattr(settings, 'ACTIVE_CAMPAIGN_CACHE_TTL', 10.0))
+
+
+def get_active_campaign(bot_key=None):
+    """Мероприятие бота по умолчанию (первое из запущенных) или None"""
+    return active_campaign_cache.get(bot_key or current_bot_key.get())
+
+
+def get_running_campaigns(bot_key=None):
+    """Запущенные мероприятия бота (по умолчанию - бота текущего апдейта)"""
+    return active_campaign_cache.running(bot_key or current_bot_key.get())
+
+
+def invalidate_active_campaign():
+    active_campaign_cache.invalidate()
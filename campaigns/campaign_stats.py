@@ -0,0 +1,126 @@
+# campaigns/campaign_stats.py
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import CampaignStats, Participant
+
+# Стадии регистрации по порядку воронки
+FUNNEL_STAGES = ('start', 'name', 'phone', 'subscription', 'completed')
+STAGE_FIELDS = {stage: f'stage_{stage}' for stage in FUNNEL_STAGES}
+COUNTER_FIELDS = ('participants', 'subscribed', *STAGE_FIELDS.values())
+
+
+def row_counters(registration_stage, is_subscribed):
+    """Вклад одного участника в счетчики"""
+    counters = Counter(participants=1)
+    if is_subscribed:
+        counters['subscribed'] += 1
+    if registration_stage in STAGE_FIELDS:
+        counters[STAGE_FIELDS[registration_stage]] += 1
+    return counters
+
+
+def state_deltas(previous, current):
+    """
+    Приращения счетчиков по мероприятиям.
+    previous - {(campaign_id, telegram_id): (stage, is_subscribed)} из БД до записи,
+    current - то же после записи; отсутствующего в previous участника еще не было.
+    """
+    deltas = defaultdict(Counter)
+    for key, (stage, is_subscribed) in current.items():
+        delta = deltas[key[0]]
+        delta.update(row_counters(stage, is_subscribed))
+        if key in previous:
+            delta.subtract(row_counters(*previous[key]))
+    return {
+        campaign_id: {field: value for field, value in delta.items() if value}
+        for campaign_id, delta in deltas.items()
+        if any(delta.values())
+    }
+
+
+def participant_deltas(before, after):
+    """
+    Приращения при изменении одного участника в обход бота (админка).
+    before/after - (campaign_id, stage, is_subscribed) до и после, None - участника не было.
+    """
+    deltas = defaultdict(Counter)
+    if before is not None:
+        deltas[before[0]].subtract(row_counters(*before[1:]))
+    if after is not None:
+        deltas[after[0]].update(row_counters(*after[1:]))
+    return {
+        campaign_id: {field: value for field, value in delta.items() if value}
+        for campaign_id, delta in deltas.items()
+        if any(delta.values())
+    }
+
+
+def apply_deltas(deltas):
+    """Атомарно прибавляет приращения к счетчикам: UPDATE ... SET x = x + d"""
+    for campaign_id, delta in deltas.items():
+        # .update() не трогает auto_now - время изменения ставим сами
+        updates = {field: F(field) + value for field, value in delta.items()}
+        updates['updated_at'] = timezone.now()
+        if not CampaignStats.objects.filter(campaign_id=campaign_id).update(**updates):
+            # Первая запись по мероприятию: строки счетчиков еще нет
+            CampaignStats.objects.bulk_create([CampaignStats(campaign_id=campaign_id)], ignore_conflicts=True)
+            CampaignStats.objects.filter(campaign_id=campaign_id).update(**updates)
+
+
+def remove_participants(queryset):
+    """Вычитает удаляемых участников из счетчиков (вызывать до удаления, в той же транзакции)"""
+    rows = queryset.values('campaign_id', 'registration_stage', 'is_subscribed').annotate(count=Count('id'))
+    deltas = defaultdict(Counter)
+    for row in rows:
+        for field, value in row_counters(row['registration_stage'], row['is_subscribed']).items():
+            deltas[row['campaign_id']][field] -= value * row['count']
+    apply_deltas(deltas)
+
+
+def count_campaign(campaign_id):
+    """Точные значения счетчиков по таблице участников (индекс participant_stage_idx)"""
+    counters = dict.fromkeys(COUNTER_FIELDS, 0)
+    rows = (
+        Participant.objects.filter(campaign_id=campaign_id)
+        .values('registration_stage')
+        .annotate(total=Count('id'), subscribed=Count('id', filter=Q(is_subscribed=True)))
+        .order_by()
+    )
+    for row in rows:
+        counters['participants'] += row['total']
+        counters['subscribed'] += row['subscribed']
+        if row['registration_stage'] in STAGE_FIELDS:
+            counters[STAGE_FIELDS[row['registration_stage']]] += row['total']
+    return counters
+
+
+def reconcile(campaign_id):
+    """Пересчитывает счетчики мероприятия; возвращает исправленные расхождения {поле: было -> стало}"""
+    with transaction.atomic():
+        stats, _ = CampaignStats.objects.select_for_update().get_or_create(campaign_id=campaign_id)
+        counters = count_campaign(campaign_id)
+        drift = {
+            field: (getattr(stats, field), value)
+            for field, value in counters.items()
+            if getattr(stats, field) != value
+        }
+        if drift:
+            CampaignStats.objects.filter(campaign_id=campaign_id).update(updated_at=timezone.now(), **counters)
+    return drift
+
+
+def funnel(stats):
+    """
+    Воронка регистрации: сколько участников дошли до каждой стадии.
+    Счетчики хранят текущую стадию, поэтому дошедшие - сумма этой и всех следующих.
+    """
+    reached = 0
+    result = []
+    for stage in reversed(FUNNEL_STAGES):
+        reached += getattr(stats, STAGE_FIELDS[stage])
+        result.append((stage, reached))
+    return result[::-1]
@@ -0,0 +1,114 @@
+# campaigns/dedup.py
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import ProcessedUpdate
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """
+    Отсеивает повторно доставленные апдейты по update_id.
+
+    В памяти хранится скользящее окно последних window update_id на бота.
+    Если use_db=True, update_id вебхука дополнительно записываются в таблицу
+    ProcessedUpdate - тогда повторные доставки отсеиваются и между процессами.
+    Записи старше окна периодически удаляются.
+
+    Polling проверяет только память (persistent=False): Telegram не отдает
+    подтвержденные смещением апдейты повторно, а перечитанный после сбоя
+    или --reset-offset бэклог должен обработаться, а не отсеяться по таблице.
+    """
+
+    def __init__(self, window=10000, use_db=False, prune_every=1000):
+        self.window = window
+        self.use_db = use_db
+        self.prune_every = prune_every
+        self._seen = {}
+        self._order = {}
+        self._lock = threading.Lock()
+        self._inserted = 0
+
+        self.duplicates = 0
+
+    def _remember(self, bot_key, update_id):
+        """Отмечает update_id в памяти; False - уже был"""
+        with self._lock:
+            seen = self._seen.setdefault(bot_key, set())
+            if update_id in seen:
+                return False
+            order = self._order.setdefault(bot_key, deque())
+            seen.add(update_id)
+            order.append(update_id)
+            while len(order) > self.window:
+                seen.discard(order.popleft())
+            return True
+
+    def is_duplicate(self, update_id, bot_key='default', persistent=True):
+        """
+        Отмечает апдейт как принятый; True - такой update_id уже был.
+        persistent=False - без таблицы, только окно в памяти
+        """
+        if not self._remember(bot_key, update_id):
+            self.duplicates += 1
+            return True
+        if not (self.use_db and persistent):
+            return False
+
+        try:
+            with transaction.atomic():
+                ProcessedUpdate.objects.create(bot_key=bot_key, update_id=update_id)
+        except IntegrityError:
+            self.duplicates += 1
+            return True
+
+        self._inserted += 1
+        if self._inserted % self.prune_every == 0:
+            self.prune(bot_key, update_id)
+        return False
+
+    def forget(self, update_id, bot_key='default'):
+        """Снимает отметку - апдейт не принят (например, очередь переполнена)"""
+        with self._lock:
+            self._seen.get(bot_key, set()).discard(update_id)
+        if self.use_db:
+            ProcessedUpdate.objects.filter(bot_key=bot_key, update_id=update_id).delete()
+
+    def reset(self, bot_key='default'):
+        """Забывает все update_id бота - апдейты можно перечитать заново"""
+        with self._lock:
+            self._seen.pop(bot_key, None)
+            self._order.pop(bot_key, None)
+        if self.use_db:
+            ProcessedUpdate.objects.filter(bot_key=bot_key).delete()
+
+    def prune(self, bot_key, latest_update_id):
+        """Удаляет из таблицы update_id, вышедшие за окно"""
+        deleted, _ = ProcessedUpdate.objects.filter(
+            bot_key=bot_key,
+            update_id__lt=latest_update_id - self.window,
+        ).delete()
+        if deleted:
+            logger.debug("Pruned %s processed update ids for bot %s", deleted, bot_key)
+
+
+_deduplicator = None
+_deduplicator_lock = threading.Lock()
+
+
+def get_update_deduplicator():
+    """Общий для процесса фильтр повторных апдейтов"""
+    global _deduplicator
+    if _deduplicator is None:
+        with _deduplicator_lock:
+            if _deduplicator is None:
+                _deduplicator = UpdateDeduplicator(
+                    window=getattr(settings, 'UPDATE_DEDUP_WINDOW', 10000),
+                    use_db=getattr(settings, 'UPDATE_DEDUP_DB', False),
+                )
+    return _deduplicator
@@ -0,0 +1,150 @@
+# campaigns/export_jobs.py
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from .exports import participants_csv, write_participants_xlsx
+from .models import ExportJob, Participant
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+
+def campaign_fingerprint(campaign):
+    """
+    Отпечаток данных выгрузки и число участников - одним агрегирующим запросом.
+    Новые и удаленные участники меняют count/max(id), любое изменение
+    участника (имя, телефон, стадия, подписка, билеты) - max(updated_at),
+    розыгрыш - лист победителей.
+    """
+    stats = Participant.objects.filter(campaign_id=campaign.id).aggregate(
+        total=Count('id'),
+        max_id=Max('id'),
+        changed_at=Max('updated_at'),
+        subscribed=Count('id', filter=Q(is_subscribed=True)),
+        tickets=Sum('tickets'),
+    )
+    source = '|'.join(str(value) for value in (
+        stats['total'], stats['max_id'], stats['changed_at'].isoformat() if stats['changed_at'] else '',
+        stats['subscribed'], stats['tickets'],
+        campaign.name, campaign.status, campaign.winners_count,
+        campaign.raffle_date.isoformat() if campaign.raffle_date else '',
+    ))
+    return hashlib.sha256(source.encode()).hexdigest()[:32], stats['total']
+
+
+class ExportJobRunner:
+    """
+    Выполняет выгрузки в фоновом пуле потоков.
+
+    Готовый файл переиспользуется, пока не изменился отпечаток участников
+    мероприятия. Выгрузка, которая уже идет с тем же отпечатком, не
+    запускается второй раз - повторное нажатие возвращает ту же задачу.
+    """
+
+    def __init__(self, workers=2, stale_after=300):
+        self.stale_after = stale_after
+        self._workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='exports')
+        return self._pool
+
+    def request(self, campaign, export_format):
+        """Готовая или уже идущая выгрузка с тем же отпечатком, иначе - новая задача в пуле"""
+        fingerprint, total = campaign_fingerprint(campaign)
+        candidates = ExportJob.objects.filter(
+            campaign=campaign, format=export_format, fingerprint=fingerprint,
+            status__in=('done',) + ACTIVE_STATUSES,
+        )
+        for job in candidates:
+            if job.status == 'done' and job.file and os.path.exists(job.file.path):
+                return job
+            if job.status in ACTIVE_STATUSES and not self._is_stale(job):
+                return job
+
+        job = ExportJob.objects.create(
+            campaign=campaign, format=export_format, fingerprint=fingerprint, total=total,
+        )
+        self.pool.submit(self._run, job.id)
+        logger.info("Export job %s queued: campaign %s, %s", job.id, campaign.slug, export_format)
+        return job
+
+    def _is_stale(self, job):
+        # Прогресс пишется каждые EXPORT_CHUNK_SIZE строк: долгая тишина - процесс выгрузки умер
+        return job.updated_at < timezone.now() - timedelta(seconds=self.stale_after)
+
+    def _run(self, job_id):
+        try:
+            job = ExportJob.objects.select_related('campaign').get(pk=job_id)
+            self._update(job_id, status='running')
+            job.file.name = self._write(job)
+            job.status = 'done'
+            job.progress = job.total
+            job.finished_at = timezone.now()
+            job.save(update_fields=['file', 'status', 'progress', 'finished_at', 'updated_at'])
+            self._remove_outdated(job)
+            logger.info("Export job %s done: %s", job_id, job.file.name)
+        except Exception as e:
+            logger.exception("Export job %s failed", job_id)
+            self._update(job_id, status='failed', error=str(e), finished_at=timezone.now())
+        finally:
+            connection.close()
+
+    def _write(self, job):
+        """Пишет файл во временный в той же папке и атомарно переименовывает"""
+        directory = job.file.storage.location
+        os.makedirs(directory, exist_ok=True)
+        name = f"participants_{job.campaign.slug}_{job.fingerprint[:12]}.{job.format}"
+
+        def progress(written):
+            self._update(job.id, progress=written)
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as fileobj:
+                if job.format == 'xlsx':
+                    write_participants_xlsx(job.campaign, fileobj, progress=progress)
+                else:
+                    for chunk in participants_csv(job.campaign, compress=job.format == 'csv.gz', progress=progress):
+                        fileobj.write(chunk)
+            os.replace(temp_path, os.path.join(directory, name))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return name
+
+    def _update(self, job_id, **fields):
+        ExportJob.objects.filter(pk=job_id).update(updated_at=timezone.now(), **fields)
+
+    def _remove_outdated(self, job):
+        """Старые выгрузки того же формата больше не нужны - удаляем файлы и записи"""
+        outdated = ExportJob.objects.filter(
+            campaign_id=job.campaign_id, format=job.format, created_at__lt=job.created_at,
+        ).exclude(status__in=ACTIVE_STATUSES)
+        for old in outdated:
+            if old.file and old.file.name != job.file.name and os.path.exists(old.file.path):
+                os.unlink(old.file.path)
+        outdated.delete()
+
+
+export_jobs = ExportJobRunner(
+    workers=getattr(settings, 'EXPORT_WORKERS', 2),
+    stale_after=getattr(settings, 'EXPORT_STALE_SECONDS', 300),
+)
@@ -0,0 +1,142 @@
+# campaigns/exports.py
+import csv
+import zlib
+
+from openpyxl import Workbook
+
+from .models import Participant
+
+# Сколько участников читать из курсора БД за раз
+EXPORT_CHUNK_SIZE = 2000
+
+PARTICIPANT_HEADERS = (
+    'ID', 'Telegram ID', 'Username', 'Имя', 'Телефон', 'Подписан на канал', 'Билетов', 'Дата регистрации',
+)
+WINNER_HEADERS = ('Место', 'Приз', 'Имя', 'Телефон', 'Telegram ID')
+
+
+def participant_rows(campaign_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Строки участников для выгрузки: курсор по id, без создания моделей"""
+    rows = (
+        Participant.objects.filter(campaign_id=campaign_id)
+        .order_by('id')
+        .values_list('id', 'telegram_id', 'username', 'first_name', 'phone', 'is_subscribed', 'tickets', 'created_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    for pk, telegram_id, username, first_name, phone, is_subscribed, tickets, created_at in rows:
+        yield (
+            pk,
+            telegram_id,
+            username or 'Не указан',
+            first_name,
+            phone,
+            'Да' if is_subscribed else 'Нет',
+            tickets,
+            created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        )
+
+
+def winner_rows(campaign):
+    for winner in campaign.winners or []:
+        yield (
+            winner.get('place', ''),
+            winner.get('tier', ''),
+            winner.get('name', ''),
+            winner.get('phone', ''),
+            winner.get('telegram_id', ''),
+        )
+
+
+def info_rows(campaign, participants_count):
+    return (
+        ('Название', campaign.name),
+        ('Статус', campaign.get_status_display()),
+        ('Количество участников', participants_count),
+        ('Количество победителей', campaign.winners_count),
+        ('Дата розыгрыша', campaign.raffle_date.strftime('%Y-%m-%d %H:%M:%S') if campaign.raffle_date else 'Не проводился'),
+    )
+
+
+def write_participants_xlsx(campaign, fileobj, progress=None):
+    """
+    Пишет книгу Excel в fileobj в режиме write-only openpyxl: строки сразу
+    уходят на диск, память не растет с числом участников.
+    progress(written) вызывается после каждой пачки строк.
+    """
+    workbook = Workbook(write_only=True)
+
+    sheet = workbook.create_sheet('Участники')
+    sheet.append(PARTICIPANT_HEADERS)
+    written = 0
+    for row in participant_rows(campaign.id):
+        sheet.append(row)
+        written += 1
+        if progress is not None and written % EXPORT_CHUNK_SIZE == 0:
+            progress(written)
+    if not written:
+        sheet.append(('Нет участников',))
+
+    sheet = workbook.create_sheet('Победители')
+    if campaign.winners:
+        sheet.append(WINNER_HEADERS)
+        for row in winner_rows(campaign):
+            sheet.append(row)
+    else:
+        sheet.append(('Розыгрыш еще не проводился',))
+
+    sheet = workbook.create_sheet('Информация')
+    sheet.append(('Параметр', 'Значение'))
+    for row in info_rows(campaign, written):
+        sheet.append(row)
+
+    workbook.save(fileobj)
+    if progress is not None:
+        progress(written)
+    return written
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: write() возвращает строку, а не пишет ее"""
+
+    def write(self, value):
+        return value
+
+
+def participants_csv(campaign, compress=False, progress=None):
+    """
+    CSV участников по кускам для StreamingHttpResponse.
+    compress=True - тот же поток, сжатый gzip на лету.
+    progress(written) вызывается после каждой пачки строк.
+    """
+    writer = csv.writer(_Echo())
+
+    def lines():
+        # BOM - чтобы Excel открыл UTF-8 с кириллицей без мастера импорта
+        yield '\ufeff' + writer.writerow(PARTICIPANT_HEADERS)
+        buffer = []
+        written = 0
+        for row in participant_rows(campaign.id):
+            buffer.append(writer.writerow(row))
+            if len(buffer) >= EXPORT_CHUNK_SIZE:
+                written += len(buffer)
+                yield ''.join(buffer)
+                buffer = []
+                if progress is not None:
+                    progress(written)
+        if buffer:
+            written += len(buffer)
+            yield ''.join(buffer)
+        if progress is not None:
+            progress(written)
+
+    if not compress:
+        for chunk in lines():
+            yield chunk.encode('utf-8')
+        return
+
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in lines():
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,84 @@
+# campaigns/logging_utils.py
+import json
+import logging
+import random
+import re
+
+# Телефоны: +7 999 123-45-67, 89991234567, +79991234567 и т.п.
+PHONE_RE = re.compile(r'\+?\d[\d\s\-()]{8,}\d')
+# Поля апдейта, которые нельзя писать в лог как есть
+PII_KEYS = ('phone_number', 'phone', 'first_name', 'last_name', 'username')
+
+REDACTED = '***'
+
+# Стандартные атрибуты LogRecord - все остальное пришло через extra
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def redact_text(text):
+    """Маскирует номера телефонов в строке"""
+    return PHONE_RE.sub(REDACTED, text)
+
+
+def redact_update(value):
+    """Копия апдейта с замаскированными персональными данными"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if key in PII_KEYS and value[key] else redact_update(value[key])
+            for key in value
+        }
+    if isinstance(value, list):
+        return [redact_update(item) for item in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+class LazyJson:
+    """Сериализуется в JSON только если запись действительно попадет в лог"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(redact_update(self.value), ensure_ascii=False)
+
+
+def should_dump_update(logger):
+    """Выборка апдейтов для полного дампа на уровне DEBUG"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    from django.conf import settings
+    rate = getattr(settings, 'LOG_UPDATE_SAMPLE_RATE', 0.01)
+    return rate >= 1 or random.random() < rate
+
+
+class PiiRedactingFilter(logging.Filter):
+    """Маскирует телефоны в тексте записи (после подстановки аргументов)"""
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = redact_text(message)
+        if redacted != message:
+            record.msg = redacted
+            record.args = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON; поля из extra попадают в запись как есть"""
+
+    def format(self, record):
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
@@ -0,0 +1,58 @@
+import secrets
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from campaigns.models import Campaign
+from campaigns.raffle import load_entrants, numpy_rng, weighted_order
+
+
+class Command(BaseCommand):
+    help = 'Замер взвешенного розыгрыша призов по уровням (синтетические участники или реальное мероприятие)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entrants', type=int, default=5_000_000, help='Число синтетических участников')
+        parser.add_argument('--max-tickets', type=int, default=5, help='Билетов у участника: от 1 до этого числа')
+        parser.add_argument('--tiers', default='1,10,100', help='Число призов каждого уровня через запятую')
+        parser.add_argument('--repeat', type=int, default=5, help='Сколько раз повторить розыгрыш')
+        parser.add_argument('--campaign', help='Slug мероприятия: участники загружаются из БД')
+
+    def handle(self, *args, **options):
+        winners = sum(int(count) for count in options['tiers'].split(','))
+
+        started = time.perf_counter()
+        if options['campaign']:
+            try:
+                campaign = Campaign.objects.get(slug=options['campaign'])
+            except Campaign.DoesNotExist:
+                raise CommandError(f"Мероприятие '{options['campaign']}' не найдено")
+            ids, weights = load_entrants(campaign.id)
+            source = f"мероприятие {campaign.slug}"
+        else:
+            rng = np.random.default_rng()
+            ids = np.arange(1, options['entrants'] + 1, dtype=np.int64)
+            weights = rng.integers(1, options['max_tickets'] + 1, size=options['entrants']).astype(np.float64)
+            source = 'синтетические участники'
+        load_seconds = time.perf_counter() - started
+
+        memory_mb = (ids.nbytes + weights.nbytes) / 2 ** 20
+        self.stdout.write(
+            f"{source}: {len(ids)} участников, {int(weights.sum())} билетов, "
+            f"массивы {memory_mb:.1f} МБ, загрузка {load_seconds:.2f} с"
+        )
+        if len(ids) < winners:
+            raise CommandError(f'Участников меньше, чем призов ({winners})')
+
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            order = weighted_order(weights, winners, numpy_rng(secrets.token_hex(16)))
+            chosen = ids[order]
+            timings.append(time.perf_counter() - started)
+
+        assert len(np.unique(chosen)) == winners
+        self.stdout.write(
+            f"Розыгрыш {winners} призов: лучший {min(timings) * 1000:.0f} мс, "
+            f"медиана {sorted(timings)[len(timings) // 2] * 1000:.0f} мс, худший {max(timings) * 1000:.0f} мс"
+        )
@@ -0,0 +1,138 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from campaigns.bot_api import OfflineBotApiClient, set_bot_api
+from campaigns.campaign_cache import CampaignSnapshot
+from campaigns.models import Campaign, Participant
+from campaigns.registration_state import DURABILITY_SYNC, registration_store
+from campaigns.telegram_handlers import get_update_user_id, process_update, process_updates_batch
+from campaigns.update_executor import UpdateExecutor
+
+
+class QueryCounter:
+    """execute_wrapper, считающий запросы к БД из всех потоков"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Сравнение обработки апдейтов по одному и пачками (без обращений к Telegram)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Число синтетических пользователей')
+        parser.add_argument('--batch-size', type=int, default=100, help='Апдейтов в пачке (как limit у getUpdates)')
+        parser.add_argument('--workers', type=int, default=8, help='Потоков исполнителя')
+
+    def handle(self, *args, **options):
+        # Черновик не виден боту: живой трафик в мероприятие бенчмарка не попадет
+        campaign = Campaign.objects.create(
+            name='Benchmark',
+            slug=f'benchmark-{uuid.uuid4().hex[:12]}',
+            channel_usernames='@benchmark',
+        )
+        snapshot = CampaignSnapshot.from_values(
+            {field: getattr(campaign, field) for field in CampaignSnapshot.FIELDS}
+        )
+        bot_api = OfflineBotApiClient()
+        previous_bot_api = set_bot_api(bot_api)
+        durability = registration_store.durability
+        try:
+            results = [
+                self.run(snapshot, options, DURABILITY_SYNC, batched=False, id_base=1),
+                self.run(snapshot, options, durability, batched=True, id_base=10 ** 9),
+            ]
+        finally:
+            registration_store.durability = durability
+            registration_store.clear()
+            set_bot_api(previous_bot_api)
+            campaign.delete()
+
+        self.stdout.write(f"Пользователей: {options['users']}, вызовов Bot API: {sum(bot_api.calls.values())}")
+        for result in results:
+            self.stdout.write(
+                f"{result['mode']:>13}: {result['updates']} апдейтов за {result['seconds']:.2f} с "
+                f"({result['updates'] / result['seconds']:.0f}/с), запросов к БД: {result['queries']} "
+                f"({result['queries'] / result['updates']:.2f} на апдейт), завершили: {result['completed']}"
+            )
+
+    def run(self, campaign, options, durability, batched, id_base):
+        Participant.objects.filter(campaign_id=campaign.id).delete()
+        registration_store.clear()
+        # По одному - как раньше: каждое изменение сразу пишется в БД
+        registration_store.durability = durability
+
+        counter = QueryCounter()
+
+        def handler(update):
+            with connection.execute_wrapper(counter):
+                process_update(update, campaign)
+
+        executor = UpdateExecutor(handler, workers=options['workers'], name='benchmark')
+        updates = list(self.make_updates(options['users'], campaign, id_base))
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            if batched:
+                for index in range(0, len(updates), options['batch_size']):
+                    process_updates_batch(updates[index:index + options['batch_size']], campaign, executor)
+            else:
+                for update in updates:
+                    executor.submit(get_update_user_id(update), update, timeout=None)
+                executor.join()
+                registration_store.flush()
+        seconds = time.perf_counter() - started
+        executor.shutdown()
+
+        return {
+            'mode': 'пачками' if batched else 'по одному',
+            'updates': len(updates),
+            'seconds': seconds,
+            'queries': counter.count,
+            'completed': Participant.objects.filter(
+                campaign_id=campaign.id, registration_stage='completed'
+            ).count(),
+        }
+
+    def make_updates(self, users, campaign, id_base):
+        """Полная регистрация каждого пользователя: /start, имя, телефон, проверка подписки"""
+        update_id = id_base
+        steps = (
+            lambda user_id: {'message': self.message(user_id, '/start')},
+            lambda user_id: {'message': self.message(user_id, f'User {user_id}')},
+            # Телефон - контактом: у текстового ввода условия уходят с задержкой через планировщик
+            lambda user_id: {'message': dict(
+                self.message(user_id, ''), contact={'phone_number': f'+7999{user_id % 10 ** 7:07d}'}
+            )},
+            lambda user_id: {'callback_query': {
+                'id': str(user_id),
+                'from': {'id': user_id},
+                'data': 'check_subscription',
+                'message': {'message_id': 1, 'chat': {'id': user_id}},
+            }},
+        )
+        # Как в живом трафике: пользователи проходят шаги вперемешку
+        for step in steps:
+            for user_id in range(1, users + 1):
+                update_id += 1
+                update = step(user_id)
+                update['update_id'] = update_id
+                yield update
+
+    def message(self, user_id, text):
+        return {
+            'message_id': 1,
+            'from': {'id': user_id, 'first_name': 'Bench', 'username': f'bench{user_id}'},
+            'chat': {'id': user_id},
+            'text': text,
+        }
@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from campaigns.models import Campaign, Participant
+from campaigns.registration_state import STATE_FIELDS
+
+
+def participant_indexes():
+    """Индексы таблицы участников: имя -> (колонки, уникальный)"""
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, Participant._meta.db_table)
+    return {
+        name: (tuple(info['columns']), info['unique'])
+        for name, info in constraints.items()
+        if info['index'] or info['unique']
+    }
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN горячих запросов к участникам: проверка, что каждый идет по ожидаемому индексу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campaign', type=int, help='ID мероприятия (по умолчанию - последнее)')
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (запрос действительно выполняется)')
+        parser.add_argument('--verbose-plan', action='store_true', help='Печатать план каждого запроса целиком')
+
+    def handle(self, *args, **options):
+        campaign_id = options['campaign'] or Campaign.objects.order_by('-id').values_list('id', flat=True).first()
+        if campaign_id is None:
+            raise CommandError('Нет мероприятий')
+
+        telegram_id = (
+            Participant.objects.filter(campaign_id=campaign_id).values_list('telegram_id', flat=True).first() or 0
+        )
+        indexes = participant_indexes()
+        # Индекс уникальности (campaign, telegram_id) создан unique_together - имя генерируется Django
+        lookup_indexes = [
+            name for name, (columns, unique) in indexes.items()
+            if unique and columns == ('campaign_id', 'telegram_id')
+        ]
+        # Любой индекс, начинающийся с campaign_id (в том числе индекс внешнего ключа)
+        campaign_indexes = [name for name, (columns, _) in indexes.items() if columns[:1] == ('campaign_id',)]
+
+        hot_queries = [
+            (
+                'Состояние регистрации (telegram_handlers / registration_state)',
+                Participant.objects.filter(campaign_id=campaign_id, telegram_id=telegram_id)
+                .only('campaign_id', 'telegram_id', *STATE_FIELDS)[:1],
+                lookup_indexes,
+            ),
+            (
+                'Prefetch пачки апдейтов',
+                Participant.objects.filter(campaign_id=campaign_id, telegram_id__in=[telegram_id, telegram_id + 1])
+                .only('campaign_id', 'telegram_id', *STATE_FIELDS),
+                lookup_indexes,
+            ),
+            (
+                'Участники мероприятия (admin.participants_count)',
+                Participant.objects.filter(campaign_id=campaign_id).values('pk'),
+                campaign_indexes,
+            ),
+            (
+                'Подписанные участники (raffle, admin.start_raffle)',
+                Participant.objects.filter(campaign_id=campaign_id, is_subscribed=True)
+                .order_by('id').values_list('id', flat=True),
+                ['participant_subscribed_idx'],
+            ),
+            (
+                'Участники на стадии регистрации (воронка)',
+                Participant.objects.filter(campaign_id=campaign_id, registration_stage='completed').values('pk'),
+                ['participant_stage_idx'],
+            ),
+        ]
+
+        rows = Participant.objects.filter(campaign_id=campaign_id).count()
+        self.stdout.write(f"Мероприятие {campaign_id}, участников: {rows}, БД: {connection.vendor}")
+        explain_options = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+
+        missed = 0
+        for title, queryset, expected in hot_queries:
+            plan = queryset.explain(**explain_options)
+            used = next((name for name in expected if name in plan), None)
+            missed += used is None
+            if used:
+                self.stdout.write(f"[{self.style.SUCCESS('OK')}] {title}: {used}")
+            else:
+                self.stdout.write(
+                    f"[{self.style.ERROR('НЕТ ИНДЕКСА')}] {title}: ожидается {', '.join(expected) or '(индекс не найден)'}"
+                )
+            if options['verbose_plan'] or used is None:
+                self.stdout.write('    ' + plan.replace('\n', '\n    '))
+
+        if missed:
+            # На маленькой таблице планировщик законно выбирает Seq Scan - проверять на реальном объеме
+            self.stdout.write(self.style.WARNING(
+                f"Запросов без ожидаемого индекса: {missed}. "
+                f"Если таблица маленькая, выполните ANALYZE и проверьте на объеме от 1M строк."
+            ))
+            raise CommandError('Горячие запросы идут мимо индексов')
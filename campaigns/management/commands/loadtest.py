@@ -0,0 +1,226 @@
+import itertools
+import json
+import math
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from campaigns.bot_api import BotApiClient, set_bot_api
+from campaigns.bot_api_stub import BotApiStub
+from campaigns.models import Campaign, Participant
+from campaigns.outbound import scheduler
+from campaigns.rate_limit import RateLimiter, RetryQueue
+from campaigns.registration_state import registration_store
+from campaigns.telegram_handlers import telegram_webhook
+from campaigns.update_executor import get_update_executor
+
+STEPS = ('start', 'name', 'contact', 'check_subscription')
+
+
+def percentile(values, q):
+    """Перцентиль по ближайшему рангу (values отсортированы)"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест вебхука: N виртуальных пользователей проходят регистрацию '
+        '(/start, имя, контакт, проверка подписки) против локальной заглушки Bot API'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help='Число виртуальных пользователей')
+        parser.add_argument('--concurrency', type=int, default=50, help='Сколько пользователей регистрируются одновременно')
+        parser.add_argument('--api-latency', type=float, default=50, help='Задержка ответа заглушки Bot API, мс')
+        parser.add_argument('--api-jitter', type=float, default=0, help='Случайная добавка к задержке, мс (0..jitter)')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Доля вызовов Bot API, отвечающих 500')
+        parser.add_argument('--channels', type=int, default=2, help='Каналов для проверки подписки')
+        parser.add_argument('--step-timeout', type=float, default=30, help='Сколько ждать ответа бота на шаг, с')
+        parser.add_argument('--telegram-limits', action='store_true',
+                            help='Ограничивать вызовы как у бота в работе (BOT_API_GLOBAL_RATE, BOT_API_CHAT_RATE)')
+        parser.add_argument('--url', help='Слать апдейты HTTP POST на запущенный сервер вместо вызова в процессе')
+        parser.add_argument('--stub-port', type=int, default=0,
+                            help='Порт заглушки (для --url: сервер запускается с TELEGRAM_API_BASE на эту заглушку)')
+        parser.add_argument('--keep', action='store_true', help='Не удалять мероприятие и участников после теста')
+
+    def handle(self, *args, **options):
+        running = Campaign.objects.filter(status='active', bot_is_running=True)
+        if running.exists():
+            # Тестовое мероприятие стало бы одним из запущенных и получило бы часть живого трафика
+            raise CommandError(
+                f"Запущены мероприятия: {', '.join(running.values_list('slug', flat=True))}. "
+                f"Нагрузочный тест проводится на отдельной базе"
+            )
+
+        stub = BotApiStub(
+            port=options['stub_port'],
+            latency=options['api_latency'] / 1000,
+            jitter=options['api_jitter'] / 1000,
+            error_rate=options['error_rate'],
+        ).start()
+        campaign = Campaign.objects.create(
+            name='Load test',
+            slug=f'loadtest-{uuid.uuid4().hex[:12]}',
+            status='active',
+            bot_is_running=True,
+            channel_usernames=' '.join(f'@loadtest{index}' for index in range(options['channels'])),
+        )
+        previous_bot_api = None
+        if not options['url']:
+            previous_bot_api = set_bot_api(self.make_client(stub, options))
+        else:
+            self.stdout.write(f"Заглушка Bot API: {stub.url} (сервер должен работать с TELEGRAM_API_BASE={stub.url})")
+
+        try:
+            report = self.run(campaign, stub, options)
+        finally:
+            if not options['url']:
+                set_bot_api(previous_bot_api)
+            stub.stop()
+            campaign.status = 'finished'
+            campaign.bot_is_running = False
+            campaign.save(update_fields=['status', 'bot_is_running'])
+            if not options['keep']:
+                campaign.delete()
+        self.print_report(report, stub, options)
+
+    def make_client(self, stub, options):
+        rate_limiter = None
+        if options['telegram_limits']:
+            rate_limiter = RateLimiter(
+                global_rate=getattr(settings, 'BOT_API_GLOBAL_RATE', 30),
+                chat_rate=getattr(settings, 'BOT_API_CHAT_RATE', 1),
+                max_wait=getattr(settings, 'BOT_API_MAX_WAIT', 5.0),
+            )
+        return BotApiClient(
+            'LOADTEST',
+            api_base=stub.url,
+            pool_size=getattr(settings, 'UPDATE_WORKERS', 8) + 4,
+            rate_limiter=rate_limiter,
+            retry_queue=RetryQueue(max_attempts=getattr(settings, 'BOT_API_MAX_RETRIES', 3)),
+        )
+
+    # 🔹 Виртуальные пользователи
+
+    def run(self, campaign, stub, options):
+        update_ids = itertools.count(int(time.time() * 1000) % 10 ** 12)
+        user_base = 7 * 10 ** 9
+        latencies = {step: [] for step in STEPS}
+        stats = Counter()
+        lock = threading.Lock()
+        factory = RequestFactory()
+        session = requests.Session()
+
+        def post(update):
+            body = json.dumps(update)
+            while True:
+                if options['url']:
+                    response = session.post(options['url'], data=body, headers={'Content-Type': 'application/json'})
+                    status, retry_after = response.status_code, response.headers.get('Retry-After')
+                else:
+                    response = telegram_webhook(factory.post('/campaigns/telegram/', body, content_type='application/json'))
+                    status, retry_after = response.status_code, response.get('Retry-After')
+                if status != 429:
+                    return status
+                # Как Telegram: повторная доставка после Retry-After
+                with lock:
+                    stats['webhook_429'] += 1
+                time.sleep(float(retry_after or 1))
+
+        def virtual_user(index):
+            user_id = user_base + index
+            sender = {'id': user_id, 'first_name': f'Load{index}', 'username': f'load{index}'}
+            updates = {
+                'start': {'message': {'message_id': 1, 'from': sender, 'chat': {'id': user_id},
+                                      'text': f'/start {campaign.slug}'}},
+                'name': {'message': {'message_id': 2, 'from': sender, 'chat': {'id': user_id},
+                                     'text': f'Load User {index}'}},
+                'contact': {'message': {'message_id': 3, 'from': sender, 'chat': {'id': user_id},
+                                        'contact': {'phone_number': f'+7999{index % 10 ** 7:07d}'}}},
+                'check_subscription': {'callback_query': {
+                    'id': str(user_id), 'from': sender, 'data': 'check_subscription',
+                    'message': {'message_id': 4, 'chat': {'id': user_id}},
+                }},
+            }
+            for step in STEPS:
+                update = dict(updates[step], update_id=next(update_ids))
+                before = stub.chat_calls(user_id)
+                started = time.perf_counter()
+                status = post(update)
+                if status != 200:
+                    with lock:
+                        stats[f'webhook_{status}'] += 1
+                    return
+                # Ответ бота пользователю - признак того, что шаг обработан
+                if not stub.wait_for_chat(user_id, before, options['step_timeout']):
+                    with lock:
+                        stats['timeouts'] += 1
+                    return
+                with lock:
+                    latencies[step].append(time.perf_counter() - started)
+                    stats['updates'] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency'], thread_name_prefix='virtual-user') as pool:
+            list(pool.map(virtual_user, range(options['users'])))
+        seconds = time.perf_counter() - started
+        session.close()
+
+        if not options['url']:
+            # Дожидаемся хвоста: последние ответы бота (editMessageText) и отложенные отправки
+            get_update_executor().join()
+            deadline = time.monotonic() + options['step_timeout']
+            while scheduler.pending() and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+        registration_store.flush()
+        completed = Participant.objects.filter(campaign=campaign, registration_stage='completed').count()
+        return {'seconds': seconds, 'latencies': latencies, 'stats': stats, 'completed': completed}
+
+    # 🔹 Отчет
+
+    def print_report(self, report, stub, options):
+        seconds = report['seconds']
+        stats = report['stats']
+        completed = report['completed']
+        self.stdout.write(
+            f"Пользователей: {options['users']} (одновременно {options['concurrency']}), "
+            f"Bot API: {options['api_latency']:.0f} мс, ошибок {options['error_rate']:.1%}"
+        )
+        self.stdout.write(
+            f"Апдейтов: {stats['updates']} за {seconds:.2f} с ({stats['updates'] / seconds:.0f}/с), "
+            f"регистраций завершено: {completed} ({completed / seconds:.1f}/с)"
+        )
+        problems = {key: value for key, value in stats.items() if key != 'updates'}
+        if problems:
+            self.stdout.write(self.style.WARNING(f"Проблемы: {dict(problems)}"))
+
+        self.stdout.write(f"{'шаг':>20} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (мс)")
+        all_latencies = []
+        for step, values in list(report['latencies'].items()) + [('все шаги', None)]:
+            if values is None:
+                values = all_latencies
+            else:
+                all_latencies.extend(values)
+            values = sorted(values)
+            self.stdout.write(
+                f"{step:>20} " + ' '.join(
+                    f"{percentile(values, q) * 1000:8.1f}" for q in (50, 95, 99)
+                ) + f" {(values[-1] if values else 0) * 1000:8.1f}"
+            )
+
+        total_calls = sum(stub.calls.values())
+        per_registration = total_calls / completed if completed else 0
+        self.stdout.write(f"Вызовов Bot API: {total_calls}, на завершенную регистрацию: {per_registration:.2f}")
+        for method, count in stub.calls.most_common():
+            errors = f", ошибок {stub.errors[method]}" if stub.errors[method] else ''
+            self.stdout.write(f"  {method}: {count} ({count / completed if completed else 0:.2f} на регистрацию{errors})")
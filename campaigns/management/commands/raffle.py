@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from campaigns.models import Campaign
+from campaigns.raffle import RaffleError, run_raffle, verify_raffle
+
+
+class Command(BaseCommand):
+    help = 'Провести розыгрыш среди участников мероприятия'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_slug', type=str, help='Slug мероприятия')
+        parser.add_argument('--winners', type=int, help='Количество победителей одним призом (по умолчанию - призы мероприятия)')
+        parser.add_argument('--seed', help='Зерно генератора (по умолчанию - криптографически случайное)')
+        parser.add_argument('--verify', action='store_true', help='Проверить проведенный розыгрыш по сохраненному seed')
+
+    def handle(self, *args, **options):
+        try:
+            campaign = Campaign.objects.get(slug=options['campaign_slug'])
+        except Campaign.DoesNotExist:
+            raise CommandError(f"Мероприятие '{options['campaign_slug']}' не найдено")
+
+        try:
+            if options['verify']:
+                if not verify_raffle(campaign):
+                    raise CommandError('Победители не совпадают с розыгрышем по сохраненному seed')
+                self.stdout.write(f"Розыгрыш подтвержден (seed {campaign.raffle_seed})")
+                return
+
+            self.stdout.write(f"РОЗЫГРЫШ для мероприятия: {campaign.name}")
+            result = run_raffle(campaign.id, options['winners'], options['seed'])
+        except RaffleError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Участников: {result.pool_size}")
+        for winner in result.winners:
+            tier = f" [{winner['tier']}]" if winner['tier'] else ''
+            self.stdout.write(f"{winner['place']}.{tier} {winner['name']} - {winner['phone']} (@{winner['username']})")
+        self.stdout.write(f"РОЗЫГРЫШ завершен! Победители сохранены в базу (seed {result.seed}).")
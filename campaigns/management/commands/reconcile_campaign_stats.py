@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from campaigns.campaign_stats import reconcile
+from campaigns.models import Campaign
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитать счетчики воронки мероприятий по таблице участников и исправить расхождения. '
+        'Запускать после массовых изменений участников в обход бота и админки (SQL, скрипты, импорт)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_slugs', nargs='*', help='Slug мероприятий (по умолчанию - все)')
+
+    def handle(self, *args, **options):
+        campaigns = Campaign.objects.order_by('id')
+        if options['campaign_slugs']:
+            campaigns = campaigns.filter(slug__in=options['campaign_slugs'])
+            missing = set(options['campaign_slugs']) - set(campaigns.values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f"Мероприятия не найдены: {', '.join(sorted(missing))}")
+
+        repaired = 0
+        for campaign in campaigns:
+            drift = reconcile(campaign.id)
+            if not drift:
+                continue
+            repaired += 1
+            changes = ', '.join(f"{field}: {old} -> {new}" for field, (old, new) in drift.items())
+            self.stdout.write(self.style.WARNING(f"{campaign.slug}: {changes}"))
+
+        self.stdout.write(f"Проверено мероприятий: {campaigns.count()}, исправлено: {repaired}")
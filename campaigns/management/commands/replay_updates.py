@@ -0,0 +1,192 @@
+import heapq
+import math
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from campaigns.bot_api import BotApiClient, OfflineBotApiClient, set_bot_api
+from campaigns.bot_api_stub import BotApiStub
+from campaigns.campaign_cache import CampaignSnapshot
+from campaigns.dedup import get_update_deduplicator
+from campaigns.models import Campaign
+from campaigns.outbound import scheduler
+from campaigns.registration_state import registration_store
+from campaigns.telegram_handlers import get_update_user_id, process_update
+from campaigns.update_capture import read_segment, segment_paths
+from campaigns.update_executor import UpdateExecutor
+
+
+def percentile(values, q):
+    """Перцентиль по ближайшему рангу (values отсортированы)"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Воспроизвести записанный трафик (сегменты UPDATE_CAPTURE_DIR) через обработчики '
+        'с исходными интервалами между апдейтами. Запускать только на тестовой базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('segments', nargs='+', help='Файлы сегментов *.ndjson.gz или каталоги с ними')
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help='Ускорение: 1 - реальное время, 10 - в 10 раз быстрее, 0 - без пауз')
+        parser.add_argument('--campaign', help='Slug мероприятия: все апдейты направляются в него')
+        parser.add_argument('--bot-key', help='Обрабатывать все апдейты от имени этого бота')
+        parser.add_argument('--api-latency', type=float, default=0,
+                            help='Задержка заглушки Bot API, мс (0 - клиент без сети, без задержек)')
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'UPDATE_WORKERS', 8), help='Потоков исполнителя')
+        parser.add_argument('--keep-update-ids', action='store_true',
+                            help='Не сдвигать update_id (повторный replay тех же апдейтов отсеется как дубликаты)')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Не спрашивать подтверждение')
+
+    def handle(self, *args, **options):
+        if options['speed'] < 0:
+            raise CommandError('--speed не может быть отрицательным')
+        paths = segment_paths(options['segments'])
+        if not paths:
+            raise CommandError('Сегменты не найдены')
+
+        campaign = None
+        if options['campaign']:
+            try:
+                campaign = Campaign.objects.get(slug=options['campaign'])
+            except Campaign.DoesNotExist:
+                raise CommandError(f"Мероприятие '{options['campaign']}' не найдено")
+            campaign = CampaignSnapshot.from_values(
+                {field: getattr(campaign, field) for field in CampaignSnapshot.FIELDS}
+            )
+
+        if options['interactive']:
+            answer = input(
+                f"Апдейты будут обработаны и записаны в базу {connection.settings_dict['NAME']!r}. "
+                f"Это тестовая база? Введите 'yes': "
+            )
+            if answer != 'yes':
+                raise CommandError('Отменено')
+
+        stub = None
+        if options['api_latency'] > 0:
+            stub = BotApiStub(latency=options['api_latency'] / 1000).start()
+            bot_api = BotApiClient('REPLAY', api_base=stub.url, pool_size=options['workers'] + 4)
+        else:
+            bot_api = OfflineBotApiClient()
+
+        self.durations = []
+        self.executors = {}
+        self.previous_clients = {}
+        try:
+            report = self.replay(paths, campaign, bot_api, options)
+        finally:
+            for executor in self.executors.values():
+                executor.shutdown()
+            for bot_key, previous in self.previous_clients.items():
+                set_bot_api(previous, bot_key)
+            if stub is not None:
+                stub.stop()
+
+        calls = stub.calls if stub is not None else bot_api.calls
+        self.print_report(report, calls, options)
+
+    def executor_for(self, bot_key, campaign, bot_api, options):
+        """Свой исполнитель на бота: апдейты пользователя обрабатываются по порядку, как в вебхуке"""
+        executor = self.executors.get(bot_key)
+        if executor is None:
+            self.previous_clients[bot_key] = set_bot_api(bot_api, bot_key)
+
+            def handler(update):
+                started = time.perf_counter()
+                try:
+                    process_update(update, campaign, bot_key=bot_key)
+                finally:
+                    self.durations.append(time.perf_counter() - started)
+
+            executor = self.executors[bot_key] = UpdateExecutor(
+                handler, workers=options['workers'], queue_size=10000, name=f'replay-{bot_key}',
+            )
+        return executor
+
+    def replay(self, paths, campaign, bot_api, options):
+        # Сегменты разных воркеров идут параллельно - сливаем их по времени приема
+        records = heapq.merge(*(read_segment(path) for path in paths), key=lambda record: record['ts'])
+        deduplicator = get_update_deduplicator()
+        update_id_offset = 0 if options['keep_update_ids'] else int(time.time() * 1000) * 1000
+        stats = Counter()
+        max_lag = 0.0
+        first_ts = last_ts = None
+
+        started = time.perf_counter()
+        for record in records:
+            if first_ts is None:
+                first_ts = record['ts']
+            last_ts = record['ts']
+            if options['speed']:
+                delay = started + (record['ts'] - first_ts) / options['speed'] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+
+            stats['records'] += 1
+            update = dict(record['update'], update_id=record['update']['update_id'] + update_id_offset)
+            bot_key = options['bot_key'] or record['bot']
+            user_id = get_update_user_id(update)
+            if user_id is None:
+                stats['ignored'] += 1
+                continue
+            # Повторные доставки Telegram записаны тоже - отсеиваем, как вебхук
+            if deduplicator.is_duplicate(update['update_id'], bot_key):
+                stats['duplicates'] += 1
+                continue
+            self.executor_for(bot_key, campaign, bot_api, options).submit(user_id, update, timeout=None)
+            stats['replayed'] += 1
+        submitted = time.perf_counter() - started
+
+        for executor in self.executors.values():
+            executor.join()
+        registration_store.flush()
+        while scheduler.pending():
+            time.sleep(0.05)
+
+        return {
+            'stats': stats,
+            'span': (last_ts - first_ts) if first_ts is not None else 0.0,
+            'submitted': submitted,
+            'seconds': time.perf_counter() - started,
+            'max_lag': max_lag,
+            'segments': len(paths),
+        }
+
+    def print_report(self, report, calls, options):
+        stats = report['stats']
+        seconds = report['seconds']
+        span = report['span']
+        self.stdout.write(
+            f"Сегментов: {report['segments']}, записей: {stats['records']}, обработано: {stats['replayed']}, "
+            f"дубликатов: {stats['duplicates']}, пропущено: {stats['ignored']}"
+        )
+        speed = f"x{options['speed']:g}" if options['speed'] else 'без пауз'
+        self.stdout.write(
+            f"Исходный интервал: {span:.1f} с, воспроизведение ({speed}): {seconds:.1f} с, "
+            f"{stats['replayed'] / seconds if seconds else 0:.0f} апдейтов/с"
+        )
+        if options['speed']:
+            # Отставание от расписания: обработчики или отправка апдейтов не успевали за трафиком
+            self.stdout.write(f"Максимальное отставание от расписания: {report['max_lag'] * 1000:.0f} мс")
+
+        durations = sorted(self.durations)
+        self.stdout.write(
+            'Обработка апдейта: ' + ', '.join(
+                f"p{q} {percentile(durations, q) * 1000:.1f} мс" for q in (50, 95, 99)
+            ) + f", max {(durations[-1] if durations else 0) * 1000:.1f} мс"
+        )
+        self.stdout.write(
+            f"Вызовов Bot API: {sum(calls.values())} ("
+            + ', '.join(f"{method}: {count}" for method, count in calls.most_common()) + ')'
+        )
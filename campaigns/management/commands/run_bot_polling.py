@@ -0,0 +1,114 @@
+import signal
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from campaigns.bot_api import DEFAULT_BOT_KEY, UnknownBot, get_bot_api
+from campaigns.dedup import get_update_deduplicator
+from campaigns.models import PollingState
+from campaigns.registration_state import registration_store
+from campaigns.telegram_handlers import process_updates_batch
+from campaigns.update_executor import get_update_executor
+
+ALLOWED_UPDATES = ['message', 'callback_query']
+# Пауза после сетевой ошибки getUpdates: удваивается до максимума
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+
+
+class Command(BaseCommand):
+    help = 'Получение апдейтов через long polling (getUpdates) вместо вебхука'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help='Апдейтов за один getUpdates (1-100)')
+        parser.add_argument('--timeout', type=int, default=50, help='Таймаут long polling, секунд')
+        parser.add_argument('--bot-key', default=DEFAULT_BOT_KEY, help='Ключ бота (модель Bot); по умолчанию - бот из BOT_TOKEN')
+        parser.add_argument('--once', action='store_true', help='Обработать накопившиеся апдейты и выйти')
+        parser.add_argument('--reset-offset', action='store_true', help='Начать с самых старых доступных апдейтов')
+
+    def handle(self, *args, **options):
+        limit = max(1, min(100, options['limit']))
+        timeout = options['timeout']
+        bot_key = options['bot_key']
+        try:
+            bot_api = get_bot_api(bot_key)
+        except UnknownBot:
+            raise CommandError(f"Бот {bot_key} не настроен")
+        executor = get_update_executor(bot_key)
+
+        state, _ = PollingState.objects.get_or_create(bot_key=bot_key)
+        if options['reset_offset']:
+            state.offset = 0
+            state.save(update_fields=['offset', 'updated_at'])
+            # Перечитанные апдейты не должны отсеяться как уже обработанные
+            get_update_deduplicator().reset(bot_key)
+
+        # getUpdates не работает, пока у бота установлен вебхук
+        data = bot_api.delete_webhook()
+        if not data.get('ok'):
+            raise CommandError(f"Не удалось отключить вебхук: {data.get('description')}")
+
+        self.stdout.write(f"Polling запущен, смещение: {state.offset}")
+        # SIGTERM (systemctl stop, docker stop) останавливает так же, как Ctrl+C:
+        # пачка дорабатывается, очередь исполнителя и отложенные записи сбрасываются
+        self._stopping = False
+        self._waiting = False
+        previous_handler = signal.signal(signal.SIGTERM, self._terminate)
+        total = 0
+        retry_delay = RETRY_DELAY
+        try:
+            while not self._stopping:
+                self._waiting = True
+                try:
+                    data = bot_api.get_updates(
+                        offset=state.offset,
+                        limit=limit,
+                        timeout=0 if options['once'] else timeout,
+                        allowed_updates=ALLOWED_UPDATES,
+                    )
+                except requests.RequestException as e:
+                    self.stderr.write(f"Ошибка сети getUpdates: {e}, повтор через {retry_delay} с")
+                    time.sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+                    continue
+                finally:
+                    self._waiting = False
+                retry_delay = RETRY_DELAY
+
+                if not data.get('ok'):
+                    retry_after = data.get('parameters', {}).get('retry_after', 5)
+                    self.stderr.write(f"Ошибка getUpdates: {data.get('description')}, повтор через {retry_after} с")
+                    time.sleep(retry_after)
+                    continue
+
+                updates = data['result']
+                if not updates:
+                    if options['once']:
+                        break
+                    continue
+
+                # Пачка обрабатывается целиком и пишется в БД одной транзакцией,
+                # смещение сохраняем только после этого
+                accepted = process_updates_batch(updates, executor=executor, bot_key=bot_key)
+                state.offset = updates[-1]['update_id'] + 1
+                state.save(update_fields=['offset', 'updated_at'])
+
+                total += accepted
+                self.stdout.write(f"Обработано апдейтов: {accepted} из {len(updates)} (всего {total})")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write("Остановка polling...")
+            signal.signal(signal.SIGTERM, previous_handler)
+            executor.join()
+            registration_store.flush()
+
+    def _terminate(self, signum, frame):
+        """
+        Обработчик SIGTERM: долгий getUpdates прерывается сразу (смещение
+        еще не сдвинуто, апдейты придут снова), начатая пачка дорабатывается
+        """
+        self._stopping = True
+        if self._waiting:
+            raise KeyboardInterrupt
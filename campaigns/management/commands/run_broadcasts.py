@@ -0,0 +1,59 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from campaigns.broadcasts import BroadcastSender
+
+
+class Command(BaseCommand):
+    help = 'Отправка рассылок участникам: берет рассылки из очереди и продолжает прерванные'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--broadcast', type=int, help='ID рассылки (по умолчанию - все из очереди)')
+        parser.add_argument('--once', action='store_true', help='Отправить рассылки из очереди и выйти')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между проверками очереди, секунд')
+        parser.add_argument('--rate', type=float, default=getattr(settings, 'BROADCAST_RATE', 10),
+                            help='Сообщений в секунду на бота (не больше BROADCAST_RATE - на время рассылки ответы бота уступают ей эту долю)')
+        parser.add_argument('--workers', type=int, default=8, help='Потоков отправки')
+        parser.add_argument('--page-size', type=int, default=100,
+                            help='Получателей на страницу (после прерывания повторно могут уйти только сообщения одной страницы)')
+
+    def handle(self, *args, **options):
+        budget = getattr(settings, 'BROADCAST_RATE', 10)
+        if options['rate'] > budget:
+            raise CommandError(
+                f"--rate {options['rate']:g} больше BROADCAST_RATE={budget:g}: ответы бота уступают рассылке "
+                f"только BROADCAST_RATE, вместе они превысят лимит Telegram. Увеличьте BROADCAST_RATE для всех процессов"
+            )
+        sender = BroadcastSender(rate=options['rate'], workers=options['workers'], page_size=options['page_size'])
+        stopping = []
+
+        def stop(signum, frame):
+            # Дописываем текущую страницу и выходим; рассылка продолжится при следующем запуске
+            self.stdout.write('Остановка после текущей страницы...')
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        while not stopping:
+            broadcast = sender.claim(options['broadcast'])
+            if broadcast is None:
+                if options['once'] or options['broadcast']:
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            self.stdout.write(
+                f"Рассылка {broadcast.id} ({broadcast.campaign.name}): "
+                f"продолжение с участника {broadcast.last_participant_id}"
+            )
+            broadcast = sender.run(broadcast, stop=lambda: bool(stopping))
+            self.stdout.write(
+                f"Рассылка {broadcast.id}: {broadcast.get_status_display()}, доставлено {broadcast.sent}, "
+                f"ошибок {broadcast.failed}, заблокировали бота {broadcast.blocked}"
+            )
+            if options['broadcast']:
+                break
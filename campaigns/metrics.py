@@ -0,0 +1,274 @@
+# campaigns/metrics.py
+import atexit
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+
+class Metric:
+    """Счетчик или гистограмма с метками; значения - по кортежам значений меток"""
+
+    def __init__(self, name, documentation, kind, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        self.registry = None
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _touch(self):
+        # Первое значение в процессе запускает запись его файла метрик
+        if self.registry is not None:
+            self.registry._ensure_writer()
+
+    def inc(self, amount=1, **labels):
+        self._touch()
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def observe(self, value, **labels):
+        """Гистограмма: счетчик по бакету (накопительные суммы - при выводе), сумма и число наблюдений"""
+        self._touch()
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Длительность блока в секундах; метки можно дописать в словарь внутри блока"""
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): list(value) if isinstance(value, list) else value
+                    for key, value in self._values.items()}
+
+
+def merge(total, snapshot):
+    """Складывает снимок процесса с общим: счетчики и бакеты гистограмм суммируются"""
+    for name, values in snapshot.items():
+        target = total.setdefault(name, {})
+        for key, value in values.items():
+            if isinstance(value, list):
+                current = target.setdefault(key, [0] * len(value))
+                target[key] = [a + b for a, b in zip(current, value)]
+            else:
+                target[key] = target.get(key, 0) + value
+    return total
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    ) + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса с выводом в текстовом формате Prometheus.
+
+    При нескольких воркерах gunicorn у каждого процесса свои значения:
+    если задан directory, процесс раз в flush_interval секунд сохраняет
+    снимок в свой файл, а /metrics складывает файлы всех процессов.
+    Файлы завершившихся процессов остаются - их счетчики продолжают
+    входить в сумму; каталог очищается при деплое.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._writer_pid = None
+        self._path = None
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Metric(name, documentation, 'counter', labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Metric(name, documentation, 'histogram', labelnames, buckets))
+
+    def _register(self, metric):
+        metric.registry = self
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        self._ensure_writer()
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    # 🔹 Файлы процессов
+
+    def _ensure_writer(self):
+        if not self.directory or self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            # pid и время старта: pid нового процесса может совпасть с pid завершившегося
+            self._path = os.path.join(self.directory, f'metrics-{os.getpid()}-{int(time.time() * 1000)}.json')
+            threading.Thread(target=self._write_loop, name='metrics-writer', daemon=True).start()
+            self._writer_pid = os.getpid()
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.write()
+            except Exception as e:
+                logger.warning("Error writing metrics file: %s", e)
+
+    def write(self):
+        """Атомарно сохраняет снимок процесса в его файл"""
+        if not self.directory or self._writer_pid != os.getpid():
+            return
+        data = {name: metric.snapshot() for name, metric in self._metrics.items()}
+        temp_path = f'{self._path}.tmp'
+        with open(temp_path, 'w') as fileobj:
+            json.dump(data, fileobj)
+        os.replace(temp_path, self._path)
+
+    def collect(self):
+        """Сумма по всем процессам; значения текущего процесса - живые, а не из файла"""
+        total = merge({}, self.snapshot())
+        if self.directory:
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+                if path == self._path:
+                    continue
+                try:
+                    with open(path) as fileobj:
+                        merge(total, json.load(fileobj))
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping metrics file %s: %s", path, e)
+        return total
+
+    def render(self):
+        """Текстовый формат Prometheus (text/plain; version=0.0.4)"""
+        collected = self.collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for raw_key, value in sorted(collected.get(name, {}).items()):
+                key = tuple(json.loads(raw_key))
+                if metric.kind == 'counter':
+                    lines.append(f'{name}{_format_labels(metric.labelnames, key)} {_format_number(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), value[:-2]):
+                    cumulative += count
+                    labels = _format_labels(metric.labelnames, key, [('le', _format_number(float(bound)))])
+                    lines.append(f'{name}_bucket{labels} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(metric.labelnames, key)} {_format_number(float(value[-2]))}')
+                lines.append(f'{name}_count{_format_labels(metric.labelnames, key)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(
+    directory=getattr(settings, 'METRICS_DIR', '') or None,
+    flush_interval=getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0),
+)
+atexit.register(registry.write)
+
+updates_total = registry.counter(
+    'tg_updates_total', 'Апдейты Telegram по типу', ['bot', 'type'])
+handler_seconds = registry.histogram(
+    'tg_update_handler_seconds', 'Время обработки апдейта по стадии регистрации', ['stage'])
+update_db_queries = registry.histogram(
+    'tg_update_db_queries', 'Запросы к БД на один апдейт', buckets=QUERY_BUCKETS)
+bot_api_seconds = registry.histogram(
+    'tg_bot_api_request_seconds', 'Время вызова Bot API по методу и результату', ['method', 'status'])
+subscription_check_seconds = registry.histogram(
+    'tg_subscription_check_seconds', 'Время проверки подписки на каналы мероприятия', ['result'])
+
+# Стадия регистрации, которую обрабатывает текущий апдейт (задают обработчики)
+current_stage = ContextVar('current_stage', default=None)
+
+
+def set_stage(stage):
+    holder = current_stage.get()
+    if holder is not None:
+        holder['stage'] = stage
+
+
+def update_type(update):
+    """Тип апдейта: callback_query, contact, command, message и т.п."""
+    if 'callback_query' in update:
+        return 'callback_query'
+    message = update.get('message')
+    if message is not None:
+        if 'contact' in message:
+            return 'contact'
+        if message.get('text', '').startswith('/'):
+            return 'command'
+        return 'message'
+    return next((key for key in update if key != 'update_id'), 'unknown')
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def track_update(update, bot_key):
+    """Метрики обработки одного апдейта: тип, время по стадии, запросы к БД"""
+    from django.db import connection
+
+    updates_total.inc(bot=bot_key, type=update_type(update))
+    holder = {'stage': 'none'}
+    token = current_stage.set(holder)
+    queries = _QueryCounter()
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(queries):
+            yield
+    finally:
+        handler_seconds.observe(time.perf_counter() - started, stage=holder['stage'])
+        update_db_queries.observe(queries.count)
+        current_stage.reset(token)
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0006_campaign_registration_stage'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='campaign',
+            name='registration_stage',
+        ),
+        migrations.AddField(
+            model_name='participant',
+            name='registration_stage',
+            field=models.CharField(choices=[('start', 'Начало'), ('name', 'Ввод имени'), ('phone', 'Ввод телефона'), ('subscription', 'Проверка подписки'), ('completed', 'Завершено')], default='start', max_length=20, verbose_name='Стадия регистрации'),
+        ),
+        migrations.AlterField(
+            model_name='campaign',
+            name='conditions_button',
+            field=models.CharField(default='✅ Проверить подписку', max_length=50, verbose_name='Текст кнопки "Проверить подписку"'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0007_participant_registration_stage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bot_key', models.CharField(default='default', max_length=64, verbose_name='Бот')),
+                ('update_id', models.BigIntegerField(verbose_name='ID апдейта')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Получен')),
+            ],
+            options={
+                'verbose_name': 'Обработанный апдейт',
+                'verbose_name_plural': 'Обработанные апдейты',
+                'unique_together': {('bot_key', 'update_id')},
+            },
+        ),
+    ]
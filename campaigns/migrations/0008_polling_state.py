@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0007_processed_update'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollingState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bot_key', models.CharField(default='default', max_length=64, unique=True, verbose_name='Бот')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Смещение')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Состояние polling',
+                'verbose_name_plural': 'Состояния polling',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0008_polling_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCampaignBinding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('telegram_id', models.BigIntegerField(unique=True, verbose_name='ID пользователя Telegram')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bindings', to='campaigns.campaign', verbose_name='Мероприятие')),
+            ],
+            options={
+                'verbose_name': 'Привязка к мероприятию',
+                'verbose_name_plural': 'Привязки к мероприятиям',
+            },
+        ),
+    ]
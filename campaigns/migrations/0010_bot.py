@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0009_user_campaign_binding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Bot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.SlugField(help_text='Используется в адресе вебхука: /telegram/<ключ>/', max_length=64, unique=True, verbose_name='Ключ бота')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('token', models.CharField(max_length=100, verbose_name='Токен')),
+                ('username', models.CharField(blank=True, max_length=64, verbose_name='Username бота (без @)')),
+            ],
+            options={
+                'verbose_name': 'Бот',
+                'verbose_name_plural': 'Боты',
+            },
+        ),
+        migrations.AddField(
+            model_name='usercampaignbinding',
+            name='bot_key',
+            field=models.CharField(default='default', max_length=64, verbose_name='Бот'),
+        ),
+        migrations.AlterField(
+            model_name='usercampaignbinding',
+            name='telegram_id',
+            field=models.BigIntegerField(verbose_name='ID пользователя Telegram'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='usercampaignbinding',
+            unique_together={('bot_key', 'telegram_id')},
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='bot',
+            field=models.ForeignKey(blank=True, help_text='Пусто - бот из переменной окружения BOT_TOKEN', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='campaigns', to='campaigns.bot', verbose_name='Бот'),
+        ),
+    ]
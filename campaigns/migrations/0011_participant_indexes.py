@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+from campaigns.migration_ops import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся CONCURRENTLY - без блокировки записи в большую таблицу участников
+    atomic = False
+
+    dependencies = [
+        ('campaigns', '0010_bot'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='participant',
+            index=models.Index(fields=['campaign', 'registration_stage'], name='participant_stage_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='participant',
+            index=models.Index(condition=models.Q(('is_subscribed', True)), fields=['campaign', 'id'], name='participant_subscribed_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0011_participant_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='raffle_seed',
+            field=models.CharField(blank=True, help_text='Зерно генератора - по нему розыгрыш можно воспроизвести и проверить', max_length=64, verbose_name='Seed розыгрыша'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0012_campaign_raffle_seed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='bonus_channel_usernames',
+            field=models.TextField(blank=True, default='', help_text='Необязательные каналы: подписка на каждый дает участнику дополнительный билет в розыгрыше', verbose_name='Бонусные каналы (через запятую)'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='prize_tiers',
+            field=models.JSONField(blank=True, default=list, help_text='Список призов по убыванию ценности, например: [{"name": "Главный приз", "count": 1}, {"name": "Второй приз", "count": 10}]. Пусто - один приз на "Количество победителей"', verbose_name='Призовые места'),
+        ),
+        migrations.AddField(
+            model_name='participant',
+            name='tickets',
+            field=models.PositiveIntegerField(default=1, verbose_name='Билетов в розыгрыше'),
+        ),
+    ]
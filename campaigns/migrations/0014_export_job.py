@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0013_prize_tiers_and_tickets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('xlsx', 'Excel'), ('csv', 'CSV'), ('csv.gz', 'CSV (gzip)')], default='xlsx', max_length=10, verbose_name='Формат')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('fingerprint', models.CharField(max_length=64, verbose_name='Отпечаток данных')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Участников')),
+                ('progress', models.PositiveIntegerField(default=0, verbose_name='Выгружено')),
+                ('file', models.FileField(blank=True, upload_to='exports/', verbose_name='Файл')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='campaigns.campaign', verbose_name='Мероприятие')),
+            ],
+            options={
+                'verbose_name': 'Выгрузка',
+                'verbose_name_plural': 'Выгрузки',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['campaign', 'format', 'fingerprint'], name='export_job_lookup_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_campaign_stats(apps, schema_editor):
+    """Начальные значения счетчиков для уже существующих мероприятий"""
+    Campaign = apps.get_model('campaigns', 'Campaign')
+    CampaignStats = apps.get_model('campaigns', 'CampaignStats')
+    Participant = apps.get_model('campaigns', 'Participant')
+    for campaign_id in Campaign.objects.values_list('id', flat=True):
+        counters = {'participants': 0, 'subscribed': 0}
+        rows = (
+            Participant.objects.filter(campaign_id=campaign_id)
+            .values('registration_stage')
+            .annotate(total=Count('id'), subscribed=Count('id', filter=Q(is_subscribed=True)))
+            .order_by()
+        )
+        for row in rows:
+            counters['participants'] += row['total']
+            counters['subscribed'] += row['subscribed']
+            field = f"stage_{row['registration_stage']}"
+            counters[field] = counters.get(field, 0) + row['total']
+        CampaignStats.objects.create(campaign_id=campaign_id, **counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0014_export_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignStats',
+            fields=[
+                ('campaign', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='campaigns.campaign', verbose_name='Мероприятие')),
+                ('participants', models.IntegerField(default=0, verbose_name='Участников')),
+                ('subscribed', models.IntegerField(default=0, verbose_name='Подписанных')),
+                ('stage_start', models.IntegerField(default=0, verbose_name='Начало')),
+                ('stage_name', models.IntegerField(default=0, verbose_name='Ввод имени')),
+                ('stage_phone', models.IntegerField(default=0, verbose_name='Ввод телефона')),
+                ('stage_subscription', models.IntegerField(default=0, verbose_name='Проверка подписки')),
+                ('stage_completed', models.IntegerField(default=0, verbose_name='Завершено')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Статистика мероприятия',
+                'verbose_name_plural': 'Статистика мероприятий',
+            },
+        ),
+        migrations.RunPython(fill_campaign_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0015_campaign_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participant',
+            name='bot_blocked',
+            field=models.BooleanField(default=False, verbose_name='Заблокировал бота'),
+        ),
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(verbose_name='Текст сообщения')),
+                ('parse_mode', models.CharField(blank=True, choices=[('', 'Обычный текст'), ('Markdown', 'Markdown'), ('HTML', 'HTML')], max_length=10, verbose_name='Разметка')),
+                ('stage', models.CharField(blank=True, choices=[('start', 'Начало'), ('name', 'Ввод имени'), ('phone', 'Ввод телефона'), ('subscription', 'Проверка подписки'), ('completed', 'Завершено')], help_text='Пусто - участники на любой стадии', max_length=20, verbose_name='Стадия регистрации')),
+                ('only_subscribed', models.BooleanField(default=True, verbose_name='Только подписанные')),
+                ('status', models.CharField(choices=[('draft', 'Черновик'), ('queued', 'В очереди'), ('running', 'Отправляется'), ('done', 'Завершена'), ('cancelled', 'Отменена')], default='draft', max_length=10, verbose_name='Статус')),
+                ('last_participant_id', models.BigIntegerField(default=0, verbose_name='Последний обработанный участник')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='Доставлено')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Ошибок')),
+                ('blocked', models.PositiveIntegerField(default=0, verbose_name='Заблокировали бота')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлена')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начата')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='broadcasts', to='campaigns.campaign', verbose_name='Мероприятие')),
+            ],
+            options={
+                'verbose_name': 'Рассылка',
+                'verbose_name_plural': 'Рассылки',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BroadcastDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('sent', 'Доставлено'), ('failed', 'Ошибка'), ('blocked', 'Бот заблокирован')], max_length=10, verbose_name='Статус')),
+                ('error', models.CharField(blank=True, max_length=255, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Отправлено')),
+                ('broadcast', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='campaigns.broadcast', verbose_name='Рассылка')),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='campaigns.participant', verbose_name='Участник')),
+            ],
+            options={
+                'verbose_name': 'Доставка рассылки',
+                'verbose_name_plural': 'Доставки рассылки',
+                'unique_together': {('broadcast', 'participant')},
+            },
+        ),
+    ]
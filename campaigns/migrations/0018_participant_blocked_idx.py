@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+from campaigns.migration_ops import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+    # Индекс строится CONCURRENTLY - без блокировки записи в большую таблицу участников
+    atomic = False
+
+    dependencies = [
+        ('campaigns', '0017_participant_updated_at'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='participant',
+            index=models.Index(condition=models.Q(('bot_blocked', True)), fields=['telegram_id'], name='participant_blocked_idx'),
+        ),
+    ]
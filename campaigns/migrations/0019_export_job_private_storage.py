@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:11
+
+import campaigns.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0018_participant_blocked_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='file',
+            field=models.FileField(blank=True, storage=campaigns.models.export_storage, upload_to='', verbose_name='Файл'),
+        ),
+    ]
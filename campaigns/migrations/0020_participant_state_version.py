@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0019_export_job_private_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participant',
+            name='state_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия состояния'),
+        ),
+    ]
@@ -1,8 +1,38 @@
+import logging
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
 from django.db import models
 from django.utils import timezone
-import os
-from dotenv import load_dotenv
-load_dotenv()
+from .bot_api import DEFAULT_BOT_KEY, get_bot_api
+
+logger = logging.getLogger(__name__)
+
+
+class Bot(models.Model):
+    """Telegram-бот со своим токеном; у каждого бота свой вебхук /telegram/<key>/"""
+    key = models.SlugField('Ключ бота', max_length=64, unique=True,
+                           help_text='Используется в адресе вебхука: /telegram/<ключ>/')
+    name = models.CharField('Название', max_length=200)
+    token = models.CharField('Токен', max_length=100)
+    username = models.CharField('Username бота (без @)', max_length=64, blank=True)
+
+    class Meta:
+        verbose_name = 'Бот'
+        verbose_name_plural = 'Боты'
+
+    def __str__(self):
+        return self.name
+
+    def webhook_url(self):
+        return bot_webhook_url(self.key)
+
+
+def bot_webhook_url(bot_key):
+    """Адрес вебхука бота; бот по умолчанию остается на WEBHOOK_URL"""
+    if bot_key == DEFAULT_BOT_KEY:
+        return settings.WEBHOOK_URL
+    return f"{settings.WEBHOOK_URL.rstrip('/')}/{bot_key}/"
 
 
 class Campaign(models.Model):
@@ -36,6 +66,10 @@ class Campaign(models.Model):
         default='🎁 Посмотреть призы'
     )
     
+    bot = models.ForeignKey(
+        Bot, on_delete=models.PROTECT, null=True, blank=True, related_name='campaigns', verbose_name='Бот',
+        help_text='Пусто - бот из переменной окружения BOT_TOKEN'
+    )
     bot_is_running = models.BooleanField('Бот запущен', default=False)
     
     conditions_text = models.TextField(
@@ -55,63 +89,103 @@ class Campaign(models.Model):
     )
 
     winners_count = models.IntegerField('Количество победителей', default=1)
+    prize_tiers = models.JSONField(
+        'Призовые места', default=list, blank=True,
+        help_text='Список призов по убыванию ценности, например: '
+                  '[{"name": "Главный приз", "count": 1}, {"name": "Второй приз", "count": 10}]. '
+                  'Пусто - один приз на "Количество победителей"'
+    )
     winners = models.JSONField('Победители', default=list, blank=True)
     raffle_date = models.DateTimeField('Дата розыгрыша', null=True, blank=True)
+    raffle_seed = models.CharField(
+        'Seed розыгрыша', max_length=64, blank=True,
+        help_text='Зерно генератора - по нему розыгрыш можно воспроизвести и проверить'
+    )
     
     channel_usernames = models.TextField(
         'Usernames каналов (через запятую)', 
         default='@test_channel',
         help_text='Укажите usernames каналов через запятую, например: @channel1, @channel2'
     )
+    bonus_channel_usernames = models.TextField(
+        'Бонусные каналы (через запятую)', blank=True, default='',
+        help_text='Необязательные каналы: подписка на каждый дает участнику дополнительный билет в розыгрыше'
+    )
 
     def start_bot(self):
         """Запуск бота через вебхук"""
+        from .campaign_cache import invalidate_active_campaign
         try:
             self.bot_is_running = True
             self.save()
             
-            bot_token = os.getenv("BOT_TOKEN")
-            webhook_url = os.getenv("WEBHOOK_URL")
-            
-            import requests
-            response = requests.post(
-                f"https://api.telegram.org/bot{bot_token}/setWebhook",
-                data={'url': webhook_url}
-            )
+            data = get_bot_api(self.bot_key).set_webhook(bot_webhook_url(self.bot_key))
             
-            if response.status_code == 200:
-                print(f"✅ Вебхук настроен для бота")
+            if data.get('ok'):
+                logger.info("Вебхук настроен для мероприятия %s", self.slug)
                 return True
             else:
-                print(f"❌ Ошибка настройки вебхука: {response.text}")
+                logger.error("Ошибка настройки вебхука: %s", data.get('description'))
                 self.bot_is_running = False
                 self.save()
                 return False
                 
         except Exception as e:
-            print(f"❌ Ошибка запуска бота: {e}")
+            logger.exception("Ошибка запуска бота: %s", e)
             self.bot_is_running = False
             self.save()
             return False
+        finally:
+            # Обработчики должны сразу увидеть новый статус бота
+            invalidate_active_campaign()
 
     def stop_bot(self):
         """Остановка бота - отключаем вебхук"""
+        from .campaign_cache import invalidate_active_campaign
         try:
             self.bot_is_running = False
             self.save()
             
-            bot_token = os.getenv("BOT_TOKEN")
-            
-            import requests
-            response = requests.post(
-                f"https://api.telegram.org/bot{bot_token}/deleteWebhook"
-            )
+            # Вебхук общий для всех мероприятий бота - снимаем его с последним
+            if Campaign.objects.filter(bot_id=self.bot_id, bot_is_running=True).exists():
+                logger.info("Мероприятие %s остановлено, вебхук оставлен для остальных", self.slug)
+                return True
+
+            get_bot_api(self.bot_key).delete_webhook()
             
-            print(f"✅ Вебхук отключен")
+            logger.info("Вебхук отключен для мероприятия %s", self.slug)
             return True
         except Exception as e:
-            print(f"❌ Ошибка остановки бота: {e}")
+            logger.exception("Ошибка остановки бота: %s", e)
             return False
+        finally:
+            invalidate_active_campaign()
+
+    @property
+    def bot_key(self):
+        return self.bot.key if self.bot_id else DEFAULT_BOT_KEY
+
+    def get_prize_tiers(self):
+        """Призы розыгрыша: список (название, количество)"""
+        if not self.prize_tiers:
+            return [('', self.winners_count)]
+        return [(tier.get('name', ''), int(tier['count'])) for tier in self.prize_tiers]
+
+    def clean(self):
+        super().clean()
+        if not isinstance(self.prize_tiers, list):
+            raise ValidationError({'prize_tiers': 'Ожидается список призов'})
+        for tier in self.prize_tiers:
+            count = tier.get('count') if isinstance(tier, dict) else None
+            if not isinstance(count, int) or count < 1:
+                raise ValidationError({'prize_tiers': 'У каждого приза должно быть поле count - целое число больше 0'})
+
+    def deep_link(self):
+        """Ссылка на бота, сразу открывающая это мероприятие (/start <slug>)"""
+        username = self.bot.username if self.bot_id else settings.BOT_USERNAME
+        if not username:
+            return ''
+        return f"https://t.me/{username}?start={self.slug}"
 
     def bot_status(self):
         """Статус бота"""
@@ -141,7 +215,14 @@ class Participant(models.Model):
     first_name = models.CharField('Имя', max_length=100)
     phone = models.CharField('Телефон', max_length=20)
     is_subscribed = models.BooleanField('Подписан на канал', default=False)
+    tickets = models.PositiveIntegerField('Билетов в розыгрыше', default=1)
+    # Пользователь заблокировал бота (403 при рассылке) - в рассылки больше не попадает
+    bot_blocked = models.BooleanField('Заблокировал бота', default=False)
     created_at = models.DateTimeField('Дата регистрации', auto_now_add=True)
+    # Время последнего изменения - входит в отпечаток выгрузки (готовый файл не отдается устаревшим)
+    updated_at = models.DateTimeField('Изменен', auto_now=True)
+    # Номер версии состояния регистрации: отложенная запись не перезапишет более новую
+    state_version = models.PositiveIntegerField('Версия состояния', default=0, editable=False)
     
     registration_stage = models.CharField(
         'Стадия регистрации',
@@ -159,7 +240,228 @@ class Participant(models.Model):
     class Meta:
         verbose_name = 'Участник'
         verbose_name_plural = 'Участники'
+        # Поиск участника по (campaign, telegram_id) идет по индексу уникальности
         unique_together = ['campaign', 'telegram_id']
+        indexes = [
+            # Воронка и выборки по стадии регистрации внутри мероприятия
+            models.Index(fields=['campaign', 'registration_stage'], name='participant_stage_idx'),
+            # Розыгрыш и счетчики подписанных: только подписанные, по порядку id
+            models.Index(
+                fields=['campaign', 'id'],
+                name='participant_subscribed_idx',
+                condition=models.Q(is_subscribed=True),
+            ),
+            # Снятие отметки "заблокировал бота" по /start: индекс только по заблокировавшим
+            models.Index(
+                fields=['telegram_id'],
+                name='participant_blocked_idx',
+                condition=models.Q(bot_blocked=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.first_name} - {self.campaign.name}"
+
+
+class ProcessedUpdate(models.Model):
+    """update_id, уже принятые в обработку (защита от повторной доставки Telegram)"""
+    bot_key = models.CharField('Бот', max_length=64, default=DEFAULT_BOT_KEY)
+    update_id = models.BigIntegerField('ID апдейта')
+    created_at = models.DateTimeField('Получен', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Обработанный апдейт'
+        verbose_name_plural = 'Обработанные апдейты'
+        unique_together = ['bot_key', 'update_id']
+
+    def __str__(self):
+        return f"{self.bot_key}:{self.update_id}"
+
+
+class PollingState(models.Model):
+    """Смещение getUpdates для режима long polling"""
+    bot_key = models.CharField('Бот', max_length=64, unique=True, default=DEFAULT_BOT_KEY)
+    offset = models.BigIntegerField('Смещение', default=0)
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Состояние polling'
+        verbose_name_plural = 'Состояния polling'
+
+    def __str__(self):
+        return f"{self.bot_key}: {self.offset}"
+
+
+class UserCampaignBinding(models.Model):
+    """Текущее мероприятие пользователя в боте - куда направлять его апдейты"""
+    bot_key = models.CharField('Бот', max_length=64, default=DEFAULT_BOT_KEY)
+    telegram_id = models.BigIntegerField('ID пользователя Telegram')
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='bindings', verbose_name='Мероприятие')
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Привязка к мероприятию'
+        verbose_name_plural = 'Привязки к мероприятиям'
+        unique_together = ['bot_key', 'telegram_id']
+
+    def __str__(self):
+        return f"{self.bot_key}:{self.telegram_id} -> {self.campaign_id}"
+
+
+def export_storage():
+    """Закрытое хранилище выгрузок: EXPORT_ROOT вне MEDIA_ROOT, файлы отдает только админка"""
+    return FileSystemStorage(location=getattr(settings, 'EXPORT_ROOT', settings.BASE_DIR / 'private' / 'exports'))
+
+
+class ExportJob(models.Model):
+    """Фоновая выгрузка участников мероприятия в файл под EXPORT_ROOT"""
+    FORMAT_CHOICES = [
+        ('xlsx', 'Excel'),
+        ('csv', 'CSV'),
+        ('csv.gz', 'CSV (gzip)'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='export_jobs', verbose_name='Мероприятие')
+    format = models.CharField('Формат', max_length=10, choices=FORMAT_CHOICES, default='xlsx')
+    status = models.CharField('Статус', max_length=10, choices=STATUS_CHOICES, default='pending')
+    # Отпечаток набора участников на момент запуска: пока он не изменился, готовый файл отдается повторно
+    fingerprint = models.CharField('Отпечаток данных', max_length=64)
+    total = models.PositiveIntegerField('Участников', default=0)
+    progress = models.PositiveIntegerField('Выгружено', default=0)
+    file = models.FileField('Файл', storage=export_storage, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    created_at = models.DateTimeField('Создано', auto_now_add=True)
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+    finished_at = models.DateTimeField('Завершено', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Выгрузка'
+        verbose_name_plural = 'Выгрузки'
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['campaign', 'format', 'fingerprint'], name='export_job_lookup_idx')]
+
+    def __str__(self):
+        return f"{self.campaign.name} ({self.get_format_display()}): {self.get_status_display()}"
+
+    @property
+    def percent(self):
+        if self.status == 'done':
+            return 100
+        return min(99, self.progress * 100 // self.total) if self.total else 0
+
+
+class CampaignStats(models.Model):
+    """
+    Счетчики участников мероприятия: всего, подписанных и по стадиям регистрации.
+    Обновляются приращениями F() при каждой записи состояний регистрации,
+    расхождения исправляет команда reconcile_campaign_stats.
+    """
+    campaign = models.OneToOneField(Campaign, on_delete=models.CASCADE, primary_key=True, related_name='stats', verbose_name='Мероприятие')
+    participants = models.IntegerField('Участников', default=0)
+    subscribed = models.IntegerField('Подписанных', default=0)
+    stage_start = models.IntegerField('Начало', default=0)
+    stage_name = models.IntegerField('Ввод имени', default=0)
+    stage_phone = models.IntegerField('Ввод телефона', default=0)
+    stage_subscription = models.IntegerField('Проверка подписки', default=0)
+    stage_completed = models.IntegerField('Завершено', default=0)
+    updated_at = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Статистика мероприятия'
+        verbose_name_plural = 'Статистика мероприятий'
+
+    def __str__(self):
+        return f"{self.campaign_id}: {self.participants}"
+
+
+class Broadcast(models.Model):
+    """Рассылка сообщения участникам мероприятия (отправляет команда run_broadcasts)"""
+    # Ограничение Telegram на длину текста sendMessage
+    MAX_TEXT_LENGTH = 4096
+
+    STATUS_CHOICES = [
+        ('draft', 'Черновик'),
+        ('queued', 'В очереди'),
+        ('running', 'Отправляется'),
+        ('done', 'Завершена'),
+        ('cancelled', 'Отменена'),
+    ]
+    PARSE_MODE_CHOICES = [
+        ('', 'Обычный текст'),
+        ('Markdown', 'Markdown'),
+        ('HTML', 'HTML'),
+    ]
+
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='broadcasts', verbose_name='Мероприятие')
+    text = models.TextField('Текст сообщения')
+    parse_mode = models.CharField('Разметка', max_length=10, choices=PARSE_MODE_CHOICES, blank=True)
+    # Аудитория: участники мероприятия на стадии (пусто - на любой) и только подписанные
+    stage = models.CharField(
+        'Стадия регистрации', max_length=20, blank=True,
+        choices=Participant._meta.get_field('registration_stage').choices,
+        help_text='Пусто - участники на любой стадии',
+    )
+    only_subscribed = models.BooleanField('Только подписанные', default=True)
+    status = models.CharField('Статус', max_length=10, choices=STATUS_CHOICES, default='draft')
+    # Keyset-курсор: участники с id не больше уже обработаны
+    last_participant_id = models.BigIntegerField('Последний обработанный участник', default=0)
+    sent = models.PositiveIntegerField('Доставлено', default=0)
+    failed = models.PositiveIntegerField('Ошибок', default=0)
+    blocked = models.PositiveIntegerField('Заблокировали бота', default=0)
+    created_at = models.DateTimeField('Создана', auto_now_add=True)
+    updated_at = models.DateTimeField('Обновлена', auto_now=True)
+    started_at = models.DateTimeField('Начата', null=True, blank=True)
+    finished_at = models.DateTimeField('Завершена', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Рассылка'
+        verbose_name_plural = 'Рассылки'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.campaign.name}: {self.text[:40]}"
+
+    def clean(self):
+        # Слишком длинный текст Telegram отклонит для каждого получателя
+        if len(self.text) > self.MAX_TEXT_LENGTH:
+            raise ValidationError({
+                'text': f'Telegram принимает сообщения до {self.MAX_TEXT_LENGTH} символов, сейчас {len(self.text)}'
+            })
+
+    def audience(self):
+        """Получатели рассылки (без заблокировавших бота)"""
+        participants = Participant.objects.filter(campaign_id=self.campaign_id, bot_blocked=False)
+        if self.stage:
+            participants = participants.filter(registration_stage=self.stage)
+        if self.only_subscribed:
+            participants = participants.filter(is_subscribed=True)
+        return participants
+
+
+class BroadcastDelivery(models.Model):
+    """Результат отправки рассылки одному участнику - по нему рассылка продолжается после перерыва"""
+    STATUS_CHOICES = [
+        ('sent', 'Доставлено'),
+        ('failed', 'Ошибка'),
+        ('blocked', 'Бот заблокирован'),
+    ]
+
+    broadcast = models.ForeignKey(Broadcast, on_delete=models.CASCADE, related_name='deliveries', verbose_name='Рассылка')
+    participant = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='deliveries', verbose_name='Участник')
+    status = models.CharField('Статус', max_length=10, choices=STATUS_CHOICES)
+    error = models.CharField('Ошибка', max_length=255, blank=True)
+    created_at = models.DateTimeField('Отправлено', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Доставка рассылки'
+        verbose_name_plural = 'Доставки рассылки'
+        unique_together = ['broadcast', 'participant']
 
     def __str__(self):
-        return f"{self.first_name} - {self.campaign.name}"
\ No newline at end of file
+        return f"{self.broadcast_id} -> {self.participant_id}: {self.status}"
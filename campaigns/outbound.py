@@ -0,0 +1,215 @@
+# campaigns/outbound.py
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+
+from .update_executor import UpdateExecutor
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+MARKDOWN_SPECIAL = ('\\', '_', '*', '`', '[')
+
+
+def escape_markdown(text):
+    """Экранирование текста для parse_mode='Markdown'"""
+    for char in MARKDOWN_SPECIAL:
+        text = text.replace(char, '\\' + char)
+    return text
+
+
+@dataclass
+class OutboundMessage:
+    chat_id: int
+    text: str
+    reply_markup: dict = None
+    parse_mode: str = None
+    delay: float = 0.0
+
+    def can_merge(self, other):
+        """Можно ли дописать other в это сообщение"""
+        if other.chat_id != self.chat_id or other.delay:
+            return False
+        # Клавиатура бывает только у последнего сообщения
+        if self.reply_markup:
+            return False
+        # Обычный текст можно экранировать под Markdown, остальные режимы - только одинаковые
+        if {self.parse_mode, other.parse_mode} <= {None, 'Markdown'}:
+            return True
+        return self.parse_mode == other.parse_mode
+
+    def merge(self, other):
+        parse_mode = self.parse_mode or other.parse_mode
+        first, second = self.text, other.text
+        if parse_mode == 'Markdown':
+            if not self.parse_mode:
+                first = escape_markdown(first)
+            if not other.parse_mode:
+                second = escape_markdown(second)
+        return OutboundMessage(
+            chat_id=self.chat_id,
+            text=f'{first}\n\n{second}',
+            reply_markup=other.reply_markup,
+            parse_mode=parse_mode,
+            delay=self.delay,
+        )
+
+
+class OutboundScheduler:
+    """
+    Отложенная отправка без sleep в рабочих потоках.
+
+    Фоновый поток-таймер держит кучу по времени отправки и сам ничего не
+    отправляет: наступившая отправка передается в пул потоков, шард пула
+    выбирается по чату. Медленный или ограниченный лимитом чат задерживает
+    только свой шард, а не таймер и не отправки остальных чатов.
+    Сообщения одного чата не обгоняют друг друга: пока у чата есть
+    отложенные отправки, новые встают за ними.
+    """
+
+    def __init__(self, workers=4, queue_size=10000):
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._chat_tail = {}
+        self._chat_pending = {}
+        self._thread = None
+        self._senders = UpdateExecutor(self._deliver, workers=workers, queue_size=queue_size, name='outbound')
+
+    def dispatch(self, chat_id, sends):
+        """sends - список (delay, callable); первые без задержки выполняются сразу"""
+        now = time.monotonic()
+        immediate = []
+        with self._lock:
+            due = max(now, self._chat_tail.get(chat_id, now))
+            for delay, send in sends:
+                due += delay
+                if due <= now and not self._chat_pending.get(chat_id):
+                    immediate.append(send)
+                    continue
+                # Отложенная отправка выполнится в другом потоке - с контекстом
+                # вызывающего (в том числе ботом текущего апдейта)
+                send = functools.partial(contextvars.copy_context().run, send)
+                heapq.heappush(self._heap, (due, next(self._seq), chat_id, send))
+                self._chat_pending[chat_id] = self._chat_pending.get(chat_id, 0) + 1
+                self._chat_tail[chat_id] = due
+            if self._chat_pending.get(chat_id):
+                self._ensure_thread()
+                self._wakeup.notify()
+
+        for send in immediate:
+            send()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='outbound-scheduler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._wakeup.wait(timeout)
+                _, _, chat_id, send = heapq.heappop(self._heap)
+
+            # Таймер не ждет HTTP-запросов и лимитов: отправка уходит в шард чата.
+            # Ждать места таймер будет, только если переполнен весь шард - это
+            # общая перегрузка, а повторная постановка в кучу нарушила бы порядок чата
+            self._senders.submit(chat_id, (chat_id, send), timeout=None)
+
+    def _deliver(self, item):
+        chat_id, send = item
+        try:
+            send()
+        except Exception as e:
+            logger.exception("Error in scheduled send: %s", e)
+        finally:
+            with self._lock:
+                self._chat_pending[chat_id] -= 1
+                if not self._chat_pending[chat_id]:
+                    del self._chat_pending[chat_id]
+                    self._chat_tail.pop(chat_id, None)
+
+    def pending(self):
+        """Отложенные отправки, которые еще не выполнены (в куче и в пуле)"""
+        with self._lock:
+            return sum(self._chat_pending.values())
+
+
+scheduler = OutboundScheduler(
+    workers=getattr(settings, 'OUTBOUND_WORKERS', 4),
+    queue_size=getattr(settings, 'OUTBOUND_QUEUE_SIZE', 10000),
+)
+
+
+class OutboundComposer:
+    """
+    Копит исходящие сообщения за время обработки апдейта и отправляет их
+    одним блоком: подряд идущие тексты склеиваются в один sendMessage,
+    а сообщения с задержкой уходят через планировщик.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self.messages = []
+
+    def add(self, chat_id, text, reply_markup=None, parse_mode=None, delay=0.0):
+        self.messages.append(OutboundMessage(chat_id, text, reply_markup, parse_mode, delay))
+
+    def compose(self):
+        """Список сообщений после склейки"""
+        composed = []
+        for message in self.messages:
+            if composed and composed[-1].can_merge(message):
+                merged = composed[-1].merge(message)
+                if len(merged.text) <= MAX_MESSAGE_LENGTH:
+                    composed[-1] = merged
+                    continue
+            composed.append(message)
+        return composed
+
+    def flush(self):
+        composed = self.compose()
+        self.messages = []
+        by_chat = {}
+        for message in composed:
+            by_chat.setdefault(message.chat_id, []).append(message)
+        for chat_id, messages in by_chat.items():
+            scheduler.dispatch(chat_id, [
+                (message.delay, lambda message=message: self.send(
+                    message.chat_id, message.text, message.reply_markup, message.parse_mode
+                ))
+                for message in messages
+            ])
+        return len(composed)
+
+
+_local = threading.local()
+
+
+def current_composer():
+    """Композер текущего апдейта (или None вне обработки апдейта)"""
+    return getattr(_local, 'composer', None)
+
+
+@contextmanager
+def compose_outbound(send):
+    """Все сообщения, отправленные внутри блока, уходят при выходе из него"""
+    composer = OutboundComposer(send)
+    previous = current_composer()
+    _local.composer = composer
+    try:
+        yield composer
+    finally:
+        _local.composer = previous
+        composer.flush()
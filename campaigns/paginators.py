@@ -0,0 +1,45 @@
+# campaigns/paginators.py
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц: на PostgreSQL вместо точного COUNT(*)
+    берет оценку планировщика - reltuples из pg_class для всей таблицы или
+    число строк из EXPLAIN для отфильтрованного списка. Точный COUNT
+    выполняется, только если оценка меньше ADMIN_ESTIMATED_COUNT_THRESHOLD:
+    на небольших выборках он дешевый, а номера страниц остаются точными.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate()
+        if estimate is None or estimate < getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000):
+            return super().count
+        return estimate
+
+    def estimate(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        if not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # -1 - таблица еще ни разу не анализировалась
+            return row[0] if row and row[0] >= 0 else None
+
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
@@ -1,65 +1,205 @@
+# campaigns/raffle.py
+import hashlib
+import logging
+import math
 import random
-from django.core.management.base import BaseCommand
+import secrets
+from dataclasses import dataclass
+from itertools import islice
+
+import numpy as np
+from django.db import transaction
 from django.utils import timezone
-from campaigns.models import Campaign, Participant
-
-class Command(BaseCommand):
-    help = 'Провести розыгрыш среди участников мероприятия'
-    
-    def add_arguments(self, parser):
-        parser.add_argument('campaign_slug', type=str, help='Slug мероприятия')
-        parser.add_argument('--winners', type=int, help='Количество победителей', default=1)
-    
-    def handle(self, *args, **options):
-        campaign_slug = options['campaign_slug']
-        winners_count = options['winners']
-        
-        try:
-            campaign = Campaign.objects.get(slug=campaign_slug)
-            participants = Participant.objects.filter(campaign=campaign, is_subscribed=True)
-            
-            self.stdout.write(f"РОЗЫГРЫШ для мероприятия: {campaign.name}")
-            self.stdout.write(f"Участников: {participants.count()}")
-            self.stdout.write(f"Будет выбрано победителей: {winners_count}")
-            
-            # 🔴 ОСТАНАВЛИВАЕМ БОТА ПЕРЕД РОЗЫГРЫШЕМ
-            if campaign.bot_is_running:
-                self.stdout.write("Останавливаем бота перед розыгрышем...")
-                campaign.bot_is_running = False
-                campaign.save()
-            
-            if participants.count() < winners_count:
-                self.stdout.write("ОШИБКА: Недостаточно участников для розыгрыша!")
-                return
-            
-            if campaign.winners:
-                self.stdout.write("ОШИБКА: Розыгрыш уже проводился для этого мероприятия!")
-                return
-            
-            winners = random.sample(list(participants), winners_count)
-            
-            winners_data = []
-            for i, winner in enumerate(winners, 1):
-                winner_data = {
-                    'place': i,
-                    'name': winner.first_name,
-                    'phone': winner.phone,
-                    'telegram_id': winner.telegram_id,
-                    'username': winner.username or 'Не указан'
-                }
-                winners_data.append(winner_data)
-                self.stdout.write(f"{i}. {winner.first_name} - {winner.phone} (@{winner.username})")
-            
-            # Обновляем кампанию
-            campaign.winners = winners_data
-            campaign.raffle_date = timezone.now()
-            campaign.status = 'raffled'
-            campaign.bot_is_running = False  # 🔴 Гарантируем что бот выключен
-            campaign.save()
-            
-            self.stdout.write(f"РОЗЫГРЫШ завершен! Победители сохранены в базу.")
-            
-        except Campaign.DoesNotExist:
-            self.stdout.write(f"ОШИБКА: Мероприятие '{campaign_slug}' не найдено")
-        except Exception as e:
-            self.stdout.write(f"ОШИБКА: {e}")
\ No newline at end of file
+
+from .models import Campaign, Participant
+
+logger = logging.getLogger(__name__)
+
+# Сколько id читать из курсора БД за раз
+ID_CHUNK_SIZE = 10000
+
+RAFFLE_STATUSES = ('active', 'finished')
+
+
+class RaffleError(Exception):
+    """Розыгрыш провести нельзя (уже проведен, мало участников и т.п.)"""
+
+
+@dataclass
+class RaffleResult:
+    winners: list
+    pool_size: int
+    seed: str
+
+
+def _uniform(rng):
+    """Случайное число строго из (0, 1) - для логарифмов алгоритма L"""
+    value = rng.random()
+    while value == 0.0:
+        value = rng.random()
+    return value
+
+
+def reservoir_sample(iterable, k, rng):
+    """
+    Равновероятная выборка k элементов из потока за один проход и O(k) памяти
+    (алгоритм L: генератор вызывается O(k log(n/k)) раз, а не на каждый элемент).
+    Возвращает (выборка, число элементов в потоке).
+    """
+    iterator = iter(iterable)
+    reservoir = list(islice(iterator, k))
+    seen = len(reservoir)
+    if seen < k or k == 0:
+        return reservoir, seen + sum(1 for _ in iterator)
+
+    w = math.exp(math.log(_uniform(rng)) / k)
+    while True:
+        skip = math.floor(math.log(_uniform(rng)) / math.log(1 - w))
+        # Пропускаем skip элементов, следующий попадает в выборку
+        consumed = sum(1 for _ in islice(iterator, skip))
+        seen += consumed
+        if consumed < skip:
+            return reservoir, seen
+        item = next(iterator, None)
+        if item is None:
+            return reservoir, seen
+        seen += 1
+        reservoir[rng.randrange(k)] = item
+        w *= math.exp(math.log(_uniform(rng)) / k)
+
+
+def load_entrants(campaign_id):
+    """id и число билетов подписанных участников - компактными массивами NumPy"""
+    rows = (
+        Participant.objects.filter(campaign_id=campaign_id, is_subscribed=True, tickets__gt=0)
+        .order_by('id')
+        .values_list('id', 'tickets')
+        .iterator(chunk_size=ID_CHUNK_SIZE)
+    )
+    ids = []
+    weights = []
+    while True:
+        chunk = list(islice(rows, ID_CHUNK_SIZE))
+        if not chunk:
+            break
+        block = np.array(chunk, dtype=np.int64)
+        ids.append(block[:, 0])
+        weights.append(block[:, 1].astype(np.float64))
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return np.concatenate(ids), np.concatenate(weights)
+
+
+def weighted_order(weights, k, rng):
+    """
+    Взвешенная выборка k индексов без возвращения (exponential keys,
+    Efraimidis-Spirakis): ключ E/w, где E ~ Exp(1); побеждают k наименьших
+    ключей, их порядок - порядок последовательного розыгрыша.
+    """
+    k = min(k, len(weights))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    keys = rng.exponential(size=len(weights)) / weights
+    if k < len(keys):
+        top = np.argpartition(keys, k - 1)[:k]
+    else:
+        top = np.arange(len(keys))
+    return top[np.argsort(keys[top], kind='stable')]
+
+
+def numpy_rng(seed):
+    """Генератор NumPy из seed-строки (тот же seed - тот же розыгрыш)"""
+    return np.random.default_rng(int.from_bytes(hashlib.sha256(seed.encode()).digest(), 'big'))
+
+
+def pick_winner_ids(campaign, winners_count, seed):
+    """
+    id победителей в порядке мест и размер пула участников.
+    С бонусными каналами у участников разное число билетов - взвешенная
+    выборка в NumPy, иначе равновероятная выборка резервуаром за O(k) памяти.
+    """
+    if campaign.bonus_channel_usernames:
+        ids, weights = load_entrants(campaign.id)
+        order = weighted_order(weights, winners_count, numpy_rng(seed))
+        return ids[order].tolist(), len(ids)
+
+    rng = random.Random(seed)
+    ids = (
+        Participant.objects.filter(campaign_id=campaign.id, is_subscribed=True)
+        .order_by('id')
+        .values_list('id', flat=True)
+        .iterator(chunk_size=ID_CHUNK_SIZE)
+    )
+    chosen, pool_size = reservoir_sample(ids, winners_count, rng)
+    # Порядок в резервуаре зависит от порядка id - места распределяем отдельно
+    rng.shuffle(chosen)
+    return chosen, pool_size
+
+
+def run_raffle(campaign_id, winners_count=None, seed=None):
+    """
+    Проводит розыгрыш мероприятия и сохраняет победителей.
+
+    Мероприятие блокируется select_for_update на время розыгрыша, поэтому
+    два одновременных запуска не выберут победителей дважды. В памяти
+    держатся только id победителей, модели участников не создаются.
+    """
+    seed = seed or secrets.token_hex(16)
+    with transaction.atomic():
+        campaign = Campaign.objects.select_for_update().get(pk=campaign_id)
+        if campaign.winners:
+            raise RaffleError(f'Розыгрыш уже проводился для мероприятия "{campaign.name}"')
+        if campaign.status not in RAFFLE_STATUSES:
+            raise RaffleError(
+                f'Розыгрыш можно проводить только для активных или завершенных мероприятий! '
+                f'Текущий статус: "{campaign.get_status_display()}"'
+            )
+
+        tiers = [('', winners_count)] if winners_count else campaign.get_prize_tiers()
+        winners_count = sum(count for _, count in tiers)
+        chosen, pool_size = pick_winner_ids(campaign, winners_count, seed)
+        if pool_size < winners_count:
+            raise RaffleError(
+                f'Недостаточно участников для розыгрыша: {pool_size}, нужно победителей: {winners_count}'
+            )
+
+        rows = {
+            row['id']: row
+            for row in Participant.objects.filter(id__in=chosen).values(
+                'id', 'first_name', 'phone', 'telegram_id', 'username'
+            )
+        }
+        # Призы разыгрываются по убыванию: первые в порядке розыгрыша получают главный
+        tier_names = [name for name, count in tiers for _ in range(count)]
+        winners = [
+            {
+                'place': place,
+                'tier': tier_name,
+                'name': rows[participant_id]['first_name'],
+                'phone': rows[participant_id]['phone'],
+                'telegram_id': rows[participant_id]['telegram_id'],
+                'username': rows[participant_id]['username'] or 'Не указан',
+            }
+            for place, (participant_id, tier_name) in enumerate(zip(chosen, tier_names), 1)
+        ]
+
+        campaign.winners = winners
+        campaign.raffle_date = timezone.now()
+        campaign.raffle_seed = seed
+        campaign.status = 'raffled'
+        campaign.bot_is_running = False  # 🔴 Гарантируем что бот выключен
+        campaign.save(update_fields=['winners', 'raffle_date', 'raffle_seed', 'status', 'bot_is_running'])
+
+    logger.info("Raffle for campaign %s: %s winners from %s participants", campaign.slug, len(winners), pool_size)
+    return RaffleResult(winners=winners, pool_size=pool_size, seed=seed)
+
+
+def verify_raffle(campaign):
+    """Повторяет розыгрыш по сохраненному seed; True - победители совпали"""
+    if not campaign.winners or not campaign.raffle_seed:
+        raise RaffleError(f'Для мероприятия "{campaign.name}" нет сохраненного розыгрыша')
+    chosen, _ = pick_winner_ids(campaign, len(campaign.winners), campaign.raffle_seed)
+    telegram_ids = dict(Participant.objects.filter(id__in=chosen).values_list('id', 'telegram_id'))
+    return [telegram_ids.get(participant_id) for participant_id in chosen] == [
+        winner['telegram_id'] for winner in campaign.winners
+    ]
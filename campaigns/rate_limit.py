@@ -0,0 +1,279 @@
+# campaigns/rate_limit.py
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        # Bucket, созданный после замера now (новый чат), не должен уходить в минус
+        if now <= self.updated_at:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, now):
+        """Через сколько секунд будет доступен токен"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        # Токен может уйти в минус - это резерв на время ожидания
+        self.tokens -= 1
+
+
+class SharedRateWindow:
+    """
+    Лимит бота, общий для всех процессов: счетчики в кэше Django (alias
+    с атомарным incr - Redis, Memcached).
+
+    Время делится на секундные окна по rate мест. reserve() занимает место
+    инкрементом счетчика окна; если окно заполнено - место в одном из
+    следующих, и вызов ждет его начала. Пауза после 429 тоже хранится
+    в кэше - flood control одного процесса останавливает все.
+    """
+
+    def __init__(self, alias, key, rate, max_wait=5.0):
+        self.alias = alias
+        self.key = key
+        self.rate = rate
+        self.max_wait = max_wait
+
+    def reserve(self, not_before=0.0, limit=None):
+        """
+        Время ожидания места (не раньше not_before секунд) или None, если ждать
+        дольше max_wait. limit - сколько мест окна может занять этот вызов (по умолчанию rate)
+        """
+        cache = caches[self.alias]
+        capacity = max(1, int(self.rate if limit is None else min(limit, self.rate)))
+        now = time.time()
+        start = max(now + not_before, cache.get(f'{self.key}:paused') or 0.0)
+        window = int(start)
+        while True:
+            wait = max(0.0, max(start, window) - now)
+            if wait > self.max_wait:
+                return None
+            counter = f'{self.key}:{window}'
+            cache.add(counter, 0, timeout=int(self.max_wait) + 2)
+            try:
+                taken = cache.incr(counter)
+            except ValueError:
+                # Счетчик истек между add и incr - окно уже в прошлом
+                window += 1
+                continue
+            if taken <= capacity:
+                return wait
+            # Место не досталось - возвращаем: с limit меньше rate лишний
+            # инкремент занял бы места, оставленные другим (рассылке)
+            try:
+                cache.decr(counter)
+            except ValueError:
+                pass
+            window += 1
+
+    def pause(self, seconds):
+        """Пауза всем процессам после 429 Too Many Requests"""
+        cache = caches[self.alias]
+        until = max(time.time() + seconds, cache.get(f'{self.key}:paused') or 0.0)
+        cache.set(f'{self.key}:paused', until, timeout=math.ceil(until - time.time()) + 1)
+
+
+class RateLimiter:
+    """
+    Ограничение частоты вызовов Bot API: общий лимит бота и лимит на чат.
+
+    acquire() резервирует место в обоих bucket-ах и ждет свою очередь,
+    если ожидание не дольше max_wait. Иначе возвращает False, и вызов
+    нужно отложить. pause() - принудительная пауза после ответа 429.
+
+    Лимит бота global_rate действует в памяти процесса. С shared
+    (SharedRateWindow) место дополнительно занимается в общем для всех
+    процессов окне, и пауза после 429 ставится всем процессам;
+    global_rate=None - только общий лимит. reserved() - сколько вызовов
+    в секунду лимита бота сейчас занято другими (идущей рассылкой): столько
+    вычитается из global_rate и из общего окна.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, group_rate=20 / 60,
+                 max_wait=5.0, max_chats=10000, shared=None, reserved=None):
+        self.global_rate = global_rate
+        self.global_bucket = TokenBucket(global_rate, global_rate) if global_rate else None
+        self.shared = shared
+        self.reserved = reserved
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_wait = max_wait
+        self.max_chats = max_chats
+
+        self._chats = OrderedDict()
+        self._paused_until = 0.0
+        self._chat_paused_until = {}
+        self._lock = threading.Lock()
+
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.rejected = 0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # В группах и каналах (отрицательный id) лимит строже
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def reserve(self, chat_id=None):
+        """Резервирует вызов; возвращает время ожидания или None, если ждать дольше max_wait"""
+        reserved = self.reserved() if self.reserved is not None else 0.0
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self.global_bucket is not None:
+                self.global_bucket.rate = self.global_bucket.capacity = max(1.0, self.global_rate - reserved)
+                wait = max(wait, self.global_bucket.wait_time(now))
+            chat_bucket = None
+            if chat_id is not None:
+                chat_bucket = self._chat_bucket(chat_id)
+                wait = max(
+                    wait,
+                    self._chat_paused_until.get(chat_id, 0.0) - now,
+                    chat_bucket.wait_time(now),
+                )
+            if wait > self.max_wait:
+                self.rejected += 1
+                return None
+            buckets = [bucket for bucket in (self.global_bucket, chat_bucket) if bucket is not None]
+            for bucket in buckets:
+                bucket.consume()
+
+        if self.shared is not None:
+            # Запрос к кэшу - вне блокировки: потоки не ждут друг друга на сети
+            shared_wait = self.shared.reserve(not_before=wait, limit=self.shared.rate - reserved)
+            with self._lock:
+                if shared_wait is None:
+                    for bucket in buckets:
+                        bucket.tokens += 1
+                    self.rejected += 1
+                    return None
+            wait = max(wait, shared_wait)
+
+        if wait > 0:
+            with self._lock:
+                self.throttled += 1
+                self.throttled_seconds += wait
+        return wait
+
+    def acquire(self, chat_id=None):
+        """Ждет разрешения на вызов. False - ждать пришлось бы дольше max_wait"""
+        wait = self.reserve(chat_id)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def pause(self, seconds, chat_id=None):
+        """Пауза после 429 Too Many Requests (parameters.retry_after)"""
+        if chat_id is None and self.shared is not None:
+            self.shared.pause(seconds)
+        with self._lock:
+            until = time.monotonic() + seconds
+            if chat_id is None:
+                self._paused_until = max(self._paused_until, until)
+            else:
+                self._chat_paused_until[chat_id] = max(self._chat_paused_until.get(chat_id, 0.0), until)
+                if len(self._chat_paused_until) > self.max_chats:
+                    now = time.monotonic()
+                    self._chat_paused_until = {
+                        key: value for key, value in self._chat_paused_until.items() if value > now
+                    }
+
+    def stats(self):
+        return {
+            'throttled': self.throttled,
+            'throttled_seconds': round(self.throttled_seconds, 3),
+            'rejected': self.rejected,
+        }
+
+
+class RetryQueue:
+    """
+    Очередь повторной отправки: вызовы, получившие 429 или не уложившиеся
+    в лимит, выполняются повторно после задержки в фоновом потоке.
+    """
+
+    def __init__(self, max_size=10000, max_attempts=3):
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+
+        self.retried = 0
+        self.dropped = 0
+
+    def schedule(self, delay, func, attempt):
+        """Ставит повтор; False - попытки исчерпаны или очередь переполнена"""
+        with self._lock:
+            if attempt > self.max_attempts or len(self._heap) >= self.max_size:
+                self.dropped += 1
+                logger.warning("Bot API call dropped after %s attempts", attempt - 1)
+                return False
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), func, attempt))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='bot-api-retry', daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+            return True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._wakeup.wait(timeout)
+                _, _, func, attempt = heapq.heappop(self._heap)
+            self.retried += 1
+            try:
+                func(attempt)
+            except Exception as e:
+                self.dropped += 1
+                logger.exception("Error in Bot API retry: %s", e)
+
+    def pending(self):
+        return len(self._heap)
+
+    def stats(self):
+        return {
+            'retried': self.retried,
+            'dropped': self.dropped,
+            'pending': self.pending(),
+        }
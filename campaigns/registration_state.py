@@ -0,0 +1,401 @@
+# campaigns/registration_state.py
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+
+from .campaign_stats import apply_deltas, state_deltas
+from .models import Participant
+
+logger = logging.getLogger(__name__)
+
+# Режимы записи в БД
+DURABILITY_SYNC = 'sync'            # каждое изменение сразу пишется в БД
+DURABILITY_BATCHED = 'batched'      # изменения копятся и пишутся пачками в фоне
+DURABILITY_COMPLETED = 'completed'  # как batched, но завершение регистрации пишется сразу
+DURABILITY_MODES = (DURABILITY_SYNC, DURABILITY_BATCHED, DURABILITY_COMPLETED)
+
+STATE_FIELDS = ('username', 'first_name', 'phone', 'is_subscribed', 'registration_stage', 'tickets', 'state_version')
+# Читаются вместе с состоянием, но пишет их не хранилище (bot_blocked ставит рассылка)
+READ_FIELDS = STATE_FIELDS + ('bot_blocked',)
+
+
+@dataclass
+class RegistrationState:
+    """Состояние регистрации пользователя - те же поля, что и у Participant"""
+    campaign_id: int
+    telegram_id: int
+    username: str = ''
+    first_name: str = ''
+    phone: str = ''
+    is_subscribed: bool = False
+    registration_stage: str = 'start'
+    tickets: int = 1
+    # Растет с каждым save(): запись в БД идет, только если там версия старше
+    state_version: int = 0
+    bot_blocked: bool = False
+
+    @property
+    def key(self):
+        return (self.campaign_id, self.telegram_id)
+
+    @classmethod
+    def from_participant(cls, participant):
+        return cls(
+            campaign_id=participant.campaign_id,
+            telegram_id=participant.telegram_id,
+            **{field: getattr(participant, field) for field in READ_FIELDS}
+        )
+
+    def to_participant(self):
+        return Participant(
+            campaign_id=self.campaign_id,
+            telegram_id=self.telegram_id,
+            **{field: getattr(self, field) for field in STATE_FIELDS}
+        )
+
+
+class RegistrationStateStore:
+    """
+    Кэш состояний регистрации с отложенной записью в таблицу Participant.
+
+    Чтение: общий кэш Django (alias) или LRU в памяти процесса, при
+    промахе - один запрос к БД. Запись: изменения копятся и сбрасываются
+    одним bulk upsert в транзакции (режим durability).
+
+    По умолчанию (несколько воркеров gunicorn) кэша нет: на каждый апдейт
+    состояние читается из БД и каждое изменение сразу пишется (режим sync),
+    то есть одно чтение и одна запись на апдейт. Одно чтение на апдейт
+    и запись пачками - только с общим кэшем (alias) или single_process=True
+    (один процесс: polling, один воркер).
+
+    Каждое save() увеличивает state_version. Сброс пишет строку, только
+    если в БД версия меньше: два процесса с копиями одного участника могут
+    сбросить их в любом порядке - более старая копия пропускается, стадия
+    не откатывается и счетчики воронки не меняются дважды.
+
+    Пачка апдейтов (polling, разбор очереди) обрабатывается в режиме
+    prefetch() + deferred(): состояния всех пользователей пачки читаются
+    одним запросом, а изменения пишутся одной транзакцией в конце пачки.
+    """
+
+    def __init__(self, max_entries=50000, ttl=300, durability=DURABILITY_SYNC,
+                 flush_interval=0.5, batch_size=500, alias=None, single_process=False):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f'Unknown durability mode: {durability}')
+        if durability != DURABILITY_SYNC and not (alias or single_process):
+            logger.warning(
+                "Registration state durability %r needs a shared cache alias or a single process, using %r",
+                durability, DURABILITY_SYNC,
+            )
+            durability = DURABILITY_SYNC
+        # Локальный LRU между апдейтами - только когда других процессов нет
+        self.local_cache = single_process and not alias
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.alias = alias
+
+        self._entries = OrderedDict()
+        self._dirty = OrderedDict()
+        # Ключи, которых точно нет в БД (по результату prefetch текущей пачки)
+        self._absent = set()
+        self._deferred = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher_pid = None
+
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.stale_skipped = 0
+
+    # 🔹 Чтение
+
+    def _cache_key(self, key):
+        return 'registration:%s:%s' % key
+
+    def _remember(self, state):
+        if self.alias:
+            caches[self.alias].set(self._cache_key(state.key), asdict(state), self.ttl)
+            return
+        with self._lock:
+            if not (self.local_cache or self._deferred):
+                return
+            self._entries[state.key] = (state, time.monotonic() + self.ttl)
+            self._entries.move_to_end(state.key)
+            while len(self._entries) > self.max_entries:
+                # Незаписанные изменения остаются в _dirty до сброса
+                self._entries.popitem(last=False)
+
+    def _lookup(self, key):
+        if self.alias:
+            values = caches[self.alias].get(self._cache_key(key))
+            if values:
+                return RegistrationState(**values)
+
+        with self._lock:
+            if not self.alias:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    state, expires_at = entry
+                    if expires_at > time.monotonic():
+                        self._entries.move_to_end(key)
+                        return state
+                    del self._entries[key]
+            # Вытесненная из кэша, но еще не записанная в БД запись
+            values = self._dirty.get(key)
+            if values is not None:
+                return RegistrationState(*key, **values)
+        return None
+
+    def get(self, campaign_id, telegram_id):
+        """Состояние пользователя или None, если он еще не начинал регистрацию"""
+        key = (campaign_id, telegram_id)
+        state = self._lookup(key)
+        if state is not None:
+            self.hits += 1
+            return state
+        if key in self._absent:
+            self.hits += 1
+            return None
+
+        self.misses += 1
+        participant = (
+            Participant.objects.filter(campaign_id=campaign_id, telegram_id=telegram_id)
+            .only('campaign_id', 'telegram_id', *READ_FIELDS)
+            .first()
+        )
+        if participant is None:
+            return None
+        state = RegistrationState.from_participant(participant)
+        self._remember(state)
+        return state
+
+    def prefetch(self, campaign_id, telegram_ids):
+        """Загружает состояния пачки пользователей одним запросом; возвращает число найденных"""
+        missing = [
+            telegram_id for telegram_id in set(telegram_ids)
+            if self._lookup((campaign_id, telegram_id)) is None
+        ]
+        if not missing:
+            return 0
+
+        found = set()
+        participants = (
+            Participant.objects.filter(campaign_id=campaign_id, telegram_id__in=missing)
+            .only('campaign_id', 'telegram_id', *READ_FIELDS)
+        )
+        for participant in participants:
+            self._remember(RegistrationState.from_participant(participant))
+            found.add(participant.telegram_id)
+
+        self.misses += 1
+        with self._lock:
+            if self._deferred:
+                # Отсутствие запоминаем только на время пачки
+                self._absent.update((campaign_id, telegram_id) for telegram_id in missing if telegram_id not in found)
+        return len(found)
+
+    @contextmanager
+    def deferred(self):
+        """Внутри блока изменения только копятся; при выходе - одна запись в транзакции"""
+        with self._lock:
+            self._deferred += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._deferred -= 1
+                last = not self._deferred
+                if last:
+                    self._absent.clear()
+                    if not self.local_cache:
+                        # Без локального кэша прочитанное живет только на время пачки
+                        self._entries.clear()
+            if last:
+                self.flush()
+
+    # 🔹 Запись
+
+    def create(self, campaign_id, telegram_id, **fields):
+        """Новое состояние регистрации (в БД попадет по правилам durability)"""
+        state = RegistrationState(campaign_id=campaign_id, telegram_id=telegram_id, **fields)
+        self.save(state)
+        return state
+
+    def save(self, state):
+        """Фиксирует изменения состояния"""
+        state.state_version += 1
+        self._remember(state)
+        values = {field: getattr(state, field) for field in STATE_FIELDS}
+        with self._lock:
+            self._absent.discard(state.key)
+            self._dirty[state.key] = values
+            self._dirty.move_to_end(state.key)
+            pending = len(self._dirty)
+            deferred = self._deferred
+
+        if deferred:
+            # Пачка запишется целиком при выходе из deferred()
+            return
+
+        if self.durability == DURABILITY_SYNC or (
+            self.durability == DURABILITY_COMPLETED and state.registration_stage == 'completed'
+        ):
+            self.flush()
+            return
+
+        self._ensure_flusher()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Записывает все накопленные изменения одним upsert в транзакции"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                batch = list(self._dirty.items())
+
+            with transaction.atomic():
+                previous = self._persisted(key for key, _ in batch)
+                # Копия не новее записанной (другой процесс уже сбросил более позднее состояние) - пропускаем
+                fresh = [
+                    (key, values) for key, values in batch
+                    if key not in previous or previous[key][2] < values['state_version']
+                ]
+                objs = [RegistrationState(*key, **values).to_participant() for key, values in fresh]
+                Participant.objects.bulk_create(
+                    objs,
+                    batch_size=self.batch_size,
+                    update_conflicts=True,
+                    unique_fields=['campaign', 'telegram_id'],
+                    update_fields=[*STATE_FIELDS, 'updated_at'],
+                )
+                # Счетчики воронки меняются в той же транзакции, что и участники
+                apply_deltas(state_deltas(
+                    {key: (stage, is_subscribed) for key, (stage, is_subscribed, _) in previous.items()},
+                    {key: (values['registration_stage'], values['is_subscribed']) for key, values in fresh},
+                ))
+
+            stale = len(batch) - len(fresh)
+            with self._lock:
+                for key, values in batch:
+                    # Если за время записи пришли новые изменения - оставляем их
+                    if self._dirty.get(key) is values:
+                        del self._dirty[key]
+                if stale:
+                    written = {key for key, _ in fresh}
+                    for key, _ in batch:
+                        if key not in written:
+                            # Свежее состояние - в БД, локальная копия устарела
+                            self._entries.pop(key, None)
+            if stale:
+                self.stale_skipped += stale
+                logger.warning("Registration state flush skipped %s stale rows", stale)
+            self.flushes += 1
+            self.rows_written += len(objs)
+            return len(objs)
+
+    def _persisted(self, keys):
+        """Стадия, подписка и версия участников пачки в БД до записи (строки блокируются до конца транзакции)"""
+        by_campaign = {}
+        for campaign_id, telegram_id in keys:
+            by_campaign.setdefault(campaign_id, []).append(telegram_id)
+        previous = {}
+        for campaign_id, telegram_ids in by_campaign.items():
+            rows = (
+                Participant.objects.select_for_update()
+                .filter(campaign_id=campaign_id, telegram_id__in=telegram_ids)
+                .values_list('telegram_id', 'registration_stage', 'is_subscribed', 'state_version')
+            )
+            for telegram_id, stage, is_subscribed, version in rows:
+                previous[(campaign_id, telegram_id)] = (stage, is_subscribed, version)
+        return previous
+
+    def clear(self):
+        """Сбрасывает накопленное в БД и очищает кэш процесса"""
+        self.flush()
+        with self._lock:
+            self._entries.clear()
+            self._absent.clear()
+
+    def invalidate(self, campaign_id, telegram_id):
+        """Забыть закэшированное состояние (участника изменили или удалили в обход store)"""
+        key = (campaign_id, telegram_id)
+        if self.alias:
+            caches[self.alias].delete(self._cache_key(key))
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def pending(self):
+        return len(self._dirty)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'pending': self.pending(),
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'stale_skipped': self.stale_skipped,
+        }
+
+    # 🔹 Фоновый сброс
+
+    def _ensure_flusher(self):
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            threading.Thread(target=self._flush_loop, name='registration-flush', daemon=True).start()
+            self._flusher_pid = os.getpid()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._deferred:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception("Error flushing registration state: %s", e)
+            finally:
+                close_old_connections()
+
+
+registration_store = RegistrationStateStore(
+    max_entries=getattr(settings, 'REGISTRATION_STATE_MAX_ENTRIES', 50000),
+    ttl=getattr(settings, 'REGISTRATION_STATE_TTL', 300),
+    durability=getattr(settings, 'REGISTRATION_STATE_DURABILITY', DURABILITY_SYNC),
+    flush_interval=getattr(settings, 'REGISTRATION_STATE_FLUSH_INTERVAL', 0.5),
+    batch_size=getattr(settings, 'REGISTRATION_STATE_BATCH_SIZE', 500),
+    alias=getattr(settings, 'REGISTRATION_STATE_CACHE_ALIAS', None),
+    single_process=getattr(settings, 'REGISTRATION_STATE_SINGLE_PROCESS', False),
+)
+
+
+def _flush_on_exit():
+    try:
+        registration_store.flush()
+    except Exception as e:
+        logger.exception("Error flushing registration state on exit: %s", e)
+
+
+atexit.register(_flush_on_exit)
@@ -0,0 +1,29 @@
+# campaigns/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .bot_api import bot_registry
+from .campaign_cache import invalidate_active_campaign
+from .models import Bot, Campaign, CampaignStats
+
+
+@receiver(post_save, sender=Campaign)
+@receiver(post_delete, sender=Campaign)
+def reset_active_campaign_cache(sender, **kwargs):
+    """Любое изменение мероприятия сбрасывает кэш активного мероприятия"""
+    invalidate_active_campaign()
+
+
+@receiver(post_save, sender=Campaign)
+def create_campaign_stats(sender, instance, created, **kwargs):
+    """У нового мероприятия сразу есть строка счетчиков воронки"""
+    if created:
+        CampaignStats.objects.get_or_create(campaign=instance)
+
+
+@receiver(post_save, sender=Bot)
+@receiver(post_delete, sender=Bot)
+def reset_bot_client(sender, instance, **kwargs):
+    """Смена токена или удаление бота - клиент пересоздается при следующем вызове"""
+    bot_registry.invalidate(instance.key)
+    invalidate_active_campaign()
@@ -0,0 +1,260 @@
+# campaigns/subscriptions.py
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .bot_api import DEFAULT_BOT_KEY, current_bot_key, get_bot_api
+from .metrics import subscription_check_seconds
+from .utils import parse_channel_usernames
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBED_STATUSES = ('member', 'administrator', 'creator')
+
+SUBSCRIBED = 'subscribed'
+NOT_SUBSCRIBED = 'not_subscribed'
+ERROR = 'error'
+
+
+class SubscriptionCache:
+    """
+    TTL-кэш результатов getChatMember по ключу (бот, канал, user_id).
+    Бот в ключе: у разных ботов разный доступ к каналу, и ответы не взаимозаменяемы.
+
+    Для каждого результата свой TTL: подписка подтверждается надолго,
+    отказ и ошибка - ненадолго, чтобы пользователь, который только что
+    подписался, не ждал. Локальный режим - LRU с ограничением по числу
+    записей; если задан alias, используется кэш Django (общий для
+    воркеров), тогда вытеснением управляет сам бэкенд.
+    """
+
+    def __init__(self, max_entries=100000, positive_ttl=300, negative_ttl=10, error_ttl=3, alias=None):
+        self.max_entries = max_entries
+        self.ttls = {
+            SUBSCRIBED: positive_ttl,
+            NOT_SUBSCRIBED: negative_ttl,
+            ERROR: error_ttl,
+        }
+        self.alias = alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(channel, user_id, bot_key):
+        return f'subscription:{bot_key}:{channel.lower()}:{user_id}'
+
+    def get(self, channel, user_id, bot_key=DEFAULT_BOT_KEY):
+        """Результат из кэша или None"""
+        key = self._key(channel, user_id, bot_key)
+        if self.alias:
+            result = caches[self.alias].get(key)
+        else:
+            with self._lock:
+                entry = self._entries.get(key)
+                result = None
+                if entry is not None:
+                    result, expires_at = entry
+                    if expires_at <= time.monotonic():
+                        del self._entries[key]
+                        result = None
+                    else:
+                        self._entries.move_to_end(key)
+
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def set(self, channel, user_id, result, bot_key=DEFAULT_BOT_KEY):
+        ttl = self.ttls.get(result, 0)
+        if ttl <= 0:
+            return
+        key = self._key(channel, user_id, bot_key)
+        if self.alias:
+            caches[self.alias].set(key, result, ttl)
+            return
+        with self._lock:
+            self._entries[key] = (result, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, channel, user_id, bot_key=DEFAULT_BOT_KEY):
+        key = self._key(channel, user_id, bot_key)
+        if self.alias:
+            caches[self.alias].delete(key)
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        """Счетчики попаданий и промахов"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+        }
+
+
+class SubscriptionChecker:
+    """
+    Проверка подписки пользователя на несколько каналов.
+
+    Все getChatMember выполняются параллельно в общем пуле потоков.
+    deadline - общий лимит времени на проверку: каналы, не успевшие
+    ответить, считаются неподтвержденными. fail_fast - не ждать
+    остальные каналы после первого отказа. cache - SubscriptionCache,
+    через который проходят все запросы getChatMember.
+    """
+
+    def __init__(self, bot_api=None, max_workers=16, deadline=5.0, fail_fast=False, cache=None):
+        self._bot_api = bot_api
+        self.cache = cache
+        self.deadline = deadline
+        self.fail_fast = fail_fast
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='subscriptions')
+
+    @property
+    def bot_api(self):
+        return self._bot_api or get_bot_api()
+
+    def check_channel(self, channel, user_id):
+        """Статус подписки на один канал: SUBSCRIBED, NOT_SUBSCRIBED или ERROR"""
+        result = self._request_channel(channel, user_id)
+        if self.cache is not None:
+            self.cache.set(channel, user_id, result, current_bot_key.get())
+        return result
+
+    def _request_channel(self, channel, user_id):
+        try:
+            data = self.bot_api.get_chat_member(channel, user_id)
+        except Exception as e:
+            logger.warning("Ошибка проверки подписки на %s: %s", channel, e)
+            return ERROR
+
+        if not data.get('ok'):
+            # Ошибка от Telegram (например, бот не админ канала)
+            logger.warning("API error for %s: %s", channel, data.get('description'))
+            return ERROR
+
+        member = data['result']
+        status = member.get('status')
+        if status in SUBSCRIBED_STATUSES or (status == 'restricted' and member.get('is_member')):
+            return SUBSCRIBED
+        logger.debug("User %s not subscribed to %s, status: %s", user_id, channel, status)
+        return NOT_SUBSCRIBED
+
+    def check(self, user_id, channels, fail_fast=None):
+        """
+        Проверяет подписку на все каналы.
+        Возвращает (is_subscribed: bool, failed_channels: list)
+        fail_fast - переопределяет настройку для этой проверки
+        """
+        with subscription_check_seconds.time() as labels:
+            is_subscribed, failed_channels = self._check(user_id, channels, fail_fast)
+            labels['result'] = SUBSCRIBED if is_subscribed else NOT_SUBSCRIBED
+        return is_subscribed, failed_channels
+
+    def _check(self, user_id, channels, fail_fast):
+        fail_fast = self.fail_fast if fail_fast is None else fail_fast
+        if not channels:
+            return True, []
+
+        logger.debug("Checking %s channels for user %s", len(channels), user_id)
+        results = {}
+        if self.cache is not None:
+            bot_key = current_bot_key.get()
+            for channel in channels:
+                cached = self.cache.get(channel, user_id, bot_key)
+                if cached is not None:
+                    results[channel] = cached
+
+        to_check = [channel for channel in channels if channel not in results]
+        # Запросы идут из пула потоков - передаем им контекст (бот текущего апдейта)
+        futures = {
+            self._pool.submit(contextvars.copy_context().run, self.check_channel, channel, user_id): channel
+            for channel in to_check
+        }
+        pending = set(futures)
+        stop_at = time.monotonic() + self.deadline
+        stopped_early = fail_fast and any(result != SUBSCRIBED for result in results.values())
+
+        while pending and not stopped_early:
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                logger.warning("Subscription check deadline exceeded for user %s", user_id)
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[futures[future]] = future.result()
+            if fail_fast and any(result != SUBSCRIBED for result in results.values()):
+                stopped_early = True
+                break
+
+        for future in pending:
+            future.cancel()
+
+        # Порядок как в настройках мероприятия. Каналы без ответа считаются
+        # неподтвержденными, кроме случая раннего выхода - там результат уже известен
+        failed_channels = [
+            channel for channel in channels
+            if results.get(channel) != SUBSCRIBED and (channel in results or not stopped_early)
+        ]
+        logger.debug("Subscription result for user %s: %s failed channels", user_id, len(failed_channels))
+        return len(failed_channels) == 0, failed_channels
+
+
+_checker = None
+_checker_lock = threading.Lock()
+
+
+def get_subscription_checker():
+    """Общий для процесса сервис проверки подписки"""
+    global _checker
+    if _checker is None:
+        with _checker_lock:
+            if _checker is None:
+                _checker = SubscriptionChecker(
+                    max_workers=getattr(settings, 'SUBSCRIPTION_CHECK_WORKERS', 16),
+                    deadline=getattr(settings, 'SUBSCRIPTION_CHECK_DEADLINE', 5.0),
+                    fail_fast=getattr(settings, 'SUBSCRIPTION_CHECK_FAIL_FAST', False),
+                    cache=SubscriptionCache(
+                        max_entries=getattr(settings, 'SUBSCRIPTION_CACHE_MAX_ENTRIES', 100000),
+                        positive_ttl=getattr(settings, 'SUBSCRIPTION_CACHE_POSITIVE_TTL', 300),
+                        negative_ttl=getattr(settings, 'SUBSCRIPTION_CACHE_NEGATIVE_TTL', 10),
+                        error_ttl=getattr(settings, 'SUBSCRIPTION_CACHE_ERROR_TTL', 3),
+                        alias=getattr(settings, 'SUBSCRIPTION_CACHE_ALIAS', None),
+                    ),
+                )
+    return _checker
+
+
+def check_user_subscription(user_id, channel_usernames):
+    """
+    Проверяет подписку пользователя на все каналы мероприятия.
+    Возвращает (is_subscribed: bool, failed_channels: list)
+    """
+    channels = parse_channel_usernames(channel_usernames)
+    return get_subscription_checker().check(user_id, channels)
+
+
+def count_subscribed_channels(user_id, channel_usernames):
+    """Сколько из перечисленных каналов у пользователя в подписках (все каналы опрашиваются)"""
+    channels = parse_channel_usernames(channel_usernames)
+    _, failed_channels = get_subscription_checker().check(user_id, channels, fail_fast=False)
+    return len(channels) - len(failed_channels)
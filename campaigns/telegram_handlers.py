@@ -1,28 +1,189 @@
 import json
-import requests
+import logging
 import re
-import time
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from .models import Campaign, Participant
-import os
-from dotenv import load_dotenv
+from .bot_api import DEFAULT_BOT_KEY, UnknownBot, current_bot_key, get_bot_api, use_bot
+from .broadcasts import unblock_user
+from .campaign_binding import campaign_bindings
+from .campaign_cache import get_running_campaigns
+from .dedup import get_update_deduplicator
+from .logging_utils import LazyJson, should_dump_update
+from .metrics import set_stage, track_update
+from .outbound import compose_outbound, current_composer, scheduler
+from .registration_state import registration_store
+from .subscriptions import check_user_subscription, count_subscribed_channels
+from .update_capture import update_capture
+from .update_executor import get_update_executor
+
+logger = logging.getLogger(__name__)
+
+# Результаты accept_update
+UPDATE_ACCEPTED = 'accepted'
+UPDATE_IGNORED = 'ignored'
+UPDATE_DUPLICATE = 'duplicate'
+UPDATE_REJECTED = 'rejected'
+
+
+def get_update_user_id(update):
+    """ID пользователя из апдейта (ключ для упорядочивания), None - апдейт нам не нужен"""
+    if 'callback_query' in update:
+        return update['callback_query'].get('from', {}).get('id')
+    if 'message' in update:
+        return update['message'].get('from', {}).get('id')
+    return None
+
+
+def parse_start_payload(text):
+    """Payload deep link из "/start <payload>": '' - просто /start, None - это не /start"""
+    if text == '/start':
+        return ''
+    if text.startswith('/start '):
+        return text[len('/start '):].strip()
+    return None
+
+
+def resolve_campaign(update, bind=False):
+    """
+    Мероприятие, в которое направляется апдейт: по deep link (/start <slug>),
+    иначе по привязке пользователя, иначе мероприятие по умолчанию.
+    bind=True - запомнить мероприятие из deep link как текущее для пользователя.
+    Мероприятия ищутся среди мероприятий бота текущего апдейта.
+    """
+    bot_key = current_bot_key.get()
+    running = get_running_campaigns(bot_key)
+    if running.default is None:
+        return None
+
+    user_id = get_update_user_id(update)
+    payload = parse_start_payload(update.get('message', {}).get('text', ''))
+    if payload:
+        campaign = running.by_slug.get(payload)
+        if campaign is not None:
+            if bind:
+                campaign_bindings.bind(bot_key, user_id, campaign.id)
+            return campaign
+
+    # Идет одно мероприятие - привязку можно не смотреть
+    if len(running.by_id) == 1:
+        return running.default
+    return running.by_id.get(campaign_bindings.get(bot_key, user_id)) or running.default
+
 
-load_dotenv()
+def accept_update(update, timeout=0, bot_key=DEFAULT_BOT_KEY):
+    """
+    Принимает апдейт бота bot_key в обработку: отсеивает ненужные и повторные
+    и ставит в очередь исполнителя. timeout - сколько ждать места в очереди.
+    """
+    user_id = get_update_user_id(update)
+    if user_id is None:
+        # Другие типы апдейтов бот не обрабатывает
+        return UPDATE_IGNORED
+
+    # 🔹 Повторная доставка того же апдейта - уже принят, ничего не делаем
+    deduplicator = get_update_deduplicator()
+    if deduplicator.is_duplicate(update['update_id'], bot_key):
+        logger.debug("Duplicate update %s dropped", update['update_id'])
+        return UPDATE_DUPLICATE
+
+    if not get_update_executor(bot_key).submit(user_id, update, timeout=timeout):
+        deduplicator.forget(update['update_id'], bot_key)
+        return UPDATE_REJECTED
+
+    return UPDATE_ACCEPTED
 
 
 @csrf_exempt
 @require_POST
-def telegram_webhook(request):
-    """Обработка вебхука Telegram (сообщения и callback-и)"""
+def telegram_webhook(request, bot_key=DEFAULT_BOT_KEY):
+    """Прием вебхука Telegram: проверяем апдейт, ставим в очередь и сразу отвечаем"""
     try:
-        active_campaign = Campaign.objects.filter(status='active', bot_is_running=True).first()
-        if not active_campaign:
-            return JsonResponse({'ok': True})
+        # Клиент бота создается один раз и дальше берется из реестра
+        get_bot_api(bot_key)
+    except UnknownBot:
+        return JsonResponse({'ok': False, 'description': 'Unknown bot'}, status=404)
 
+    try:
         update = json.loads(request.body)
-        print(f"📨 Получен update: {json.dumps(update, indent=2, ensure_ascii=False)}")  # Логирование
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'ok': False, 'description': 'Invalid JSON'}, status=400)
+
+    if not isinstance(update, dict) or 'update_id' not in update:
+        return JsonResponse({'ok': False, 'description': 'Invalid update'}, status=400)
+
+    # Запись трафика для replay (UPDATE_CAPTURE_DIR): только постановка в очередь
+    if update_capture is not None:
+        update_capture.record(update, bot_key)
+
+    # 🔹 Очередь переполнена - просим Telegram повторить доставку позже
+    if accept_update(update, bot_key=bot_key) == UPDATE_REJECTED:
+        response = JsonResponse({'ok': False, 'description': 'Too Many Requests'}, status=429)
+        response['Retry-After'] = '1'
+        return response
+
+    return JsonResponse({'ok': True})
+
+
+def process_update(update, campaign=None, bot_key=DEFAULT_BOT_KEY):
+    """Обработка апдейта Telegram (сообщения и callback-и) в рабочем потоке"""
+    # Все вызовы Bot API внутри - от имени бота, получившего апдейт.
+    # Сообщения, отправленные обработчиками, уходят одним блоком в конце апдейта
+    with use_bot(bot_key), track_update(update, bot_key), compose_outbound(deliver_telegram_message):
+        handle_update(update, campaign)
+
+
+def process_updates_batch(updates, campaign=None, executor=None, bot_key=DEFAULT_BOT_KEY):
+    """
+    Обработка пачки апдейтов (polling, разбор очереди).
+    Состояния всех пользователей пачки читаются одним запросом, а изменения
+    пишутся одной транзакцией после обработки всей пачки. Апдейты одного
+    пользователя идут в один шард исполнителя и обрабатываются по порядку.
+    Возвращает число принятых апдейтов.
+    """
+    executor = executor or get_update_executor(bot_key)
+    deduplicator = get_update_deduplicator()
+
+    batch = []
+    for update in updates:
+        user_id = get_update_user_id(update)
+        if user_id is None:
+            continue
+        # Только окно в памяти: смещение polling и так не дает повторов, а таблица
+        # отсеяла бы бэклог, перечитанный после сбоя
+        if deduplicator.is_duplicate(update['update_id'], bot_key, persistent=False):
+            logger.debug("Duplicate update %s dropped", update['update_id'])
+            continue
+        batch.append((user_id, update))
+
+    with use_bot(bot_key), registration_store.deferred():
+        # Участников каждого мероприятия пачки читаем одним запросом
+        if campaign is None and len(get_running_campaigns(bot_key).by_id) > 1:
+            campaign_bindings.prefetch(bot_key, [user_id for user_id, _ in batch])
+        user_ids = {}
+        for user_id, update in batch:
+            target = campaign or resolve_campaign(update)
+            if target is not None:
+                user_ids.setdefault(target.id, []).append(user_id)
+        for campaign_id, ids in user_ids.items():
+            registration_store.prefetch(campaign_id, ids)
+        for user_id, update in batch:
+            # Ждем места в очереди: пачку уже забрали у Telegram, отказать нельзя
+            executor.submit(user_id, update, timeout=None)
+        executor.join()
+    return len(batch)
+
+
+def handle_update(update, campaign=None):
+    """Разбор апдейта и вызов обработчика стадии регистрации"""
+    try:
+        active_campaign = campaign or resolve_campaign(update, bind=True)
+        if not active_campaign:
+            return
+
+        # Полный дамп апдейта - только на DEBUG и только для выборки апдейтов
+        if should_dump_update(logger):
+            logger.debug("Получен update: %s", LazyJson(update))
 
         # 🔹 1. Callback от inline кнопки
         if 'callback_query' in update:
@@ -33,23 +194,24 @@ def telegram_webhook(request):
             message_id = callback['message']['message_id']
             callback_query_id = callback['id']
 
-            participant = Participant.objects.filter(campaign=active_campaign, telegram_id=user_id).first()
+            participant = get_participant(active_campaign, user_id)
             if not participant:
                 send_telegram_message(chat_id, "❌ Сначала нажмите /start")
                 answer_callback_query(callback_query_id, "❌ Сначала нажмите /start")
-                return JsonResponse({'ok': True})
+                return
 
             if data == 'check_subscription':
+                set_stage('subscription')
                 # 🔹 ПЕРЕДАЕМ ДОПОЛНИТЕЛЬНЫЕ ПАРАМЕТРЫ
                 handle_subscription_stage(chat_id, user_id, active_campaign, participant, message_id, callback_query_id)
             else:
                 answer_callback_query(callback_query_id, "❌ Неизвестная команда")
 
-            return JsonResponse({'ok': True})
+            return
 
         # 🔹 2. Обычные сообщения
         if 'message' not in update:
-            return JsonResponse({'ok': True})
+            return
 
         message = update['message']
         chat_id = message['chat']['id']
@@ -58,62 +220,67 @@ def telegram_webhook(request):
         username = message['from'].get('username', '')
         text = message.get('text', '')
 
-        print(f"💬 Message from {user_id}: {text}")
+        logger.debug("Message from %s: %s", user_id, text)
 
         if 'contact' in message:
             phone = message['contact'].get('phone_number', '')
+            set_stage('phone')
             handle_contact(chat_id, user_id, phone, first_name, username, active_campaign)
-            return JsonResponse({'ok': True})
+            return
 
-        if text == '/start':
+        if parse_start_payload(text) is not None:
+            set_stage('start')
+            # Бот, заблокированный пользователем, тот снова запускает через /start
+            unblock_user(current_bot_key.get(), user_id)
             handle_start(chat_id, user_id, first_name, username, active_campaign)
-            return JsonResponse({'ok': True})
+            return
 
         handle_user_message(chat_id, user_id, text, first_name, username, active_campaign)
 
     except Exception as e:
-        print(f"❌ Error in webhook: {e}")
+        logger.exception("Error in webhook: %s", e)
 
-    return JsonResponse({'ok': True})
+
+def get_participant(campaign, user_id):
+    """
+    Состояние участника. Если он был отмечен как заблокировавший бота, а
+    теперь пишет - снимаем отметку во всех мероприятиях бота (рассылки снова
+    доходят). Запрос на запись - только для таких пользователей.
+    """
+    participant = registration_store.get(campaign.id, user_id)
+    if participant is not None and participant.bot_blocked:
+        unblock_user(current_bot_key.get(), user_id)
+        participant.bot_blocked = False
+    return participant
 
 
 def handle_start(chat_id, user_id, first_name, username, campaign):
     """Начало общения с ботом"""
     try:
+        participant = registration_store.get(campaign.id, user_id)
+        stage = participant.registration_stage if participant else None
+
         # 🔹 ПРОВЕРЯЕМ ЕСТЬ ЛИ УЖЕ ЗАВЕРШЕННАЯ РЕГИСТРАЦИЯ
-        existing_participant = Participant.objects.filter(
-            campaign=campaign, 
-            telegram_id=user_id,
-            registration_stage='completed'
-        ).first()
-        
-        if existing_participant:
+        if stage == 'completed':
             # 🔹 ЕСЛИ РЕГИСТРАЦИЯ УЖЕ ЗАВЕРШЕНА - ПОКАЗЫВАЕМ СТАТУС
             send_telegram_message(
                 chat_id,
                 f"🎉 *Вы уже зарегистрированы!*\n\n"
                 f"✅ Ваша регистрация подтверждена\n"
-                f"👤 Имя: {existing_participant.first_name}\n"
-                f"📞 Телефон: {existing_participant.phone}\n\n"
+                f"👤 Имя: {participant.first_name}\n"
+                f"📞 Телефон: {participant.phone}\n\n"
                 f"Ожидайте результатов розыгрыша!",
                 parse_mode='Markdown'
             )
             return
 
         # 🔹 ПРОВЕРЯЕМ ЕСТЬ ЛИ НЕЗАВЕРШЕННАЯ РЕГИСТРАЦИЯ
-        incomplete_participant = Participant.objects.filter(
-            telegram_id=user_id,
-            campaign=campaign,
-            registration_stage__in=['name', 'phone', 'subscription']
-        ).first()
-        
-        if incomplete_participant:
+        if stage in ['name', 'phone', 'subscription']:
             # 🔹 ЕСЛИ ЕСТЬ НЕЗАВЕРШЕННАЯ РЕГИСТРАЦИЯ - ПРОДОЛЖАЕМ С ТЕКУЩЕЙ СТАДИИ
-            stage = incomplete_participant.registration_stage
             if stage == 'name':
-                ask_name(chat_id, incomplete_participant)
+                ask_name(chat_id, participant)
             elif stage == 'phone':
-                ask_phone(chat_id, incomplete_participant)
+                ask_phone(chat_id, participant, campaign)
             elif stage == 'subscription':
                 send_conditions_with_inline_button(chat_id, campaign)
             return
@@ -123,20 +290,19 @@ def handle_start(chat_id, user_id, first_name, username, campaign):
         send_telegram_message(chat_id, welcome_message)
 
         # Создаем нового участника
-        participant = Participant.objects.create(
-            campaign=campaign,
-            telegram_id=user_id,
+        participant = registration_store.create(
+            campaign.id,
+            user_id,
             username=username,
             first_name=first_name,
             registration_stage='name'
         )
 
-        # Ждем немного перед запросом имени
-        time.sleep(0.5)
+        # Приветствие и запрос имени склеятся в одно сообщение
         ask_name(chat_id, participant)
 
     except Exception as e:
-        print(f"❌ Error in handle_start: {e}")
+        logger.exception("Error in handle_start: %s", e)
         send_telegram_message(chat_id, "❌ Произошла ошибка, попробуйте позже")
 
 
@@ -152,12 +318,14 @@ def ask_name(chat_id, participant):
 
 def handle_user_message(chat_id, user_id, text, first_name, username, campaign):
     """Обработка сообщений по стадиям регистрации"""
-    participant = Participant.objects.filter(campaign=campaign, telegram_id=user_id).first()
+    participant = get_participant(campaign, user_id)
     
     if not participant:
         send_telegram_message(chat_id, "❌ Пожалуйста, нажмите /start для начала регистрации")
         return
 
+    set_stage(participant.registration_stage)
+
     # 🔹 ЕСЛИ РЕГИСТРАЦИЯ УЖЕ ЗАВЕРШЕНА - ПОКАЗЫВАЕМ СТАТУС
     if participant.registration_stage == 'completed':
         send_telegram_message(
@@ -172,10 +340,10 @@ def handle_user_message(chat_id, user_id, text, first_name, username, campaign):
         return
 
     stage = participant.registration_stage
-    print(f"🎯 Stage for user {user_id}: {stage}")
+    logger.debug("Stage for user %s: %s", user_id, stage)
 
     if stage == 'name':
-        handle_name_stage(chat_id, participant, text)
+        handle_name_stage(chat_id, campaign, participant, text)
     elif stage == 'phone':
         handle_phone_stage(chat_id, campaign, participant, text)
     elif stage == 'subscription':
@@ -188,7 +356,7 @@ def handle_user_message(chat_id, user_id, text, first_name, username, campaign):
             )
 
 
-def handle_name_stage(chat_id, participant, text):
+def handle_name_stage(chat_id, campaign, participant, text):
     """Сохраняем имя и запрашиваем телефон"""
     if not text.strip():
         send_telegram_message(chat_id, "Пожалуйста, введите ваше имя:")
@@ -196,17 +364,15 @@ def handle_name_stage(chat_id, participant, text):
 
     participant.first_name = text.strip()
     participant.registration_stage = 'phone'
-    participant.save()
+    registration_store.save(participant)
     
-    # Ждем немного перед запросом телефона
-    time.sleep(0.5)
-    ask_phone(chat_id, participant)
+    ask_phone(chat_id, participant, campaign)
 
 
-def ask_phone(chat_id, participant):
+def ask_phone(chat_id, participant, campaign):
     """Запрос телефона"""
     keyboard = {
-        'keyboard': [[{'text': participant.campaign.share_phone_button or '📱 Поделиться номером', 'request_contact': True}]],
+        'keyboard': [[{'text': campaign.share_phone_button or '📱 Поделиться номером', 'request_contact': True}]],
         'resize_keyboard': True,
         'one_time_keyboard': True
     }
@@ -238,42 +404,34 @@ def handle_phone_stage(chat_id, campaign, participant, text):
 
     participant.phone = phone
     participant.registration_stage = 'subscription'
-    participant.save()
+    registration_store.save(participant)
 
-    # 🔹 Убираем клавиатуру
+    # 🔹 Убираем клавиатуру (отдельным сообщением - у условий своя inline-клавиатура)
     remove_keyboard = {"remove_keyboard": True}
     send_telegram_message(chat_id, "Спасибо! Теперь ознакомьтесь с условиями розыгрыша:", reply_markup=remove_keyboard)
 
-    # 🔹 Ждем немного перед отправкой условий
-    time.sleep(0.5)
-    
-    # 🔹 Отправляем условия с inline-кнопкой
-    send_conditions_with_inline_button(chat_id, campaign)
+    # 🔹 Отправляем условия с inline-кнопкой с небольшой паузой (без блокировки потока)
+    send_conditions_with_inline_button(chat_id, campaign, delay=0.5)
 
 
 def handle_contact(chat_id, user_id, phone, first_name, username, campaign):
     """Обработка контакта Telegram"""
-    participant = Participant.objects.filter(campaign=campaign, telegram_id=user_id).first()
+    participant = get_participant(campaign, user_id)
     if not participant:
         send_telegram_message(chat_id, "❌ Сначала нажмите /start")
         return
 
     participant.phone = re.sub(r'[^\d+]', '', phone)
     participant.registration_stage = 'subscription'
-    participant.save()
-
-    # 🔹 Убираем клавиатуру
-    remove_keyboard = {"remove_keyboard": True}
-    send_telegram_message(chat_id, "Спасибо! Теперь ознакомьтесь с условиями розыгрыша:", reply_markup=remove_keyboard)
+    registration_store.save(participant)
 
-    # 🔹 Ждем немного перед отправкой условий
-    time.sleep(0.5)
-    
-    # 🔹 Отправляем условия акции с inline кнопкой
+    # 🔹 Клавиатура с request_contact одноразовая - клиент уже скрыл ее,
+    # поэтому благодарность и условия склеятся в одно сообщение
+    send_telegram_message(chat_id, "Спасибо! Теперь ознакомьтесь с условиями розыгрыша:")
     send_conditions_with_inline_button(chat_id, campaign)
 
 
-def send_conditions_with_inline_button(chat_id, campaign):
+def send_conditions_with_inline_button(chat_id, campaign, delay=0.0):
     """Отправляем текст условий акции и inline кнопку - УПРОЩЕННАЯ ВЕРСИЯ"""
     try:
         # Просто берем текст как есть, без форматирования
@@ -292,19 +450,19 @@ def send_conditions_with_inline_button(chat_id, campaign):
             ]
         }
         
-        print(f"📋 Sending conditions to {chat_id}")
-        print(f"📝 Conditions text: {conditions_text}")
+        logger.debug("Sending conditions to %s", chat_id)
         
         # Отправляем БЕЗ Markdown форматирования
         send_telegram_message(
             chat_id,
             conditions_text,
             reply_markup=inline_keyboard,
-            parse_mode=None  # Важно: без форматирования
+            parse_mode=None,  # Важно: без форматирования
+            delay=delay
         )
             
     except Exception as e:
-        print(f"❌ Error in send_conditions_with_inline_button: {e}")
+        logger.exception("Error in send_conditions_with_inline_button: %s", e)
         # Фолбэк - минимальное сообщение
         send_telegram_message(
             chat_id,
@@ -320,15 +478,18 @@ def send_conditions_with_inline_button(chat_id, campaign):
 def handle_subscription_stage(chat_id, user_id, campaign, participant, message_id=None, callback_query_id=None):
     """Проверка подписки и завершение регистрации"""
     try:
-        print(f"🔍 Checking subscription for user {user_id}")
-        is_subscribed, failed_channels = check_user_subscription(user_id, campaign)
+        logger.debug("Checking subscription for user %s", user_id)
+        is_subscribed, failed_channels = check_user_subscription(user_id, campaign.channel_usernames)
 
         if is_subscribed:
+            # Подписка на бонусные каналы - дополнительные билеты в розыгрыше
+            if campaign.bonus_channel_usernames:
+                participant.tickets = 1 + count_subscribed_channels(user_id, campaign.bonus_channel_usernames)
             participant.is_subscribed = True
             participant.registration_stage = 'completed'
-            participant.save()
+            registration_store.save(participant)
             
-            print(f"✅ User {user_id} successfully subscribed")
+            logger.info("User %s completed registration", user_id, extra={'campaign_id': campaign.id})
             
             # 🔹 Если это callback, отвечаем на него
             if callback_query_id:
@@ -351,7 +512,7 @@ def handle_subscription_stage(chat_id, user_id, campaign, participant, message_i
                 send_telegram_message(chat_id, success_message, parse_mode='Markdown')
                 
         else:
-            print(f"❌ User {user_id} not subscribed to: {failed_channels}")
+            logger.info("User %s not subscribed to: %s", user_id, failed_channels)
             failed_text = "\n".join([f"• {ch}" for ch in failed_channels])
             inline_keyboard = {
                 "inline_keyboard": [
@@ -382,142 +543,83 @@ def handle_subscription_stage(chat_id, user_id, campaign, participant, message_i
                 )
             
     except Exception as e:
-        print(f"❌ Error in handle_subscription_stage: {e}")
+        logger.exception("Error in handle_subscription_stage: %s", e)
         if callback_query_id:
             answer_callback_query(callback_query_id, "❌ Произошла ошибка, попробуйте позже")
 
 
-def check_user_subscription(user_id, campaign):
-    """Проверка подписки пользователя на каналы"""
-    bot_token = os.getenv("BOT_TOKEN")
-    channels = [ch.strip() for ch in campaign.channel_usernames.split(',') if ch.strip()]
-    failed_channels = []
-
-    print(f"🔍 Checking {len(channels)} channels for user {user_id}")
-
-    for channel in channels:
-        if not channel.startswith('@'):
-            channel = '@' + channel
-            
-        url = f"https://api.telegram.org/bot{bot_token}/getChatMember"
-        try:
-            print(f"  🔎 Checking channel: {channel}")
-            response = requests.get(url, params={'chat_id': channel, 'user_id': user_id}, timeout=10)
-            data = response.json()
-            
-            print(f"  📊 Response for {channel}: {data}")
-            
-            if data.get('ok'):
-                status = data['result']['status']
-                # Проверяем, что пользователь действительно подписан
-                if status in ['member', 'administrator', 'creator']:
-                    print(f"  ✅ Subscribed to {channel}")
-                    continue  # Подписан - переходим к следующему каналу
-                else:
-                    print(f"  ❌ Not subscribed to {channel}, status: {status}")
-            else:
-                print(f"  ❌ API error for {channel}: {data}")
-                
-            failed_channels.append(channel)
-            
-        except Exception as e:
-            print(f"❌ Ошибка проверки подписки на {channel}: {e}")
-            failed_channels.append(channel)
-
-    print(f"📊 Subscription result: {len(failed_channels)} failed channels")
-    return len(failed_channels) == 0, failed_channels
+def send_telegram_message(chat_id, text, reply_markup=None, parse_mode=None, delay=0.0):
+    """
+    Отправка сообщения в Telegram.
+    Внутри обработки апдейта сообщение копится в композере и уходит в конце;
+    delay - пауза перед отправкой (через планировщик, без sleep).
+    """
+    composer = current_composer()
+    if composer is not None:
+        composer.add(chat_id, text, reply_markup, parse_mode, delay)
+        return None
+    if delay:
+        scheduler.dispatch(chat_id, [(delay, lambda: deliver_telegram_message(chat_id, text, reply_markup, parse_mode))])
+        return None
+    return deliver_telegram_message(chat_id, text, reply_markup, parse_mode)
 
 
-def send_telegram_message(chat_id, text, reply_markup=None, parse_mode=None):
-    """Отправка сообщения в Telegram"""
-    bot_token = os.getenv("BOT_TOKEN")
-    data = {'chat_id': chat_id, 'text': text}
-    if reply_markup:
-        data['reply_markup'] = json.dumps(reply_markup)
-    if parse_mode:
-        data['parse_mode'] = parse_mode
-    
-    print(f"📤 Sending message to {chat_id}")
-    print(f"📝 Text preview: {text[:100]}...")
+def deliver_telegram_message(chat_id, text, reply_markup=None, parse_mode=None):
+    """Непосредственная отправка сообщения в Telegram"""
+    logger.debug("Sending message to %s: %.100s", chat_id, text)
     if reply_markup:
-        print(f"🛜 Reply markup: {reply_markup}")
+        logger.debug("Reply markup: %s", reply_markup)
     
     try:
-        response = requests.post(
-            f'https://api.telegram.org/bot{bot_token}/sendMessage', 
-            data=data, 
-            timeout=10
-        )
+        data = get_bot_api().send_message(chat_id, text, reply_markup, parse_mode)
         
-        if response.status_code != 200:
-            print(f"⚠️ Ошибка Telegram API: {response.status_code} - {response.text}")
-            return response
+        if not data.get('ok'):
+            logger.warning("Ошибка Telegram API: %s - %s", data.get('error_code'), data.get('description'))
+            return data
             
-        print(f"✅ Message sent successfully")
-        return response
+        logger.debug("Message sent to %s", chat_id)
+        return data
         
     except Exception as e:
-        print(f"❌ Ошибка отправки: {e}")
+        logger.error("Ошибка отправки: %s", e)
         return None
 
 
 def answer_callback_query(callback_query_id, text):
     """Отвечаем на callback query (убирает часики)"""
-    bot_token = os.getenv("BOT_TOKEN")
-    data = {
-        'callback_query_id': callback_query_id,
-        'text': text,
-        'show_alert': False
-    }
     try:
-        print(f"🔔 Answering callback: {text}")
-        response = requests.post(f'https://api.telegram.org/bot{bot_token}/answerCallbackQuery', data=data, timeout=10)
-        if response.status_code != 200:
-            print(f"⚠️ Ошибка ответа на callback: {response.text}")
+        logger.debug("Answering callback: %s", text)
+        data = get_bot_api().answer_callback_query(callback_query_id, text)
+        if not data.get('ok'):
+            logger.warning("Ошибка ответа на callback: %s", data.get('description'))
     except Exception as e:
-        print(f"❌ Ошибка ответа на callback: {e}")
+        logger.error("Ошибка ответа на callback: %s", e)
 
 
 def edit_message_with_inline_button(chat_id, message_id, text, reply_markup=None, parse_mode=None):
     """Редактируем сообщение с inline кнопкой"""
-    bot_token = os.getenv("BOT_TOKEN")
-    data = {
-        'chat_id': chat_id,
-        'message_id': message_id,
-        'text': text
-    }
-    if reply_markup:
-        data['reply_markup'] = json.dumps(reply_markup)
-    if parse_mode:
-        data['parse_mode'] = parse_mode
-    
-    print(f"✏️ Editing message {message_id} in chat {chat_id}")
+    logger.debug("Editing message %s in chat %s", message_id, chat_id)
     
     try:
-        response = requests.post(f'https://api.telegram.org/bot{bot_token}/editMessageText', data=data, timeout=10)
-        if response.status_code != 200:
-            print(f"⚠️ Ошибка редактирования сообщения: {response.status_code} - {response.text}")
+        data = get_bot_api().edit_message_text(chat_id, message_id, text, reply_markup, parse_mode)
+        if not data.get('ok'):
+            logger.warning("Ошибка редактирования сообщения: %s - %s", data.get('error_code'), data.get('description'))
             return False
-        print(f"✅ Message edited successfully")
+        logger.debug("Message %s edited", message_id)
         return True
     except Exception as e:
-        print(f"❌ Ошибка редактирования сообщения: {e}")
+        logger.error("Ошибка редактирования сообщения: %s", e)
         return False
 
 
 def delete_message(chat_id, message_id):
     """Удаляем сообщение"""
-    bot_token = os.getenv("BOT_TOKEN")
-    data = {
-        'chat_id': chat_id,
-        'message_id': message_id
-    }
     try:
-        print(f"🗑️ Deleting message {message_id} from chat {chat_id}")
-        response = requests.post(f'https://api.telegram.org/bot{bot_token}/deleteMessage', data=data, timeout=10)
-        if response.status_code != 200:
-            print(f"⚠️ Ошибка удаления сообщения: {response.text}")
+        logger.debug("Deleting message %s from chat %s", message_id, chat_id)
+        data = get_bot_api().delete_message(chat_id, message_id)
+        if not data.get('ok'):
+            logger.warning("Ошибка удаления сообщения: %s", data.get('description'))
         else:
-            print(f"✅ Message deleted successfully")
+            logger.debug("Message %s deleted", message_id)
     except Exception as e:
-        print(f"❌ Ошибка удаления сообщения: {e}")
\ No newline at end of file
+        logger.error("Ошибка удаления сообщения: %s", e)
@@ -0,0 +1,47 @@
+import itertools
+import threading
+
+from campaigns.bot_api import DEFAULT_BOT_KEY, BotApiClient, set_bot_api
+
+# Уникальные update_id для всех тестов: фильтр повторов общий для процесса
+update_ids = itertools.count(10 ** 9)
+
+
+class FakeBotApiClient(BotApiClient):
+    """Клиент без сети: отвечает по responder(method, params) и запоминает вызовы"""
+
+    def __init__(self, responder=None, rate_limiter=None):
+        super().__init__('TEST', rate_limiter=rate_limiter)
+        self.responder = responder or (lambda method, params: {'ok': True, 'result': {'message_id': 1}})
+        self.requests = []
+        self._requests_lock = threading.Lock()
+
+    def _request(self, method, params, timeout):
+        with self._requests_lock:
+            self.requests.append((method, dict(params)))
+        return self.responder(method, params)
+
+    def texts(self, method='sendMessage'):
+        return [params.get('text') for name, params in self.requests if name == method]
+
+
+def use_fake_bot_api(testcase, responder=None, bot_key=DEFAULT_BOT_KEY):
+    """Подменяет клиент бота на FakeBotApiClient до конца теста"""
+    client = FakeBotApiClient(responder)
+    previous = set_bot_api(client, bot_key)
+    testcase.addCleanup(set_bot_api, previous, bot_key)
+    return client
+
+
+def message_update(user_id, text, **message):
+    """Апдейт с текстовым сообщением пользователя user_id"""
+    return {
+        'update_id': next(update_ids),
+        'message': {
+            'message_id': 1,
+            'from': {'id': user_id, 'first_name': 'Test'},
+            'chat': {'id': user_id},
+            'text': text,
+            **message,
+        },
+    }
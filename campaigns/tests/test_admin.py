@@ -0,0 +1,65 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from campaigns.models import Campaign, Participant
+from campaigns.paginators import EstimatedCountPaginator
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        campaign = Campaign.objects.create(name='Pages', slug='pages')
+        Participant.objects.bulk_create([
+            Participant(campaign=campaign, telegram_id=index, first_name=f'P{index}', phone='')
+            for index in range(5)
+        ])
+        self.queryset = Participant.objects.order_by('id')
+
+    def test_exact_count_without_planner_estimate(self):
+        # Не PostgreSQL - оценки нет, считаем точно
+        paginator = EstimatedCountPaginator(self.queryset, 2)
+        self.assertIsNone(paginator.estimate())
+        self.assertEqual((paginator.count, paginator.num_pages), (5, 3))
+        self.assertIsNone(EstimatedCountPaginator(list(range(3)), 2).estimate())
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_large_estimate_replaces_count(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=5000000):
+            paginator = EstimatedCountPaginator(self.queryset, 100)
+            with self.assertNumQueries(0):
+                self.assertEqual(paginator.count, 5000000)
+            self.assertEqual(paginator.num_pages, 50000)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_small_estimate_is_checked_with_exact_count(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate', return_value=7):
+            self.assertEqual(EstimatedCountPaginator(self.queryset, 2).count, 5)
+
+
+class ChangelistQueryTests(TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+
+    def add_campaign(self, index, participants):
+        campaign = Campaign.objects.create(name=f'Campaign {index}', slug=f'campaign-{index}')
+        Participant.objects.bulk_create([
+            Participant(campaign=campaign, telegram_id=user, first_name=f'P{user}', phone='')
+            for user in range(participants)
+        ])
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(context)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_campaign(0, 2)
+        few = {url: self.queries(url) for url in ('/admin/campaigns/campaign/', '/admin/campaigns/participant/')}
+        for index in range(1, 6):
+            self.add_campaign(index, 10)
+        many = {url: self.queries(url) for url in few}
+        self.assertEqual(many, few)
@@ -0,0 +1,63 @@
+import json
+
+from django.test import TransactionTestCase
+
+from campaigns.bot_api import DEFAULT_BOT_KEY, bot_registry
+from campaigns.models import Bot, Campaign, Participant
+from campaigns.update_executor import get_update_executor
+
+from .helpers import message_update, use_fake_bot_api
+
+
+class BotWebhookTests(TransactionTestCase):
+    """Мероприятия на разных ботах: у каждого бота свой вебхук и свой клиент"""
+
+    def setUp(self):
+        self.bot = Bot.objects.create(name='Second', key='second', token='SECOND')
+        self.default_campaign = Campaign.objects.create(
+            name='Default', slug='default', status='active', bot_is_running=True, first_message='Default',
+        )
+        self.bot_campaign = Campaign.objects.create(
+            name='Second', slug='second', status='active', bot_is_running=True, first_message='Second',
+            bot=self.bot,
+        )
+        self.default_api = use_fake_bot_api(self)
+        self.bot_api = use_fake_bot_api(self, bot_key='second')
+
+    def post(self, update, bot_key=None):
+        path = f'/campaigns/telegram/{bot_key}/' if bot_key else '/campaigns/telegram/'
+        return self.client.post(path, json.dumps(update), content_type='application/json')
+
+    def test_update_is_routed_to_campaign_of_its_bot(self):
+        self.assertEqual(self.post(message_update(800, '/start'), 'second').status_code, 200)
+        get_update_executor('second').join()
+
+        participant = Participant.objects.get(telegram_id=800)
+        self.assertEqual(participant.campaign_id, self.bot_campaign.id)
+        # Ответ уходит от имени бота, получившего апдейт
+        self.assertEqual(len(self.bot_api.texts()), 1)
+        self.assertTrue(self.bot_api.texts()[0].startswith('Second'))
+        self.assertEqual(self.default_api.requests, [])
+
+    def test_same_user_registers_separately_in_each_bot(self):
+        self.post(message_update(801, '/start'))
+        self.post(message_update(801, '/start'), 'second')
+        get_update_executor(DEFAULT_BOT_KEY).join()
+        get_update_executor('second').join()
+        self.assertEqual(
+            sorted(Participant.objects.filter(telegram_id=801).values_list('campaign_id', flat=True)),
+            [self.default_campaign.id, self.bot_campaign.id],
+        )
+
+    def test_unknown_bot_is_not_found(self):
+        response = self.post(message_update(802, '/start'), 'missing')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Participant.objects.exists())
+
+    def test_token_change_drops_cached_client(self):
+        self.bot.token = 'ROTATED'
+        self.bot.save()
+        client = bot_registry.get('second')
+        self.addCleanup(bot_registry.invalidate, 'second')
+        self.assertIsNot(client, self.bot_api)
+        self.assertEqual(client.token, 'ROTATED')
@@ -0,0 +1,175 @@
+import json
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from campaigns.bot_api import bot_rate_limiter, broadcast_activity
+from campaigns.broadcasts import BroadcastSender, classify_response, unblock_user
+from campaigns.models import Bot, Broadcast, BroadcastDelivery, Campaign, Participant
+from campaigns.rate_limit import RateLimiter, SharedRateWindow
+from campaigns.update_executor import get_update_executor
+
+from .helpers import FakeBotApiClient, message_update, use_fake_bot_api
+
+
+class BroadcastTests(TransactionTestCase):
+    def setUp(self):
+        self.bot = Bot.objects.create(name='Main', key='main', token='TOKEN')
+        self.campaign = Campaign.objects.create(name='News', slug='news', bot=self.bot)
+        Participant.objects.bulk_create([
+            Participant(campaign=self.campaign, telegram_id=100 + index, first_name='P', phone=str(index),
+                        is_subscribed=True)
+            for index in range(25)
+        ])
+        self.client_api = FakeBotApiClient(self.respond, rate_limiter=RateLimiter(global_rate=10000, chat_rate=100))
+        self.sender = BroadcastSender(workers=4, page_size=10)
+        self.sender._clients['main'] = self.client_api
+
+    @staticmethod
+    def respond(method, params):
+        if params['chat_id'] % 10 == 7:
+            return {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+        return {'ok': True, 'result': {'message_id': 1}}
+
+    def sent_chats(self):
+        return [params['chat_id'] for _, params in self.client_api.requests]
+
+    def test_interrupted_broadcast_resumes_without_resending(self):
+        broadcast = Broadcast.objects.create(campaign=self.campaign, text='Hi', status='queued')
+        claimed = self.sender.claim()
+        self.sender.run(claimed, stop=lambda: len(self.client_api.requests) >= 10)
+        broadcast.refresh_from_db()
+        self.assertEqual(broadcast.status, 'queued')
+        self.assertEqual(BroadcastDelivery.objects.count(), 10)
+
+        broadcast = self.sender.run(self.sender.claim())
+        self.assertEqual(broadcast.status, 'done')
+        chats = self.sent_chats()
+        self.assertEqual(len(chats), 25)
+        self.assertEqual(len(set(chats)), 25)
+        self.assertEqual((broadcast.sent, broadcast.blocked, broadcast.failed), (23, 2, 0))
+
+    def test_blocked_users_are_skipped_until_they_write_again(self):
+        other = Campaign.objects.create(name='Other', slug='other', bot=self.bot)
+        Participant.objects.create(campaign=other, telegram_id=107, first_name='P', phone='7', is_subscribed=True)
+        self.sender.run(self.sender.claim(Broadcast.objects.create(campaign=self.campaign, text='Hi', status='queued').id))
+        self.assertEqual(Participant.objects.filter(telegram_id=107, bot_blocked=True).count(), 2)
+
+        self.assertEqual(unblock_user('main', 107), 2)
+        self.assertFalse(Participant.objects.filter(telegram_id=107, bot_blocked=True).exists())
+
+    def test_flood_control_pauses_all_workers(self):
+        calls = []
+
+        def respond(method, params):
+            calls.append(params['chat_id'])
+            if len(calls) == 1:
+                return {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 1}}
+            return {'ok': True, 'result': {'message_id': 1}}
+
+        self.client_api.responder = respond
+        with mock.patch.object(self.client_api.rate_limiter, 'pause', wraps=self.client_api.rate_limiter.pause) as pause:
+            broadcast = self.sender.run(self.sender.claim(
+                Broadcast.objects.create(campaign=self.campaign, text='Hi', status='queued').id
+            ))
+        self.assertIn(mock.call(1), pause.call_args_list)
+        self.assertEqual(broadcast.sent, 25)
+
+    def test_text_longer_than_telegram_limit_is_rejected(self):
+        broadcast = Broadcast(campaign=self.campaign, text='x' * (Broadcast.MAX_TEXT_LENGTH + 1))
+        with self.assertRaises(ValidationError):
+            broadcast.full_clean()
+
+    def test_classify_response(self):
+        self.assertEqual(classify_response({'ok': True}), ('sent', ''))
+        self.assertEqual(classify_response({'ok': False, 'error_code': 403, 'description': 'x'})[0], 'blocked')
+        self.assertEqual(classify_response({'ok': False, 'error_code': 400, 'description': 'Bad'}), ('failed', '400 Bad'))
+
+
+@override_settings(BOT_API_GLOBAL_RATE=30, BROADCAST_RATE=10, BOT_API_RATE_CACHE_ALIAS=None)
+class BroadcastShareTests(TestCase):
+    """Доля рассылки вычитается из лимита живого трафика, только пока рассылка идет"""
+
+    def setUp(self):
+        self.bot = Bot.objects.create(name='Main', key='main', token='TOKEN')
+        self.campaign = Campaign.objects.create(name='News', slug='news', bot=self.bot)
+        broadcast_activity._checked.clear()
+        self.addCleanup(broadcast_activity._checked.clear)
+
+    def live_rate(self, **settings):
+        with self.settings(**settings):
+            limiter = bot_rate_limiter('main')
+        limiter.reserve()
+        return limiter.global_bucket.rate
+
+    def test_whole_limit_is_available_without_broadcast(self):
+        Broadcast.objects.create(campaign=self.campaign, text='Hi', status='queued')
+        self.assertEqual(self.live_rate(), 30)
+
+    def test_running_broadcast_takes_its_share(self):
+        Broadcast.objects.create(campaign=self.campaign, text='Hi', status='running')
+        self.assertEqual(self.live_rate(), 20)
+        # Каждый из процессов уступает свою часть доли рассылки
+        broadcast_activity._checked.clear()
+        self.assertEqual(self.live_rate(BOT_API_PROCESSES=2), 10)
+
+    def test_broadcast_of_other_bot_does_not_count(self):
+        Broadcast.objects.create(campaign=Campaign.objects.create(name='Default', slug='default'), text='Hi',
+                                 status='running')
+        self.assertEqual(self.live_rate(), 30)
+
+
+class ReservedSharedWindowTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_live_traffic_leaves_reserved_places_in_shared_window(self):
+        shared = SharedRateWindow('default', 'reserved-bot', rate=3, max_wait=5)
+        live = RateLimiter(global_rate=None, chat_rate=1000, chat_burst=1000, shared=shared, reserved=lambda: 2)
+        broadcast = RateLimiter(global_rate=None, chat_rate=1000, chat_burst=1000, shared=shared)
+        waits = [live.reserve(chat_id) for chat_id in range(3)]
+        # Живому трафику - одно место в окне, рассылке остаются два
+        self.assertEqual(waits[0], 0.0)
+        self.assertTrue(all(wait > 0 for wait in waits[1:]))
+        self.assertEqual(broadcast.reserve(10), 0.0)
+
+
+class UnblockOnMessageTests(TransactionTestCase):
+    """Заблокировавший бота пользователь снова пишет - рассылки ему снова идут"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Live', slug='live', status='active', bot_is_running=True)
+        self.bot_api = use_fake_bot_api(self)
+
+    def post(self, update):
+        response = self.client.post('/campaigns/telegram/', json.dumps(update), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        get_update_executor().join()
+
+    def blocked(self, telegram_id, stage):
+        return Participant.objects.create(
+            campaign=self.campaign, telegram_id=telegram_id, first_name='', phone='',
+            registration_stage=stage, bot_blocked=True,
+        )
+
+    def test_start_unblocks_user(self):
+        participant = self.blocked(1000, 'completed')
+        self.post(message_update(1000, '/start'))
+        participant.refresh_from_db()
+        self.assertFalse(participant.bot_blocked)
+
+    def test_message_at_registration_stage_unblocks_user(self):
+        participant = self.blocked(1001, 'name')
+        self.post(message_update(1001, 'Анна'))
+        participant.refresh_from_db()
+        self.assertFalse(participant.bot_blocked)
+        self.assertEqual((participant.first_name, participant.registration_stage), ('Анна', 'phone'))
+
+    def test_messages_of_unblocked_users_do_not_write_flag(self):
+        Participant.objects.create(campaign=self.campaign, telegram_id=1002, first_name='', phone='',
+                                   registration_stage='name')
+        with mock.patch('campaigns.telegram_handlers.unblock_user') as unblock:
+            self.post(message_update(1002, 'Анна'))
+        unblock.assert_not_called()
@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from campaigns.campaign_stats import count_campaign, funnel, reconcile
+from campaigns.models import Campaign, CampaignStats, Participant
+from campaigns.registration_state import RegistrationStateStore
+
+
+def counters(campaign):
+    stats = CampaignStats.objects.get(campaign=campaign)
+    return {field: getattr(stats, field) for field in count_campaign(campaign.id)}
+
+
+class CampaignStatsTests(TestCase):
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Stats', slug='stats')
+
+    def test_flush_keeps_funnel_counters_in_step(self):
+        store = RegistrationStateStore()
+        state = store.create(self.campaign.id, 5, registration_stage='start')
+        state.registration_stage = 'completed'
+        state.is_subscribed = True
+        store.save(state)
+        stats = CampaignStats.objects.get(campaign=self.campaign)
+        self.assertEqual((stats.participants, stats.subscribed, stats.stage_start, stats.stage_completed), (1, 1, 0, 1))
+        self.assertEqual(reconcile(self.campaign.id), {})
+
+    def test_reconcile_fixes_drift(self):
+        Participant.objects.create(campaign=self.campaign, telegram_id=1, first_name='A', phone='')
+        self.assertEqual(reconcile(self.campaign.id), {'participants': (0, 1), 'stage_start': (0, 1)})
+        self.assertEqual(counters(self.campaign), count_campaign(self.campaign.id))
+
+    def test_funnel_counts_users_who_reached_each_stage(self):
+        stats = CampaignStats(campaign=self.campaign, stage_start=4, stage_name=3, stage_phone=2, stage_completed=1)
+        self.assertEqual(
+            funnel(stats),
+            [('start', 10), ('name', 6), ('phone', 3), ('subscription', 1), ('completed', 1)],
+        )
+
+
+class CampaignStatsAdminTests(TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        self.first = Campaign.objects.create(name='First', slug='first')
+        self.second = Campaign.objects.create(name='Second', slug='second')
+        self.participant = Participant.objects.create(campaign=self.first, telegram_id=1, first_name='A', phone='1')
+        reconcile(self.first.id)
+
+    def test_admin_edit_moves_counters_between_campaigns(self):
+        self.client.post(f'/admin/campaigns/participant/{self.participant.id}/change/', {
+            'campaign': self.second.id, 'telegram_id': 1, 'username': '', 'first_name': 'A', 'phone': '1',
+            'tickets': 1, 'registration_stage': 'completed', 'is_subscribed': 'on',
+        })
+        for campaign in (self.first, self.second):
+            self.assertEqual(counters(campaign), count_campaign(campaign.id))
+
+    def test_admin_delete_subtracts_participant(self):
+        self.client.post(f'/admin/campaigns/participant/{self.participant.id}/delete/', {'post': 'yes'})
+        self.assertFalse(Participant.objects.exists())
+        self.assertEqual(counters(self.first)['participants'], 0)
@@ -0,0 +1,32 @@
+from django.test import TestCase
+
+from campaigns.dedup import UpdateDeduplicator
+from campaigns.models import ProcessedUpdate
+
+
+class UpdateDeduplicatorTests(TestCase):
+    def test_window_drops_repeated_update_ids(self):
+        deduplicator = UpdateDeduplicator(window=2)
+        self.assertFalse(deduplicator.is_duplicate(1))
+        self.assertTrue(deduplicator.is_duplicate(1))
+        self.assertFalse(deduplicator.is_duplicate(1, 'other'))
+        deduplicator.is_duplicate(2)
+        deduplicator.is_duplicate(3)
+        # update_id 1 вышел за окно
+        self.assertFalse(deduplicator.is_duplicate(1))
+
+    def test_database_catches_redeliveries_to_another_process(self):
+        UpdateDeduplicator(use_db=True).is_duplicate(10)
+        self.assertTrue(UpdateDeduplicator(use_db=True).is_duplicate(10))
+
+    def test_polling_checks_do_not_touch_the_table(self):
+        deduplicator = UpdateDeduplicator(use_db=True)
+        self.assertFalse(deduplicator.is_duplicate(20, persistent=False))
+        self.assertFalse(ProcessedUpdate.objects.exists())
+
+    def test_reset_allows_rereading_updates(self):
+        deduplicator = UpdateDeduplicator(use_db=True)
+        deduplicator.is_duplicate(30)
+        deduplicator.reset()
+        self.assertFalse(ProcessedUpdate.objects.exists())
+        self.assertFalse(deduplicator.is_duplicate(30))
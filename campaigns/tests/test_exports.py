@@ -0,0 +1,125 @@
+import csv
+import gzip
+import io
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase
+from openpyxl import load_workbook
+
+from campaigns.export_jobs import ExportJobRunner, campaign_fingerprint
+from campaigns.exports import PARTICIPANT_HEADERS, participants_csv, write_participants_xlsx
+from campaigns.models import Campaign, ExportJob, Participant
+
+
+class ParticipantExportTests(TestCase):
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Export', slug='export', winners_count=1)
+        Participant.objects.create(
+            campaign=self.campaign, telegram_id=1, username='anna', first_name='Анна', phone='+79990000001',
+            is_subscribed=True, tickets=2,
+        )
+        Participant.objects.create(campaign=self.campaign, telegram_id=2, first_name='Борис', phone='+79990000002')
+        # Участник другого мероприятия в выгрузку не попадает
+        other = Campaign.objects.create(name='Other', slug='other')
+        Participant.objects.create(campaign=other, telegram_id=3, first_name='Чужой', phone='3')
+
+    def csv_rows(self, data):
+        text = data.decode('utf-8')
+        self.assertTrue(text.startswith('\ufeff'))
+        return list(csv.reader(io.StringIO(text[1:])))
+
+    def test_csv_contains_every_participant_of_campaign(self):
+        rows = self.csv_rows(b''.join(participants_csv(self.campaign)))
+        self.assertEqual(tuple(rows[0]), PARTICIPANT_HEADERS)
+        self.assertEqual(
+            [row[1:7] for row in rows[1:]],
+            [
+                ['1', 'anna', 'Анна', '+79990000001', 'Да', '2'],
+                ['2', 'Не указан', 'Борис', '+79990000002', 'Нет', '1'],
+            ],
+        )
+
+    def test_gzip_stream_has_same_content(self):
+        plain = b''.join(participants_csv(self.campaign))
+        compressed = b''.join(participants_csv(self.campaign, compress=True))
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_progress_reports_written_rows(self):
+        progress = []
+        b''.join(participants_csv(self.campaign, progress=progress.append))
+        self.assertEqual(progress[-1], 2)
+
+    def test_xlsx_has_participants_winners_and_summary(self):
+        self.campaign.winners = [{'place': 1, 'tier': '', 'name': 'Анна', 'phone': '+79990000001', 'telegram_id': 1}]
+        buffer = io.BytesIO()
+        self.assertEqual(write_participants_xlsx(self.campaign, buffer), 2)
+
+        workbook = load_workbook(io.BytesIO(buffer.getvalue()), read_only=True)
+        self.assertEqual(workbook.sheetnames, ['Участники', 'Победители', 'Информация'])
+        participants = list(workbook['Участники'].values)
+        self.assertEqual(participants[0], PARTICIPANT_HEADERS)
+        self.assertEqual([row[3] for row in participants[1:]], ['Анна', 'Борис'])
+        self.assertEqual(list(workbook['Победители'].values)[1], (1, None, 'Анна', '+79990000001', 1))
+        self.assertIn(('Количество участников', 2), list(workbook['Информация'].values))
+
+
+class ExportJobTests(TransactionTestCase):
+    """Фоновые выгрузки: файлы под EXPORT_ROOT, повторное использование по отпечатку"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Jobs', slug='jobs')
+        self.participant = Participant.objects.create(campaign=self.campaign, telegram_id=1, first_name='A', phone='')
+
+    def run_export(self, export_format='csv'):
+        runner = ExportJobRunner(workers=1)
+        job = runner.request(self.campaign, export_format)
+        runner.pool.shutdown(wait=True)
+        job.refresh_from_db()
+        if job.file:
+            self.addCleanup(lambda path=job.file.path: os.path.exists(path) and os.unlink(path))
+        return job
+
+    def test_fingerprint_follows_participant_changes(self):
+        fingerprint, total = campaign_fingerprint(self.campaign)
+        self.assertEqual(total, 1)
+        self.assertEqual(campaign_fingerprint(self.campaign)[0], fingerprint)
+
+        self.participant.phone = '+79990000000'
+        self.participant.registration_stage = 'subscription'
+        self.participant.save()
+        self.assertNotEqual(campaign_fingerprint(self.campaign)[0], fingerprint)
+
+    def test_file_is_written_outside_media_root(self):
+        job = self.run_export()
+        self.assertEqual((job.status, job.progress), ('done', 1))
+        path = os.path.realpath(job.file.path)
+        self.assertTrue(path.startswith(os.path.realpath(settings.EXPORT_ROOT) + os.sep))
+        self.assertFalse(path.startswith(os.path.realpath(settings.MEDIA_ROOT) + os.sep))
+        with job.file.open('rb') as fileobj:
+            self.assertEqual(fileobj.read(), b''.join(participants_csv(self.campaign)))
+
+    def test_unchanged_campaign_reuses_file(self):
+        job = self.run_export()
+        self.assertEqual(ExportJobRunner().request(self.campaign, 'csv').id, job.id)
+
+    def test_changed_campaign_replaces_outdated_file(self):
+        old = self.run_export()
+        Participant.objects.create(campaign=self.campaign, telegram_id=2, first_name='B', phone='')
+        new = self.run_export()
+        self.assertNotEqual(new.id, old.id)
+        self.assertEqual(new.progress, 2)
+        self.assertFalse(os.path.exists(old.file.path))
+        self.assertFalse(ExportJob.objects.filter(id=old.id).exists())
+
+    def test_download_requires_staff(self):
+        job = self.run_export()
+        url = f'/admin/campaigns/exportjob/{job.id}/download/'
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b''.join(participants_csv(self.campaign)))
@@ -0,0 +1,51 @@
+import json
+import logging
+
+from django.test import SimpleTestCase
+
+from campaigns.logging_utils import REDACTED, JsonFormatter, LazyJson, PiiRedactingFilter, redact_update
+
+
+def make_record(msg, *args, **extra):
+    record = logging.LogRecord('campaigns.test', logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class PiiRedactingFilterTests(SimpleTestCase):
+    def test_phone_in_arguments_is_masked(self):
+        record = make_record("Contact from %s: %s", 42, '+7 999 123-45-67')
+        self.assertTrue(PiiRedactingFilter().filter(record))
+        self.assertEqual(record.getMessage(), f"Contact from 42: {REDACTED}")
+        self.assertIsNone(record.args)
+
+    def test_record_without_phone_is_left_alone(self):
+        record = make_record("User %s stage %s", 42, 'name')
+        PiiRedactingFilter().filter(record)
+        self.assertEqual(record.args, (42, 'name'))
+        self.assertEqual(record.getMessage(), "User 42 stage name")
+
+    def test_update_dump_masks_personal_fields(self):
+        update = {
+            'update_id': 1,
+            'message': {
+                'from': {'id': 42, 'first_name': 'Анна', 'username': 'anna', 'last_name': ''},
+                'contact': {'phone_number': '+79991234567', 'user_id': 42},
+                'text': 'мой номер 89991234567',
+            },
+        }
+        dumped = json.loads(str(LazyJson(update)))
+        message = dumped['message']
+        self.assertEqual(message['from'], {'id': 42, 'first_name': REDACTED, 'username': REDACTED, 'last_name': ''})
+        self.assertEqual(message['contact']['phone_number'], REDACTED)
+        self.assertEqual(message['text'], f'мой номер {REDACTED}')
+        # Исходный апдейт не меняется
+        self.assertEqual(update['message']['contact']['phone_number'], '+79991234567')
+        self.assertEqual(redact_update([{'phone': ''}]), [{'phone': ''}])
+
+    def test_json_formatter_keeps_extra_fields(self):
+        record = make_record("Processed %s", 1, update_id=7, duration_ms=3.5)
+        payload = json.loads(JsonFormatter().format(record))
+        self.assertEqual(payload['message'], 'Processed 1')
+        self.assertEqual((payload['update_id'], payload['duration_ms']), (7, 3.5))
+        self.assertEqual(payload['level'], 'INFO')
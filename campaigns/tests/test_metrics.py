@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from campaigns.metrics import MetricsRegistry, registry, set_stage, track_update, update_type
+
+from .helpers import message_update
+
+
+class MetricsRegistryTests(SimpleTestCase):
+    def test_render_prometheus_text_format(self):
+        metrics = MetricsRegistry()
+        updates = metrics.counter('test_updates_total', 'Апдейты', ['type'])
+        latency = metrics.histogram('test_seconds', 'Время', buckets=(0.1, 1.0))
+        updates.inc(type='message')
+        updates.inc(2, type='contact')
+        latency.observe(0.05)
+        latency.observe(0.5)
+
+        self.assertEqual(metrics.render().splitlines(), [
+            '# HELP test_updates_total Апдейты',
+            '# TYPE test_updates_total counter',
+            'test_updates_total{type="contact"} 2',
+            'test_updates_total{type="message"} 1',
+            '# HELP test_seconds Время',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 1',
+            'test_seconds_bucket{le="1.0"} 2',
+            'test_seconds_bucket{le="+Inf"} 2',
+            'test_seconds_sum 0.55',
+            'test_seconds_count 2',
+        ])
+
+    def test_label_values_are_escaped(self):
+        metrics = MetricsRegistry()
+        metrics.counter('test_total', 'Escaping', ['value']).inc(value='a"b\\c\nd')
+        self.assertIn('test_total{value="a\\"b\\\\c\\nd"} 1', metrics.render())
+
+    def test_files_of_other_processes_are_summed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            metrics = MetricsRegistry(directory=directory, flush_interval=60)
+            counter = metrics.counter('test_total', 'Sum', ['bot'])
+            counter.inc(bot='main')
+            # Файл другого воркера gunicorn
+            with open(os.path.join(directory, 'metrics-1-1.json'), 'w') as fileobj:
+                json.dump({'test_total': {json.dumps(['main']): 4}}, fileobj)
+            self.assertIn('test_total{bot="main"} 5', metrics.render())
+
+    def test_track_update_records_type_stage_and_queries(self):
+        self.assertEqual(update_type(message_update(1, '/start')), 'command')
+        self.assertEqual(update_type({'update_id': 1, 'edited_message': {}}), 'edited_message')
+        with track_update(message_update(1, 'Анна'), 'metrics-test'):
+            set_stage('name')
+        rendered = registry.render()
+        self.assertIn('tg_updates_total{bot="metrics-test",type="message"}', rendered)
+        self.assertIn('tg_update_handler_seconds_count{stage="name"}', rendered)
+
+
+class MetricsViewTests(TestCase):
+    url = '/campaigns/metrics/'
+
+    def test_staff_session_is_required_without_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'# TYPE tg_updates_total counter', response.content)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_bearer_token_is_checked(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from campaigns.outbound import MAX_MESSAGE_LENGTH, OutboundComposer, OutboundScheduler
+
+KEYBOARD = {'inline_keyboard': [[{'text': 'OK', 'callback_data': 'ok'}]]}
+
+
+class OutboundComposerTests(SimpleTestCase):
+    def compose(self, *messages):
+        composer = OutboundComposer(send=None)
+        for text, options in messages:
+            composer.add(1, text, **options)
+        return composer.compose()
+
+    def test_consecutive_texts_are_sent_as_one_message(self):
+        composed = self.compose(('Первое', {}), ('Второе', {'reply_markup': KEYBOARD}))
+        self.assertEqual(len(composed), 1)
+        self.assertEqual(composed[0].text, 'Первое\n\nВторое')
+        self.assertEqual(composed[0].reply_markup, KEYBOARD)
+
+    def test_plain_text_is_escaped_when_merged_with_markdown(self):
+        composed = self.compose(('snake_case', {}), ('*жирный*', {'parse_mode': 'Markdown'}))
+        self.assertEqual(len(composed), 1)
+        self.assertEqual(composed[0].text, 'snake\\_case\n\n*жирный*')
+        self.assertEqual(composed[0].parse_mode, 'Markdown')
+
+    def test_different_parse_modes_are_not_merged(self):
+        composed = self.compose(('<b>a</b>', {'parse_mode': 'HTML'}), ('*b*', {'parse_mode': 'Markdown'}))
+        self.assertEqual(len(composed), 2)
+
+    def test_message_with_keyboard_ends_the_block(self):
+        composed = self.compose(('Выберите', {'reply_markup': KEYBOARD}), ('Дальше', {}))
+        self.assertEqual([message.text for message in composed], ['Выберите', 'Дальше'])
+
+    def test_merged_text_stays_within_telegram_limit(self):
+        half = 'x' * (MAX_MESSAGE_LENGTH // 2)
+        composed = self.compose((half, {}), (half, {}), ('tail', {}))
+        self.assertEqual(len(composed), 2)
+        self.assertTrue(all(len(message.text) <= MAX_MESSAGE_LENGTH for message in composed))
+
+    def test_delayed_message_is_sent_separately(self):
+        composed = self.compose(('Сразу', {}), ('Потом', {'delay': 1.0}))
+        self.assertEqual([message.delay for message in composed], [0.0, 1.0])
+
+
+class OutboundSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.scheduler = OutboundScheduler(workers=2, queue_size=100)
+        self.addCleanup(self.scheduler._senders.shutdown)
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, label):
+        def send():
+            with self.lock:
+                self.sent.append((label, time.monotonic()))
+        return send
+
+    def wait_idle(self, timeout=2):
+        deadline = time.monotonic() + timeout
+        while self.scheduler.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.scheduler.pending(), 0)
+
+    def test_delays_are_counted_from_previous_message(self):
+        started = time.monotonic()
+        self.scheduler.dispatch(1, [(0, self.send('a')), (0.1, self.send('b')), (0.1, self.send('c'))])
+        # Первое сообщение без задержки уходит сразу, в вызывающем потоке
+        self.assertEqual([label for label, _ in self.sent], ['a'])
+        self.wait_idle()
+        self.assertEqual([label for label, _ in self.sent], ['a', 'b', 'c'])
+        self.assertGreaterEqual(self.sent[2][1] - started, 0.2)
+
+    def test_new_messages_wait_behind_delayed_ones_of_same_chat(self):
+        self.scheduler.dispatch(1, [(0.1, self.send('delayed'))])
+        self.scheduler.dispatch(1, [(0, self.send('next'))])
+        self.wait_idle()
+        self.assertEqual([label for label, _ in self.sent], ['delayed', 'next'])
+
+    def test_slow_chat_does_not_delay_other_chats(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        # Чаты 1 и 2 попадают в разные шарды пула отправки
+        self.scheduler.dispatch(1, [(0.01, lambda: release.wait(5))])
+        self.scheduler.dispatch(2, [(0.05, self.send('other'))])
+
+        deadline = time.monotonic() + 2
+        while not self.sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([label for label, _ in self.sent], ['other'])
+        self.assertEqual(self.scheduler.pending(), 1)
+        release.set()
+        self.wait_idle()
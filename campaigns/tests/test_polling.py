@@ -0,0 +1,65 @@
+from io import StringIO
+from unittest import mock
+
+import requests
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from campaigns.bot_api import DEFAULT_BOT_KEY
+from campaigns.models import Campaign, Participant, PollingState
+
+from .helpers import message_update, use_fake_bot_api
+
+
+class PollingCommandTests(TransactionTestCase):
+    """run_bot_polling --once с клиентом Bot API без сети"""
+
+    def setUp(self):
+        Campaign.objects.create(name='Polling', slug='polling', status='active', bot_is_running=True)
+        self.backlog = [message_update(600 + index, '/start') for index in range(3)]
+        self.failures = []
+        self.bot_api = use_fake_bot_api(self, self.responder)
+
+    def responder(self, method, params):
+        if method != 'getUpdates':
+            return {'ok': True, 'result': True}
+        if self.failures:
+            raise self.failures.pop(0)
+        # Как Telegram: отдает апдейты начиная со смещения
+        offset = params.get('offset', 0)
+        return {'ok': True, 'result': [update for update in self.backlog if update['update_id'] >= offset]}
+
+    def poll(self, *args):
+        call_command('run_bot_polling', '--once', *args, stdout=StringIO(), stderr=StringIO())
+
+    def offsets(self):
+        return [params.get('offset') for method, params in self.bot_api.requests if method == 'getUpdates']
+
+    def test_offset_is_saved_after_the_batch(self):
+        self.poll()
+        last_id = self.backlog[-1]['update_id']
+        self.assertEqual(PollingState.objects.get(bot_key=DEFAULT_BOT_KEY).offset, last_id + 1)
+        self.assertEqual(Participant.objects.count(), 3)
+        self.assertEqual(self.offsets(), [None, last_id + 1])
+        self.assertEqual(self.bot_api.requests[0][0], 'deleteWebhook')
+
+    def test_restart_continues_from_saved_offset(self):
+        self.poll()
+        self.bot_api.requests.clear()
+        self.poll()
+        # Подтвержденные апдейты второй раз не запрашиваются и не обрабатываются
+        self.assertEqual(self.offsets(), [self.backlog[-1]['update_id'] + 1])
+        self.assertEqual(self.bot_api.texts(), [])
+
+    def test_reset_offset_rereads_backlog(self):
+        self.poll()
+        Participant.objects.all().delete()
+        self.poll('--reset-offset')
+        self.assertEqual(Participant.objects.count(), 3)
+
+    def test_network_error_is_retried_with_backoff(self):
+        self.failures = [requests.ConnectionError('down'), requests.Timeout('slow')]
+        with mock.patch('campaigns.management.commands.run_bot_polling.time.sleep') as sleep:
+            self.poll()
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 2])
+        self.assertEqual(Participant.objects.count(), 3)
@@ -0,0 +1,115 @@
+import random
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from campaigns.models import Campaign, Participant
+from campaigns.raffle import (
+    RaffleError, numpy_rng, reservoir_sample, run_raffle, verify_raffle, weighted_order,
+)
+
+
+def add_participants(campaign, count, tickets=lambda index: 1):
+    """count участников; подписаны участники с четным telegram_id"""
+    Participant.objects.bulk_create([
+        Participant(campaign=campaign, telegram_id=index, first_name=f'P{index}', phone=str(index),
+                    is_subscribed=index % 2 == 0, tickets=tickets(index))
+        for index in range(count)
+    ])
+
+
+class RaffleTests(TestCase):
+    def test_reservoir_sample_is_uniform_and_reproducible(self):
+        sample, seen = reservoir_sample(range(1000), 10, random.Random('seed'))
+        self.assertEqual(seen, 1000)
+        self.assertEqual(len(set(sample)), 10)
+        self.assertEqual(sample, reservoir_sample(range(1000), 10, random.Random('seed'))[0])
+
+        hits = [0] * 10
+        for index in range(3000):
+            for item in reservoir_sample(range(10), 3, random.Random(index))[0]:
+                hits[item] += 1
+        # Каждый элемент попадает в выборку с вероятностью 3/10
+        for count in hits:
+            self.assertAlmostEqual(count / 3000, 0.3, delta=0.04)
+
+    def test_reservoir_sample_of_short_stream(self):
+        self.assertEqual(reservoir_sample(range(3), 5, random.Random(1)), ([0, 1, 2], 3))
+
+    def test_run_raffle_picks_subscribed_and_is_verifiable(self):
+        campaign = Campaign.objects.create(name='Raffle', slug='raffle', status='active', winners_count=3)
+        add_participants(campaign, 20)
+        result = run_raffle(campaign.id, seed='fixed')
+        self.assertEqual(result.pool_size, 10)
+        self.assertEqual(len({winner['telegram_id'] for winner in result.winners}), 3)
+        self.assertTrue(all(winner['telegram_id'] % 2 == 0 for winner in result.winners))
+
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'raffled')
+        self.assertFalse(campaign.bot_is_running)
+        self.assertTrue(verify_raffle(campaign))
+        with self.assertRaises(RaffleError):
+            run_raffle(campaign.id)
+
+    def test_too_few_participants_is_an_error(self):
+        campaign = Campaign.objects.create(name='Small', slug='small', status='active', winners_count=5)
+        add_participants(campaign, 4)
+        with self.assertRaises(RaffleError):
+            run_raffle(campaign.id)
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.status, campaign.winners), ('active', []))
+
+
+class WeightedRaffleTests(TestCase):
+    def test_weighted_order_prefers_more_tickets(self):
+        wins = 0
+        for index in range(500):
+            order = weighted_order([1.0, 9.0], 1, numpy_rng(str(index)))
+            wins += order[0] == 1
+        # Вероятность первого места пропорциональна билетам: 9/10
+        self.assertAlmostEqual(wins / 500, 0.9, delta=0.05)
+
+    def test_weighted_order_has_no_repeats(self):
+        order = weighted_order([1.0] * 10 + [100.0], 11, numpy_rng('all'))
+        self.assertEqual(sorted(order.tolist()), list(range(11)))
+        self.assertEqual(len(weighted_order([1.0, 2.0], 5, numpy_rng('short'))), 2)
+
+    def test_prize_tiers_follow_draw_order(self):
+        campaign = Campaign.objects.create(
+            name='Tiers', slug='tiers', status='active', bonus_channel_usernames='@bonus',
+            prize_tiers=[{'name': 'Главный', 'count': 1}, {'name': 'Второй', 'count': 2}],
+        )
+        add_participants(campaign, 40, tickets=lambda index: 1 + index % 3)
+        result = run_raffle(campaign.id, seed='tiers')
+        self.assertEqual(
+            [(winner['place'], winner['tier']) for winner in result.winners],
+            [(1, 'Главный'), (2, 'Второй'), (3, 'Второй')],
+        )
+        self.assertEqual(result.pool_size, 20)
+        campaign.refresh_from_db()
+        self.assertTrue(verify_raffle(campaign))
+
+
+class RaffleAdminTests(TestCase):
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Admin', slug='admin', status='active', winners_count=1)
+        Participant.objects.create(campaign=self.campaign, telegram_id=1, first_name='A', phone='1', is_subscribed=True)
+        self.url = f'/admin/campaigns/campaign/{self.campaign.id}/raffle/'
+
+    def test_anonymous_request_cannot_draw(self):
+        response = self.client.get(self.url + '?confirm=true')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/admin/login/', response['Location'])
+        self.campaign.refresh_from_db()
+        self.assertFalse(self.campaign.winners)
+
+    def test_draw_requires_post(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        self.client.get(self.url + '?confirm=true')
+        self.campaign.refresh_from_db()
+        self.assertFalse(self.campaign.winners)
+
+        self.client.post(self.url, {'confirm': 'true'})
+        self.campaign.refresh_from_db()
+        self.assertEqual(len(self.campaign.winners), 1)
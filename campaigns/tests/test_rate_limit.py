@@ -0,0 +1,74 @@
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from campaigns.rate_limit import RateLimiter, SharedRateWindow, TokenBucket
+
+from .helpers import FakeBotApiClient
+
+
+def too_many_requests(method, params):
+    return {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 3}}
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_token_bucket_waits_for_next_token(self):
+        bucket = TokenBucket(rate=10, capacity=1)
+        now = bucket.updated_at
+        self.assertEqual(bucket.wait_time(now), 0.0)
+        bucket.consume()
+        self.assertAlmostEqual(bucket.wait_time(now), 0.1)
+
+    def test_chat_limit_does_not_delay_other_chats(self):
+        limiter = RateLimiter(global_rate=1000, chat_rate=1, chat_burst=1, max_wait=5)
+        self.assertEqual(limiter.reserve(1), 0.0)
+        self.assertGreater(limiter.reserve(1), 0.5)
+        self.assertEqual(limiter.reserve(2), 0.0)
+
+    def test_wait_longer_than_max_wait_is_rejected(self):
+        limiter = RateLimiter(global_rate=1000, max_wait=1)
+        limiter.pause(10)
+        self.assertIsNone(limiter.reserve(1))
+        self.assertFalse(limiter.acquire(2))
+        self.assertEqual(limiter.rejected, 2)
+
+    def test_telegram_429_pauses_every_chat(self):
+        limiter = RateLimiter(global_rate=1000, max_wait=60)
+        client = FakeBotApiClient(too_many_requests, rate_limiter=limiter)
+        client.send_message(1, 'hi')
+        # Ответ 429 пришел на чат 1, но ждать должен весь бот
+        self.assertGreater(limiter.reserve(2), 2)
+        self.assertEqual(client.rate_limited, 1)
+
+
+class SharedRateWindowTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def limiter(self, rate=2, max_wait=5):
+        # Каждый лимитер - как отдельный процесс: своих bucket-ов нет, окно общее
+        shared = SharedRateWindow('default', 'test-bot', rate=rate, max_wait=max_wait)
+        return RateLimiter(global_rate=None, chat_rate=1000, chat_burst=1000, max_wait=max_wait, shared=shared)
+
+    def test_processes_share_one_window(self):
+        limiters = [self.limiter(), self.limiter()]
+        waits = [limiters[chat_id % 2].reserve(chat_id) for chat_id in range(5)]
+        self.assertEqual(waits[0], 0.0)
+        # Пять вызовов не помещаются в два окна по 2 места - кто-то ждет следующей секунды
+        self.assertTrue(any(wait > 0 for wait in waits))
+
+    def test_full_windows_beyond_max_wait_are_rejected(self):
+        limiter = self.limiter(rate=1, max_wait=1)
+        results = [limiter.reserve(chat_id) for chat_id in range(4)]
+        self.assertIsNone(results[-1])
+        self.assertGreaterEqual(limiter.rejected, 1)
+
+    def test_429_in_one_process_pauses_the_others(self):
+        first, second = self.limiter(max_wait=60), self.limiter(max_wait=60)
+        FakeBotApiClient(too_many_requests, rate_limiter=first).send_message(1, 'hi')
+        self.assertGreater(second.reserve(2), 2)
+
+    def test_chat_pause_stays_local(self):
+        first, second = self.limiter(max_wait=60), self.limiter(max_wait=60)
+        first.pause(10, chat_id=1)
+        self.assertGreater(first.reserve(1), 9)
+        self.assertEqual(second.reserve(1), 0.0)
@@ -0,0 +1,89 @@
+from django.test import TestCase
+
+from campaigns.campaign_stats import reconcile
+from campaigns.models import Campaign, CampaignStats, Participant
+from campaigns.registration_state import (
+    DURABILITY_BATCHED, DURABILITY_COMPLETED, DURABILITY_SYNC, RegistrationStateStore,
+)
+
+
+class RegistrationStateStoreTests(TestCase):
+    def setUp(self):
+        self.campaign = Campaign.objects.create(name='Store', slug='store')
+
+    def stored(self, telegram_id):
+        return Participant.objects.get(campaign=self.campaign, telegram_id=telegram_id)
+
+    def test_sync_store_writes_immediately_and_reads_from_database(self):
+        store = RegistrationStateStore()
+        self.assertEqual(store.durability, DURABILITY_SYNC)
+        store.create(self.campaign.id, 1, first_name='Ann', registration_stage='name')
+        self.assertEqual(self.stored(1).registration_stage, 'name')
+
+        # Другой воркер продвинул пользователя - без локального кэша это сразу видно
+        Participant.objects.filter(telegram_id=1).update(registration_stage='phone')
+        self.assertEqual(store.get(self.campaign.id, 1).registration_stage, 'phone')
+
+    def test_write_behind_needs_shared_cache_or_single_process(self):
+        with self.assertLogs('campaigns.registration_state', 'WARNING'):
+            store = RegistrationStateStore(durability=DURABILITY_BATCHED)
+        self.assertEqual(store.durability, DURABILITY_SYNC)
+        self.assertEqual(
+            RegistrationStateStore(durability=DURABILITY_BATCHED, single_process=True).durability,
+            DURABILITY_BATCHED,
+        )
+        self.assertEqual(
+            RegistrationStateStore(durability=DURABILITY_COMPLETED, alias='default').durability,
+            DURABILITY_COMPLETED,
+        )
+
+    def test_completed_mode_flushes_only_completion(self):
+        store = RegistrationStateStore(durability=DURABILITY_COMPLETED, single_process=True, flush_interval=60)
+        state = store.create(self.campaign.id, 2, first_name='Bob', registration_stage='name')
+        self.assertFalse(Participant.objects.exists())
+        self.assertEqual(store.get(self.campaign.id, 2).first_name, 'Bob')
+
+        state.registration_stage = 'completed'
+        store.save(state)
+        self.assertEqual(store.pending(), 0)
+        self.assertEqual(self.stored(2).registration_stage, 'completed')
+
+    def test_deferred_batch_is_written_once_at_exit(self):
+        store = RegistrationStateStore()
+        with store.deferred():
+            store.prefetch(self.campaign.id, [3, 4])
+            self.assertIsNone(store.get(self.campaign.id, 3))
+            store.create(self.campaign.id, 3, first_name='C')
+            store.create(self.campaign.id, 4, first_name='D')
+            self.assertFalse(Participant.objects.exists())
+        self.assertEqual(Participant.objects.count(), 2)
+        self.assertEqual(store.flushes, 1)
+        # Прочитанное в пачке не живет дольше пачки
+        self.assertFalse(store._entries)
+
+    def test_stale_copy_does_not_overwrite_newer_row(self):
+        RegistrationStateStore().create(self.campaign.id, 5, registration_stage='name')
+        worker_a = RegistrationStateStore()
+        worker_b = RegistrationStateStore()
+
+        with worker_b.deferred():
+            stale = worker_b.get(self.campaign.id, 5)
+            with worker_a.deferred():
+                fresh = worker_a.get(self.campaign.id, 5)
+                fresh.registration_stage = 'phone'
+                worker_a.save(fresh)
+            # Второй процесс сбрасывает копию, прочитанную до записи первого
+            stale.registration_stage = 'name'
+            stale.first_name = 'Old'
+            worker_b.save(stale)
+            with self.assertLogs('campaigns.registration_state', 'WARNING'):
+                worker_b.flush()
+
+        participant = self.stored(5)
+        self.assertEqual((participant.registration_stage, participant.first_name), ('phone', ''))
+        self.assertEqual(participant.state_version, 2)
+        self.assertEqual((worker_b.stale_skipped, worker_b.rows_written), (1, 0))
+        # Устаревшая копия не меняет счетчики воронки второй раз
+        stats = CampaignStats.objects.get(campaign=self.campaign)
+        self.assertEqual((stats.participants, stats.stage_name, stats.stage_phone), (1, 0, 1))
+        self.assertEqual(reconcile(self.campaign.id), {})
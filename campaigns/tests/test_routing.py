@@ -0,0 +1,82 @@
+import json
+
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from campaigns.campaign_binding import CampaignBindingStore
+from campaigns.models import Campaign, Participant, UserCampaignBinding
+from campaigns.telegram_handlers import parse_start_payload
+from campaigns.update_executor import get_update_executor
+
+from .helpers import message_update, use_fake_bot_api
+
+
+class StartPayloadTests(SimpleTestCase):
+    def test_parse_start_payload(self):
+        self.assertEqual(parse_start_payload('/start'), '')
+        self.assertEqual(parse_start_payload('/start summer '), 'summer')
+        self.assertIsNone(parse_start_payload('/started'))
+        self.assertIsNone(parse_start_payload('Анна'))
+
+
+class DeepLinkRoutingTests(TransactionTestCase):
+    """Два мероприятия на одном боте: /start <slug> выбирает мероприятие"""
+
+    def setUp(self):
+        self.default = Campaign.objects.create(
+            name='Default', slug='default', status='active', bot_is_running=True, first_message='Default',
+        )
+        self.summer = Campaign.objects.create(
+            name='Summer', slug='summer', status='active', bot_is_running=True, first_message='Summer',
+        )
+        self.bot_api = use_fake_bot_api(self)
+
+    def post(self, *updates):
+        for update in updates:
+            response = self.client.post('/campaigns/telegram/', json.dumps(update), content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        get_update_executor().join()
+
+    def test_deep_link_registers_in_its_campaign(self):
+        self.post(message_update(700, '/start summer'), message_update(700, 'Анна'))
+        participant = Participant.objects.get(telegram_id=700)
+        self.assertEqual(participant.campaign_id, self.summer.id)
+        # Следующие сообщения без payload идут по привязке пользователя
+        self.assertEqual((participant.first_name, participant.registration_stage), ('Анна', 'phone'))
+        self.assertEqual(UserCampaignBinding.objects.get(telegram_id=700).campaign_id, self.summer.id)
+        self.assertTrue(self.bot_api.texts()[0].startswith('Summer'))
+
+    def test_plain_start_and_unknown_slug_use_default_campaign(self):
+        self.post(message_update(701, '/start'))
+        self.post(message_update(702, '/start winter'))
+        self.assertEqual(
+            list(Participant.objects.order_by('telegram_id').values_list('telegram_id', 'campaign_id')),
+            [(701, self.default.id), (702, self.default.id)],
+        )
+
+    def test_user_can_take_part_in_several_campaigns(self):
+        self.post(message_update(703, '/start'), message_update(703, '/start summer'))
+        self.assertEqual(
+            sorted(Participant.objects.filter(telegram_id=703).values_list('campaign_id', flat=True)),
+            [self.default.id, self.summer.id],
+        )
+
+
+class CampaignBindingStoreTests(TestCase):
+    def test_missing_binding_is_not_cached_without_shared_cache(self):
+        campaign = Campaign.objects.create(name='Bind', slug='bind')
+        worker_a = CampaignBindingStore()
+        worker_b = CampaignBindingStore()
+        self.assertIsNone(worker_b.get('default', 1))
+
+        worker_a.bind('default', 1, campaign.id)
+        self.assertEqual(worker_b.get('default', 1), campaign.id)
+
+    def test_shared_cache_sees_rebinding_at_once(self):
+        first = Campaign.objects.create(name='First', slug='first')
+        second = Campaign.objects.create(name='Second', slug='second')
+        worker_a = CampaignBindingStore(alias='default', ttl=300)
+        worker_b = CampaignBindingStore(alias='default', ttl=300)
+        worker_a.bind('default', 2, first.id)
+        self.assertEqual(worker_b.get('default', 2), first.id)
+        worker_a.bind('default', 2, second.id)
+        self.assertEqual(worker_b.get('default', 2), second.id)
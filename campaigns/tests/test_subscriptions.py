@@ -0,0 +1,112 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from campaigns.bot_api import use_bot
+from campaigns.subscriptions import ERROR, NOT_SUBSCRIBED, SUBSCRIBED, SubscriptionCache, SubscriptionChecker
+
+from .helpers import FakeBotApiClient
+
+
+def member(status):
+    return {'ok': True, 'result': {'status': status}}
+
+
+class SubscriptionCheckerTests(SimpleTestCase):
+    def setUp(self):
+        # Канал @slow отвечает только после release
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def responder(self, method, params):
+        channel = params['chat_id']
+        if channel == '@slow':
+            self.release.wait(5)
+            return member('member')
+        if channel.startswith('@left'):
+            return member('left')
+        time.sleep(0.2)
+        return member('member')
+
+    def checker(self, **kwargs):
+        checker = SubscriptionChecker(bot_api=FakeBotApiClient(self.responder), max_workers=4, **kwargs)
+        self.addCleanup(checker._pool.shutdown, wait=False)
+        return checker
+
+    def test_channels_are_checked_in_parallel(self):
+        started = time.monotonic()
+        result = self.checker().check(1, ['@a', '@b', '@c'])
+        self.assertEqual(result, (True, []))
+        # Три запроса по 0.2 с идут одновременно
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_channels_without_answer_before_deadline_are_not_confirmed(self):
+        started = time.monotonic()
+        with self.assertLogs('campaigns.subscriptions', 'WARNING'):
+            result = self.checker(deadline=0.3).check(1, ['@a', '@slow'])
+        self.assertEqual(result, (False, ['@slow']))
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_fail_fast_stops_at_first_refusal(self):
+        checker = self.checker(fail_fast=True)
+        started = time.monotonic()
+        self.assertEqual(checker.check(1, ['@slow', '@left']), (False, ['@left']))
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_failed_channels_keep_campaign_order(self):
+        self.release.set()
+        result = self.checker().check(1, ['@left2', '@a', '@slow', '@left1'], fail_fast=False)
+        self.assertEqual(result, (False, ['@left2', '@left1']))
+
+
+class SubscriptionCacheTests(SimpleTestCase):
+    def test_refusal_expires_sooner_than_subscription(self):
+        cache = SubscriptionCache(positive_ttl=300, negative_ttl=10, error_ttl=0)
+        with mock.patch('campaigns.subscriptions.time.monotonic', return_value=1000):
+            cache.set('@a', 1, SUBSCRIBED)
+            cache.set('@b', 1, NOT_SUBSCRIBED)
+            cache.set('@c', 1, ERROR)
+        with mock.patch('campaigns.subscriptions.time.monotonic', return_value=1011):
+            self.assertEqual(cache.get('@a', 1), SUBSCRIBED)
+            self.assertIsNone(cache.get('@b', 1))
+            # Ошибки с нулевым TTL не кэшируются вовсе
+            self.assertIsNone(cache.get('@c', 1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = SubscriptionCache(max_entries=2)
+        cache.set('@a', 1, SUBSCRIBED)
+        cache.set('@b', 1, SUBSCRIBED)
+        cache.get('@a', 1)
+        cache.set('@c', 1, SUBSCRIBED)
+        self.assertIsNone(cache.get('@b', 1))
+        self.assertEqual(cache.get('@a', 1), SUBSCRIBED)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_checker_answers_repeated_check_from_cache(self):
+        client = FakeBotApiClient(lambda method, params: member('left'))
+        checker = SubscriptionChecker(bot_api=client, max_workers=2, cache=SubscriptionCache())
+        self.addCleanup(checker._pool.shutdown, wait=False)
+        self.assertEqual(checker.check(1, ['@a']), (False, ['@a']))
+        self.assertEqual(checker.check(1, ['@a']), (False, ['@a']))
+        self.assertEqual(len(client.requests), 1)
+
+    def test_results_are_kept_per_bot(self):
+        cache = SubscriptionCache()
+        cache.set('@channel', 1, SUBSCRIBED, 'first')
+        self.assertEqual(cache.get('@Channel', 1, 'first'), SUBSCRIBED)
+        self.assertIsNone(cache.get('@channel', 1, 'second'))
+
+    def test_checker_uses_cache_of_current_bot(self):
+        client = FakeBotApiClient(lambda method, params: member('left'))
+        checker = SubscriptionChecker(bot_api=client, max_workers=2, cache=SubscriptionCache())
+        self.addCleanup(checker._pool.shutdown, wait=False)
+        checker.cache.set('@channel', 1, SUBSCRIBED, 'first')
+
+        with use_bot('first'):
+            self.assertEqual(checker.check(1, ['@channel']), (True, []))
+        with use_bot('second'):
+            self.assertEqual(checker.check(1, ['@channel']), (False, ['@channel']))
+        self.assertEqual(len(client.requests), 1)
+        self.assertEqual(checker.cache.get('@channel', 1, 'second'), NOT_SUBSCRIBED)
@@ -0,0 +1,144 @@
+import json
+import random
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, TransactionTestCase
+
+from campaigns.models import Campaign, Participant
+from campaigns.update_executor import UpdateExecutor, get_update_executor
+
+from .helpers import message_update, use_fake_bot_api
+
+
+class UpdateExecutorTests(SimpleTestCase):
+    def test_updates_of_one_user_are_processed_in_order(self):
+        processed = []
+        lock = threading.Lock()
+
+        def handler(update):
+            time.sleep(random.random() / 1000)
+            with lock:
+                processed.append((update['user'], update['seq']))
+
+        executor = UpdateExecutor(handler, workers=4, queue_size=1000, name='test-order')
+        try:
+            for seq in range(50):
+                for user in range(5):
+                    self.assertTrue(executor.submit(user, {'user': user, 'seq': seq}))
+            executor.join()
+        finally:
+            executor.shutdown()
+
+        for user in range(5):
+            self.assertEqual([seq for u, seq in processed if u == user], list(range(50)))
+
+    def test_full_shard_rejects_instead_of_blocking(self):
+        release = threading.Event()
+        executor = UpdateExecutor(lambda update: release.wait(5), workers=1, queue_size=2, name='test-full')
+        try:
+            # Первый апдейт забирает поток, еще два заполняют очередь
+            self.assertTrue(executor.submit('user', 1))
+            deadline = time.monotonic() + 2
+            while executor.pending() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(executor.submit('user', 2))
+            self.assertTrue(executor.submit('user', 3))
+            self.assertFalse(executor.submit('user', 4))
+            self.assertEqual(executor.rejected, 1)
+        finally:
+            release.set()
+            executor.join()
+            executor.shutdown()
+
+    def test_handler_errors_do_not_stop_the_worker(self):
+        def handler(update):
+            if update == 'bad':
+                raise ValueError('boom')
+
+        executor = UpdateExecutor(handler, workers=1, name='test-errors')
+        try:
+            with self.assertLogs('campaigns.update_executor', 'ERROR'):
+                executor.submit('user', 'bad')
+                executor.submit('user', 'good')
+                executor.join()
+        finally:
+            executor.shutdown()
+        self.assertEqual((executor.failed, executor.processed), (1, 1))
+
+
+class WebhookTests(TransactionTestCase):
+    """Вебхук -> исполнитель -> обработчики стадий, с клиентом Bot API без сети"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(
+            name='Webhook', slug='webhook', status='active', bot_is_running=True,
+            first_message='Привет!', channel_usernames='@channel',
+        )
+        self.bot_api = use_fake_bot_api(self)
+
+    def post(self, update, path='/campaigns/telegram/'):
+        return self.client.post(path, json.dumps(update), content_type='application/json')
+
+    def test_start_update_is_processed_after_the_ack(self):
+        response = self.post(message_update(501, '/start'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'ok': True})
+        get_update_executor().join()
+
+        participant = Participant.objects.get(campaign=self.campaign, telegram_id=501)
+        self.assertEqual(participant.registration_stage, 'name')
+        # Приветствие и запрос имени склеены в одно сообщение
+        self.assertEqual(len(self.bot_api.texts()), 1)
+        self.assertTrue(self.bot_api.texts()[0].startswith('Привет!'))
+
+    def test_registration_steps_run_in_order(self):
+        for text in ('/start', 'Анна', '+79990000000'):
+            self.assertEqual(self.post(message_update(502, text)).status_code, 200)
+        get_update_executor().join()
+
+        participant = Participant.objects.get(campaign=self.campaign, telegram_id=502)
+        self.assertEqual((participant.first_name, participant.phone), ('Анна', '+79990000000'))
+        self.assertEqual(participant.registration_stage, 'subscription')
+
+    def test_redelivered_update_is_processed_once(self):
+        update = message_update(505, '/start')
+        # Telegram повторяет апдейт, если не дождался ответа
+        self.assertEqual(self.post(update).status_code, 200)
+        self.assertEqual(self.post(update).status_code, 200)
+        get_update_executor().join()
+
+        self.assertEqual(Participant.objects.filter(telegram_id=505).count(), 1)
+        self.assertEqual(len(self.bot_api.texts()), 1)
+
+    def test_webhook_answers_before_the_handler_finishes(self):
+        release = threading.Event()
+        executor = UpdateExecutor(lambda update: release.wait(5), workers=1, queue_size=1, name='test-ack')
+        self.addCleanup(executor.shutdown)
+        self.addCleanup(release.set)
+        with mock.patch('campaigns.telegram_handlers.get_update_executor', return_value=executor):
+            started = time.monotonic()
+            self.assertEqual(self.post(message_update(503, '/start')).status_code, 200)
+            self.assertLess(time.monotonic() - started, 1)
+
+    def test_full_queue_asks_telegram_to_retry(self):
+        release = threading.Event()
+        executor = UpdateExecutor(lambda update: release.wait(5), workers=1, queue_size=1, name='test-busy')
+        self.addCleanup(executor.shutdown)
+        self.addCleanup(release.set)
+        with mock.patch('campaigns.telegram_handlers.get_update_executor', return_value=executor):
+            # Первый апдейт занимает поток, второй - единственное место в очереди
+            self.assertEqual(self.post(message_update(504, '/start')).status_code, 200)
+            deadline = time.monotonic() + 2
+            while executor.pending() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self.post(message_update(504, 'Анна')).status_code, 200)
+            response = self.post(message_update(504, '+79990000000'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_invalid_body_is_rejected(self):
+        response = self.client.post('/campaigns/telegram/', 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/campaigns/telegram/').status_code, 405)
@@ -0,0 +1,158 @@
+# campaigns/update_capture.py
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.ndjson.gz'
+PART_SUFFIX = '.part'
+
+
+class UpdateCapture:
+    """
+    Запись входящих апдейтов в сжатые NDJSON-сегменты для последующего replay.
+
+    record() только кладет апдейт в очередь - сериализация и gzip идут в
+    фоновом потоке, вне обработки запроса. При переполнении очереди апдейт
+    не записывается (счетчик dropped), вебхук не ждет диск.
+
+    Строка сегмента: {"ts": время приема, "bot": ключ бота, "update": апдейт}.
+    Сегмент пишется в файл *.ndjson.gz.part и переименовывается в
+    *.ndjson.gz, когда закрыт: по размеру (segment_bytes несжатых данных)
+    или по возрасту (segment_seconds). У каждого процесса свои сегменты.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 2 ** 20, segment_seconds=3600, queue_size=10000):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._writer_pid = None
+        self._file = None
+        self._path = None
+        self._segment_started = 0.0
+        self._segment_size = 0
+        self._segments = 0
+
+        self.captured = 0
+        self.dropped = 0
+
+    def record(self, update, bot_key):
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((time.time(), bot_key, update))
+        except queue.Full:
+            self.dropped += 1
+
+    # 🔹 Фоновая запись
+
+    def _ensure_writer(self):
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            # После fork файл родителя не наш - начинаем свой сегмент
+            self._file = None
+            threading.Thread(target=self._write_loop, name='update-capture', daemon=True).start()
+            self._writer_pid = os.getpid()
+
+    def _write_loop(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                item = None
+            try:
+                with self._lock:
+                    if item is not None:
+                        self._write(*item)
+                    if self._file is not None and time.time() - self._segment_started >= self.segment_seconds:
+                        self._close_segment()
+            except Exception as e:
+                logger.exception("Error writing update capture: %s", e)
+            finally:
+                if item is not None:
+                    self._queue.task_done()
+
+    def _write(self, ts, bot_key, update):
+        line = json.dumps({'ts': ts, 'bot': bot_key, 'update': update}, ensure_ascii=False, separators=(',', ':'))
+        data = (line + '\n').encode('utf-8')
+        if self._file is None:
+            self._open_segment()
+        self._file.write(data)
+        self._segment_size += len(data)
+        self.captured += 1
+        if self._segment_size >= self.segment_bytes:
+            self._close_segment()
+
+    def _open_segment(self):
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        self._segments += 1
+        self._path = os.path.join(
+            self.directory, f'updates-{stamp}-{os.getpid()}-{self._segments:06d}{SEGMENT_SUFFIX}'
+        )
+        self._file = gzip.open(self._path + PART_SUFFIX, 'wb', compresslevel=6)
+        self._segment_started = time.time()
+        self._segment_size = 0
+
+    def _close_segment(self):
+        self._file.close()
+        os.replace(self._path + PART_SUFFIX, self._path)
+        logger.info("Update capture segment closed: %s", self._path)
+        self._file = None
+
+    def close(self):
+        """Дописывает очередь и закрывает текущий сегмент (при выходе процесса)"""
+        if self._writer_pid != os.getpid():
+            return
+        # Ждем фоновый поток: апдейт, который он уже забрал из очереди, иначе
+        # попал бы в новый сегмент после закрытия текущего
+        self._queue.join()
+        with self._lock:
+            if self._file is not None:
+                self._close_segment()
+
+
+def read_segment(path):
+    """Записи сегмента по порядку; оборванный хвост незакрытого сегмента пропускается"""
+    with gzip.open(path, 'rt', encoding='utf-8') as fileobj:
+        try:
+            for line in fileobj:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, ValueError) as e:
+            logger.warning("Segment %s is truncated: %s", path, e)
+
+
+def segment_paths(paths):
+    """Файлы сегментов: каталоги раскрываются в их сегменты, по имени (то есть по времени)"""
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            result.extend(sorted(glob.glob(os.path.join(path, f'*{SEGMENT_SUFFIX}'))))
+        else:
+            result.append(path)
+    return result
+
+
+update_capture = None
+if getattr(settings, 'UPDATE_CAPTURE_DIR', ''):
+    update_capture = UpdateCapture(
+        settings.UPDATE_CAPTURE_DIR,
+        segment_bytes=getattr(settings, 'UPDATE_CAPTURE_SEGMENT_MB', 64) * 2 ** 20,
+        segment_seconds=getattr(settings, 'UPDATE_CAPTURE_SEGMENT_SECONDS', 3600),
+        queue_size=getattr(settings, 'UPDATE_CAPTURE_QUEUE_SIZE', 10000),
+    )
+    atexit.register(update_capture.close)
@@ -0,0 +1,146 @@
+# campaigns/update_executor.py
+import atexit
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .bot_api import DEFAULT_BOT_KEY
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateExecutor:
+    """
+    Ограниченный пул потоков для обработки апдейтов Telegram.
+
+    Апдейты одного пользователя всегда попадают в одну и ту же очередь
+    (шард по ключу), поэтому обрабатываются строго по порядку. Очереди
+    ограничены: если шард переполнен, submit() возвращает False и вебхук
+    должен отказать Telegram (тот повторит доставку позже).
+    """
+
+    def __init__(self, handler, workers=8, queue_size=1000, name='updates'):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue_size = max(self.workers, queue_size)
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._queues = []
+        self._threads = []
+        self._pid = None
+
+        self.submitted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        """Ленивый запуск потоков (и повторный запуск после fork воркера gunicorn)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            per_shard = max(1, self.queue_size // self.workers)
+            self._queues = [queue.Queue(maxsize=per_shard) for _ in range(self.workers)]
+            self._threads = []
+            for index, shard in enumerate(self._queues):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(shard,),
+                    name=f'{self.name}-{index}',
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def submit(self, key, update, timeout=0):
+        """
+        Ставит апдейт в очередь. False - очередь переполнена (backpressure).
+        timeout - сколько секунд ждать места в очереди (None - без ограничения)
+        """
+        self._ensure_started()
+        shard = self._queues[hash(key) % self.workers]
+        try:
+            if timeout == 0:
+                shard.put_nowait(update)
+            else:
+                shard.put(update, timeout=timeout)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def _worker(self, shard):
+        while True:
+            update = shard.get()
+            try:
+                if update is None:
+                    return
+                self.handler(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception("Error in update worker: %s", e)
+            finally:
+                shard.task_done()
+                # Потоки живут долго - не держим протухшие соединения с БД
+                close_old_connections()
+
+    def join(self):
+        """Ждет, пока все поставленные апдейты будут обработаны"""
+        for shard in self._queues:
+            shard.join()
+
+    def pending(self):
+        """Количество апдейтов, ожидающих обработки"""
+        return sum(shard.qsize() for shard in self._queues)
+
+    def shutdown(self, timeout=5.0):
+        """Дожидается обработки очередей и останавливает потоки"""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        for shard in self._queues:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                shard.put(None, timeout=remaining)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._pid = None
+
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def get_update_executor(bot_key=None):
+    """Исполнитель апдейтов бота: у каждого бота свои потоки и своя очередь"""
+    bot_key = bot_key or DEFAULT_BOT_KEY
+    executor = _executors.get(bot_key)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(bot_key)
+            if executor is None:
+                from .telegram_handlers import process_update
+                executor = _executors[bot_key] = UpdateExecutor(
+                    functools.partial(process_update, bot_key=bot_key),
+                    workers=getattr(settings, 'UPDATE_WORKERS', 8),
+                    queue_size=getattr(settings, 'UPDATE_QUEUE_SIZE', 1000),
+                    name=f'updates-{bot_key}',
+                )
+                atexit.register(executor.shutdown)
+    return executor
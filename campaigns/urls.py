@@ -4,5 +4,7 @@ from . import views
 
 urlpatterns = [
     path('telegram/', telegram_handlers.telegram_webhook, name='telegram_webhook'),
+    path('telegram/<slug:bot_key>/', telegram_handlers.telegram_webhook, name='telegram_bot_webhook'),
     path('test/', views.test_page, name='test_page'),
+    path('metrics/', views.metrics, name='metrics'),
 ]